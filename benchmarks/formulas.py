@@ -0,0 +1,62 @@
+"""
+Formula evaluation time, compiled against tree-walking
+
+Every formula is evaluated `--repeat` times by `evaluator.evaluate` and by
+the function of `evaluator.compile_formula`. Compile time is printed too.
+
+    python benchmarks/formulas.py [--repeat N]
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Callable, Dict
+
+from pytopas.ast import FormulaNode
+from pytopas.evaluator import compile_formula, evaluate
+
+FORMULAS = {
+    "equation": "a * b + c",
+    "lattice": "Sqrt(a^2 + b^2 - 2 * a * b * Cos(c * Deg))",
+    "branch": "If(a < b, Ln(b - a), Exp(a - b)) * c",
+    "long": " + ".join(f"a * {x} - b / {x + 1}" for x in range(50)),
+}
+
+
+def best(run: Callable[[], Any], repeat: int) -> float:
+    "Best time of the batch of `repeat` runs, per run"
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        times.append(time.perf_counter() - start)
+    return min(times) / repeat
+
+
+def main():
+    "Print evaluation times"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--repeat", type=int, default=10_000)
+    args = arg_parser.parse_args()
+    values: Dict[str, float] = {x: random.uniform(1, 2) for x in "abc"}
+
+    print(
+        f"{'formula':<10} {'tree us':>8} {'compiled us':>12}"
+        f" {'speedup':>8} {'compile us':>11}"
+    )
+    for name, src in FORMULAS.items():
+        formula = FormulaNode.parse(src, parse_all=True)
+        compiled = compile_formula(formula)
+        assert compiled(values) == evaluate(formula, values)
+        tree = best(lambda: evaluate(formula, values), args.repeat)
+        fast = best(lambda: compiled(values), args.repeat)
+        build = best(lambda: compile_formula(formula), max(args.repeat // 100, 1))
+        print(
+            f"{name:<10} {tree * 1e6:>8.2f} {fast * 1e6:>12.2f}"
+            f" {tree / fast:>8.1f} {build * 1e6:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
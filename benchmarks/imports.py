@@ -0,0 +1,59 @@
+"""
+Import time of the package in fresh interpreters
+
+`import pytopas`, `import pytopas` with the first parse, which imports
+pyparsing and builds the grammar, and the reconstruction of a tree are timed
+in a new interpreter each, the best of `--repeat` runs is printed. The exit
+status is 1 if the import takes longer than `--max-seconds`.
+
+    python benchmarks/imports.py [--repeat N] [--max-seconds S]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import pytopas
+imported = time.perf_counter()
+pytopas.TOPASParser.reconstruct(["topas", ["text", "a"]])
+reconstructed = time.perf_counter()
+pytopas.TOPASParser.parse("prm a 1")
+parsed = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "reconstruct": reconstructed - start,
+    "parse": parsed - start,
+}))
+"""
+
+
+def run() -> dict:
+    "Seconds from the start of the import in a fresh interpreter"
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT], capture_output=True, check=True, text=True
+    ).stdout
+    return json.loads(out)
+
+
+def main():
+    "Print the best times"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--max-seconds", type=float, default=0.5)
+    args = arg_parser.parse_args()
+
+    runs = [run() for _ in range(args.repeat)]
+    best = {x: min(y[x] for y in runs) for x in runs[0]}
+    for name, seconds in best.items():
+        print(f"{name:<12} {seconds * 1e3:>8.1f} ms")
+    if best["import"] > args.max_seconds:
+        print(f"import is over {args.max_seconds} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Memory taken by syntax tree nodes of the example corpus
+
+Every node of the parsed examples is copied twice while tracemalloc counts
+allocated bytes: as is, and as an instance of a plain class with the same
+attributes in the instance `__dict__`, the way nodes were stored before
+`__slots__`. Children and values are shared, so only the node objects count.
+
+    python benchmarks/memory.py [FILE ...]
+"""
+
+import argparse
+import copy
+import dataclasses
+import sys
+import tracemalloc
+import warnings
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+from pytopas.ast import BaseNode, RootNode
+
+EXAMPLES = Path(__file__).parent.parent / "examples"
+
+
+def walk(node: Any) -> Iterator[BaseNode]:
+    "All nodes of the tree"
+    stack = [node]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            stack += value
+        elif isinstance(value, BaseNode):
+            yield value
+            stack += [getattr(value, x.name) for x in dataclasses.fields(value)]
+
+
+_plain_classes: Dict[type, type] = {}
+
+
+def as_plain(node: BaseNode) -> Any:
+    "Same attributes in a `__dict__`"
+    obj = _plain_classes[type(node)]()
+    for item in dataclasses.fields(node):
+        setattr(obj, item.name, getattr(node, item.name))
+    return obj
+
+
+def allocated(make: Callable[[BaseNode], Any], nodes: List[BaseNode]) -> int:
+    "Bytes allocated by copies of nodes"
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    copies = [make(x) for x in nodes]
+    size = tracemalloc.get_traced_memory()[0] - start - sys.getsizeof(copies)
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    "Print bytes per node"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("files", nargs="*", type=Path)
+    args = arg_parser.parse_args()
+    files = args.files or sorted(EXAMPLES.iterdir())
+
+    print(f"{'file':<56} {'nodes':>7} {'dict':>6} {'slots':>6}")
+    total = [0, 0, 0]
+    for file_path in files:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tree = RootNode.parse(file_path.read_text())
+        nodes = list(walk(tree))
+        for node in nodes:
+            _plain_classes.setdefault(type(node), type(type(node).__name__, (), {}))
+        sizes = [allocated(as_plain, nodes), allocated(copy.copy, nodes)]
+        print(
+            f"{file_path.name[:56]:<56} {len(nodes):>7}",
+            *(f"{x / len(nodes):>6.0f}" for x in sizes),
+        )
+        total = [x + y for x, y in zip(total, [len(nodes), *sizes])]
+    print(f"{'total':<56} {total[0]:>7}", *(f"{x / total[0]:>6.0f}" for x in total[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Formula optimization on generated sites, memory and evaluation time
+
+A tree of `--sites` generated sites with constant and repeated
+subexpressions is optimized by `optimize.optimize`. Traced memory of the tree
+and the time to evaluate all its equations are printed before and after.
+
+    python benchmarks/optimize.py [--sites N]
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from pytopas import TOPASParser, evaluator, optimize
+from pytopas.ast import RootNode
+from pytopas.dependencies import DependencyGraph
+
+TEMPLATE = """prm occ_N = 1/4;
+prm zero_N = 0;
+prm x_N = (a + 1/3) * Cos(b * Pi / 180) + zero_N;
+prm y_N = (a + 1/3) * Sin(b * Pi / 180) + x_N * 2 / 3;
+"""
+
+
+def build(sites: int) -> RootNode:
+    "Tree of the sites, unserialized from the parsed template"
+    text = json.dumps(TOPASParser.parse(TEMPLATE)[1:])
+    statements = []
+    for idx in range(sites):
+        statements += json.loads(text.replace("_N", f"_{idx}"))
+    return RootNode.unserialize(["topas", *statements])
+
+
+def run(tree: RootNode):
+    "Evaluate the equations tree-walking and compiled, times in seconds"
+    equations = DependencyGraph(tree).order()
+    values = {"a": 0.5, "b": 30.0}
+    start = time.perf_counter()
+    for equation in equations:
+        values[equation.name] = evaluator.evaluate(equation.formula, values)
+    walk = time.perf_counter() - start
+    start = time.perf_counter()
+    for equation in equations:
+        values[equation.name] = evaluator.compile_formula(equation.formula)(values)
+    compiled = time.perf_counter() - start
+    return walk, compiled
+
+
+def main():
+    "Print memory and times"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--sites", type=int, default=5_000)
+    args = arg_parser.parse_args()
+
+    tracemalloc.start()
+    gc.collect()
+    base = tracemalloc.get_traced_memory()[0]
+    tree = build(args.sites)
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0] - base
+    optimize.optimize(tree)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del tree
+
+    tree = build(args.sites)
+    src = tree.unparse()
+    walk, compiled = run(tree)
+    start = time.perf_counter()
+    optimize.optimize(tree)
+    took = time.perf_counter() - start
+    assert tree.unparse() == src
+    fast_walk, fast_compiled = run(tree)
+
+    print(f"{args.sites} sites, optimized in {took * 1e3:.1f} ms")
+    print(f"{'':<14} {'before':>10} {'after':>10}")
+    print(f"{'memory MiB':<14} {before / 2**20:>10.2f} {after / 2**20:>10.2f}")
+    print(f"{'evaluate ms':<14} {walk * 1e3:>10.1f} {fast_walk * 1e3:>10.1f}")
+    print(f"{'compiled ms':<14} {compiled * 1e3:>10.1f} {fast_compiled * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
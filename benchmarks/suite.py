@@ -0,0 +1,168 @@
+"""
+Benchmark suite over the example corpus with regression tracking
+
+Every example and synthetic inputs made of the whole corpus repeated
+`--scale` times are parsed, serialized, unserialized and unparsed. The best
+time of `--repeat` runs is taken for every phase. Peak memory of the whole
+pipeline is measured by tracemalloc in a separate run, so that tracing doesn't
+slow the timed runs down.
+
+Results are saved as JSON with `--save`. With `--baseline` they are compared
+to saved results: a phase time or peak memory over the baseline by more than
+`--threshold` is a regression and the exit status is 1.
+
+    python benchmarks/suite.py [--repeat N] [--scale N ...] [--save FILE]
+        [--baseline FILE] [--threshold R] [FILE ...]
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from pytopas import __VERSION__
+from pytopas.ast import RootNode
+
+EXAMPLES = Path(__file__).parent.parent / "examples"
+PHASES = ("parse", "serialize", "unserialize", "unparse")
+
+
+def pipeline(text: str, state: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+    "Phase runners, each works on the result of the previous one in `state`"
+
+    def parse():
+        state["tree"] = RootNode.parse(text)
+
+    def serialize():
+        state["data"] = state["tree"].serialize()
+
+    def unserialize():
+        RootNode.unserialize(state["data"])
+
+    def unparse():
+        state["tree"].unparse()
+
+    return dict(zip(PHASES, (parse, serialize, unserialize, unparse)))
+
+
+def peak_memory(text: str) -> int:
+    "Peak bytes allocated by a run of all phases"
+    tracemalloc.start()
+    try:
+        for run in pipeline(text, {}).values():
+            run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(text: str, repeat: int) -> Dict[str, Any]:
+    "Phase timings, throughput and peak memory of the source"
+    best = dict.fromkeys(PHASES, float("inf"))
+    state: Dict[str, Any] = {}
+    for _ in range(repeat):
+        for phase, run in pipeline(text, state).items():
+            start = time.perf_counter()
+            run()
+            best[phase] = min(best[phase], time.perf_counter() - start)
+    size = len(text.encode("utf-8"))
+    tree = state["tree"]
+    statements = len(tree.statements) if isinstance(tree, RootNode) else 1
+    total = sum(best.values())
+    return {
+        "bytes": size,
+        "statements": statements,
+        "seconds": best,
+        "bytes_per_second": size / total,
+        "statements_per_second": statements / total,
+        "peak_memory": peak_memory(text),
+    }
+
+
+def inputs(files: List[Path], scales: List[int]) -> List[Tuple[str, str]]:
+    "Named sources: the files and the corpus repeated `scales` times"
+    sources = [(x.name, x.read_text()) for x in files]
+    corpus = "\n".join(x[1] for x in sources)
+    return sources + [(f"corpus x{x}", "\n".join([corpus] * x)) for x in scales]
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    "Regressions of the results against the baseline"
+    regressions = []
+    for name, result in results["inputs"].items():
+        base = baseline["inputs"].get(name)
+        if base is None:
+            continue
+        metrics = [
+            (f"{x} seconds", result["seconds"][x], base["seconds"][x])
+            for x in PHASES
+        ]
+        metrics.append(("peak memory", result["peak_memory"], base["peak_memory"]))
+        for metric, value, base_value in metrics:
+            if base_value and value > base_value * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {value:.6g} > {base_value:.6g}"
+                    f" (+{(value / base_value - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    "Print table of the results"
+    print(
+        f"{'input':<40} {'KiB':>7} {'stmts':>6}",
+        *(f"{x[:7] + ' ms':>10}" for x in PHASES),
+        f"{'KiB/s':>8} {'stmts/s':>8} {'peak MiB':>8}",
+    )
+    for name, result in results["inputs"].items():
+        print(
+            f"{name[:40]:<40} {result['bytes'] / 1024:>7.1f} {result['statements']:>6}",
+            *(f"{result['seconds'][x] * 1e3:>10.2f}" for x in PHASES),
+            f"{result['bytes_per_second'] / 1024:>8.0f}",
+            f"{result['statements_per_second']:>8.0f}",
+            f"{result['peak_memory'] / 1024**2:>8.1f}",
+        )
+
+
+def main():
+    "Run the suite"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--scale", type=int, nargs="*", default=[2])
+    arg_parser.add_argument("--save", type=Path, help="Save results to the file")
+    arg_parser.add_argument("--baseline", type=Path, help="Compare to saved results")
+    arg_parser.add_argument("--threshold", type=float, default=0.1)
+    arg_parser.add_argument("files", nargs="*", type=Path)
+    args = arg_parser.parse_args()
+    files = args.files or sorted(EXAMPLES.iterdir())
+
+    results = {
+        "version": __VERSION__,
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "inputs": {
+            name: measure(text, args.repeat)
+            for name, text in inputs(files, args.scale)
+        },
+    }
+    print_results(results)
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
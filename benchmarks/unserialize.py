@@ -0,0 +1,66 @@
+"""
+Unserialize time of the example corpus
+
+Every example is parsed and serialized once, then the serialized tree is
+unserialized `--repeat` times. The best time per file and per node is printed.
+
+    python benchmarks/unserialize.py [--repeat N] [FILE ...]
+"""
+
+import argparse
+import time
+import warnings
+from pathlib import Path
+
+from pytopas.ast import RootNode
+
+EXAMPLES = Path(__file__).parent.parent / "examples"
+
+
+def count_nodes(data) -> int:
+    "Serialized nodes of the tree, lists tagged with a type name"
+    stack = [data]
+    count = 0
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack += value.values()
+        elif isinstance(value, list):
+            count += bool(value) and isinstance(value[0], str)
+            stack += value
+    return count
+
+
+def main():
+    "Print unserialize time"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("files", nargs="*", type=Path)
+    args = arg_parser.parse_args()
+    files = args.files or sorted(EXAMPLES.iterdir())
+
+    print(f"{'file':<56} {'nodes':>7} {'ms':>8} {'us/node':>8}")
+    total = [0, 0.0]
+    for file_path in files:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            data = RootNode.parse(file_path.read_text()).serialize()
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            RootNode.unserialize(data)
+            best = min(best, time.perf_counter() - start)
+        nodes = count_nodes(data)
+        print(
+            f"{file_path.name[:56]:<56} {nodes:>7} {best * 1e3:>8.2f}"
+            f" {best * 1e6 / nodes:>8.2f}"
+        )
+        total = [total[0] + nodes, total[1] + best]
+    print(
+        f"{'total':<56} {total[0]:>7} {total[1] * 1e3:>8.2f}"
+        f" {total[1] * 1e6 / total[0]:>8.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
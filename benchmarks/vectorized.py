@@ -0,0 +1,70 @@
+"""
+Equations evaluated over samples, NumPy against a loop of compiled formulas
+
+The equations of the example input and of generated sites are evaluated for
+`--samples` random parameter vectors in one NumPy pass and sample by sample by
+the formulas of `evaluator.compile_formula`.
+
+    python benchmarks/vectorized.py [--samples N]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pytopas.ast import ExistingPrmNode, RootNode
+from pytopas.dependencies import DependencyGraph
+from pytopas.evaluator import compile_formula
+from pytopas.vectorized import compile_equations
+
+EXAMPLE = Path(__file__).parent.parent / "examples" / "diffpy_example.INP"
+# a lattice parameter with a branch and coordinates depending on it
+EXTRA = """
+prm lp = Sqrt(a^2 + b^2 - 2 * a * b * Cos(c * Deg));
+prm branch = If(lp < a, Ln(a - lp + 1), Exp(lp - a)) * c;
+""" + "".join(
+    f"site Zn{x} x = {x} / 50 + branch / lp; y = Mod(x_{x} + 1 / 4, 1); : 1\n"
+    for x in range(50)
+)
+
+
+def main():
+    "Print evaluation times"
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--samples", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    tree = RootNode.parse(EXAMPLE.read_text() + EXTRA)
+    equations = DependencyGraph(tree).order()
+    equations = [x for x in equations if not isinstance(x.node, ExistingPrmNode)]
+    start = time.perf_counter()
+    group = compile_equations(equations)
+    build = time.perf_counter() - start
+    rng = np.random.default_rng(0)
+    samples = {x: rng.uniform(1, 2, args.samples) for x in group.names}
+
+    start = time.perf_counter()
+    group(samples)
+    fast = time.perf_counter() - start
+
+    formulas = [(x.name, compile_formula(x.formula)) for x in equations]
+    rows = [{x: float(y[idx]) for x, y in samples.items()} for idx in range(1000)]
+    start = time.perf_counter()
+    for values in rows:
+        for name, formula in formulas:
+            value = formula(values)
+            if name is not None:
+                values[name] = value
+    loop = (time.perf_counter() - start) / len(rows) * args.samples
+
+    print(f"{len(equations)} equations, {args.samples} samples")
+    print(f"compile     {build * 1e3:10.2f} ms")
+    print(f"numpy       {fast * 1e3:10.2f} ms")
+    print(f"loop        {loop * 1e3:10.2f} ms (estimated from 1000 samples)")
+    print(f"speedup     {loop / fast:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
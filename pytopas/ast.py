@@ -4,18 +4,32 @@
 from __future__ import annotations
 
 import json
+import re
 import sys
-import warnings
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
-from decimal import Decimal
+from dataclasses import MISSING, dataclass, field, fields
+from enum import Enum
 from functools import reduce
-from typing import Any, Dict, List, TypeVar, Union, cast
-
-import pyparsing as pp
-from pyparsing.results import ParseResults
-
-from .exc import ParseWarning, ReconstructException
+from types import GeneratorType
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from . import diagnostics, numeric, stats
+from .exc import ReconstructException
+from .numeric import NumberArray, Numeric
 
 if sys.version_info < (3, 9):
     from typing import Sequence  # pragma: no cover
@@ -28,13 +42,83 @@ if sys.version_info < (3, 11):
 else:
     from typing import Self  # pragma: no cover
 
+if TYPE_CHECKING:
+    import pyparsing as pp  # pragma: no cover
+    from pyparsing.results import ParseResults  # pragma: no cover
+
 
 BaseNodeT = TypeVar("BaseNodeT", bound="BaseNode")
+T = TypeVar("T")
+Steps = Generator[Any, Any, T]
+
+# type tag to class tables by the class and its kinds classmethod name
+_dispatch_tables: Dict[Tuple[type, str], Dict[str, Type[BaseNode]]] = {}
+# methods `run_steps` calls by the method name and the class
+_steps_methods: Dict[str, Dict[type, Callable[[Any], Any]]] = {}
+# names of the fields of node classes
+_field_names: Dict[type, Tuple[str, ...]] = {}
+
+
+def slotted_dataclass(cls: Type[T]) -> Type[T]:
+    """
+    Dataclass with `__slots__` instead of the instance `__dict__`
+
+    Same as `dataclass(slots=True)` of python 3.10, but keeps `super()` working.
+    Fields without `init` and default are class constants, they get no slots.
+    """
+    cls = dataclass(cls)
+    inherited = {x for base in cls.__mro__[1:] for x in getattr(base, "__slots__", ())}
+    names = [
+        x.name
+        for x in fields(cls)  # type: ignore[arg-type]
+        if x.init or x.default is not MISSING or x.default_factory is not MISSING
+    ]
+    cls_dict = dict(cls.__dict__)
+    cls_dict["__slots__"] = tuple(x for x in names if x not in inherited)
+    for name in names:
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    new_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    new_cls.__qualname__ = cls.__qualname__
+    # zero argument `super()` refers to the class in the `__class__` cell
+    for value in cls_dict.values():
+        func = getattr(value, "__func__", value)
+        for cell in getattr(func, "__closure__", None) or ():
+            if cell.cell_contents is cls:
+                cell.cell_contents = new_cls
+    return cast(Type[T], new_cls)
 
 
 class DepsMixin:
     "Dependencies mixin"
     # pylint: disable=too-many-public-methods
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # a subclass may override `*_cls` hooks of the tabled classes
+        _dispatch_tables.clear()
+        _steps_methods.clear()
+
+    @classmethod
+    def dispatch_table(cls, kinds_name: str) -> Dict[str, Type[BaseNode]]:
+        "Type tag to class table of the `kinds_name` classmethod classes"
+        key = (cls, kinds_name)
+        table = _dispatch_tables.get(key)
+        if table is None:
+            table = {}
+            for kind in getattr(cls, kinds_name)():
+                # the first class wins, same as the linear scan
+                table.setdefault(kind.type, kind)
+            _dispatch_tables[key] = table
+        return table
+
+    @staticmethod
+    def clear_dispatch_tables():
+        "Forget type tag tables and steps methods, call after patching classes"
+        _dispatch_tables.clear()
+        _steps_methods.clear()
 
     @staticmethod
     def get_grammar():
@@ -131,6 +215,17 @@ class DepsMixin:
             cls.formula_add_cls(),
         )
 
+    @classmethod
+    def formula_arith_op_levels(cls) -> tuple[tuple[type[FormulaArithOps], ...], ...]:
+        "Formula arithmetic operation classes by precedence, highest first"
+        return (
+            (cls.formula_unary_plus_cls(),),
+            (cls.formula_unary_minus_cls(),),
+            (cls.formula_exp_cls(),),
+            (cls.formula_mul_cls(), cls.formula_div_cls()),
+            (cls.formula_sub_cls(), cls.formula_add_cls()),
+        )
+
     @classmethod
     def formula_eq_cls(cls):
         "Formula == op class"
@@ -173,6 +268,32 @@ class DepsMixin:
             cls.formula_gt_cls(),
         )
 
+    @classmethod
+    def formula_comp_op_levels(cls) -> tuple[tuple[type[FormulaCompOps], ...], ...]:
+        "Formula compare operation classes by precedence, highest first"
+        return tuple((x,) for x in cls.formula_comp_op_clses())
+
+    @classmethod
+    def formula_unary_operand_clses(cls) -> tuple[type[BaseNode], ...]:
+        "Formula unary operation operand classes"
+        return (
+            cls.func_call_cls(),
+            cls.parameter_cls(),
+            *cls.formula_arith_op_clses(),
+            cls.text_cls(),
+        )
+
+    @classmethod
+    def formula_operand_clses(cls) -> tuple[type[BaseNode], ...]:
+        "Formula operation operand and formula value classes"
+        return (
+            cls.func_call_cls(),
+            cls.parameter_cls(),
+            *cls.formula_arith_op_clses(),
+            *cls.formula_comp_op_clses(),
+            cls.text_cls(),
+        )
+
     @classmethod
     def formula_cls(cls):
         "Formula class"
@@ -224,7 +345,7 @@ class DepsMixin:
         return RootNode  # pragma: no cover
 
 
-@dataclass
+@slotted_dataclass
 class BaseNode(ABC, DepsMixin):
     "Base node class"
     type = "base"
@@ -237,13 +358,26 @@ class BaseNode(ABC, DepsMixin):
     @classmethod
     def parse(cls, text, parse_all=False, print_dump=False) -> Self | TextNode | None:
         "Try to parse text with optional fallback"
+        # pyparsing is imported on the first parse only
+        # pylint: disable-next=import-outside-toplevel
+        import pyparsing as pp
+
+        from . import memo  # pylint: disable=import-outside-toplevel
+
+        parser = cls.get_parser()
         try:
-            result = cls.get_parser().parse_string(text, parse_all=parse_all)
+            with memo.parsing(), stats.pending() as fallbacks:
+                result = parser.parse_string(text, parse_all=parse_all)
+            if fallbacks is not None:
+                # offsets are of the string pyparsing parsed
+                src = text if parser.keepTabs else text.expandtabs()
+                nodes = iter_text_nodes(result.as_list())
+                fallbacks.settle(src, nodes, stacklevel=2)
             if print_dump:
                 print(result.dump())
             return result.pop() if len(result) else None  # type: ignore[assigment]
         except pp.ParseException as err:
-            warnings.warn(err.explain(), category=ParseWarning, stacklevel=3)
+            diagnostics.report(diagnostics.Diagnostic.from_exception(err), stacklevel=3)
             return cls.text_cls().parse(text)
 
     @abstractmethod
@@ -274,12 +408,117 @@ class BaseNode(ABC, DepsMixin):
             f"assert data[0] in [{','.join(x.type for x in kinds)}]", something
         )
 
+    @classmethod
+    def kind_of(cls, kinds_name: str, something: Any) -> Type[BaseNode]:
+        "One of the `kinds_name` classmethod classes by the type tag of data"
+        if not hasattr(something, "__len__") or len(something) < 1:
+            raise ReconstructException("assert len > 1", something)
+        table = cls.dispatch_table(kinds_name)
+        type_name = something[0]
+        kind = table.get(type_name) if isinstance(type_name, str) else None
+        if kind is None:
+            raise ReconstructException(
+                f"assert data[0] in [{','.join(table)}]", something
+            )
+        return kind
+
+    @classmethod
+    def unserialize_kind(cls, kinds_name: str, something: Any) -> BaseNode:
+        "Unserialize one of the `kinds_name` classmethod classes by its type tag"
+        return cls.kind_of(kinds_name, something).unserialize(something)
+
+
+def _steps_method(kind: type, name: str) -> Callable[[Any], Any]:
+    "Steps of the `name` method, or the method itself if the class overrides it"
+    method = getattr(kind, name)
+    base = getattr(StepsNode, name)
+    if getattr(method, "__func__", method) is getattr(base, "__func__", base):
+        return getattr(kind, f"{name}_steps")
+    return method
+
+
+def run_steps(steps: Steps[T], name: str) -> T:
+    """
+    Run steps of the recursive `name` method with an explicit stack
+
+    Steps yield child nodes, or node classes with data for `unserialize`,
+    and get the method results back. Classes which override the method
+    itself are left to it, steps of other classes are pushed on the stack.
+    """
+    methods = _steps_methods.setdefault(name, {})
+    stack = [steps]
+    value = None
+    while stack:
+        try:
+            item = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            value = stop.value
+            continue
+        if type(item) is tuple:
+            kind, arg = item
+        else:
+            kind, arg = type(item), item
+        method = methods.get(kind)
+        if method is None:
+            method = methods[kind] = _steps_method(kind, name)
+        value = method(arg)
+        if type(value) is GeneratorType:
+            stack.append(value)
+            value = None
+    return value
+
+
+def iter_text_nodes(value: Any) -> Iterator[TextNode]:
+    "Text nodes of a node or a list of them, any depth"
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            stack += value
+        elif isinstance(value, TextNode):
+            yield value
+        elif isinstance(value, BaseNode):
+            kind = type(value)
+            names = _field_names.get(kind)
+            if names is None:
+                names = _field_names[kind] = tuple(x.name for x in fields(value))
+            stack += [getattr(value, x) for x in names]
+
 
 Trivial = Union[None, bool, int, float, str, Sequence["Trivial"], Dict[str, "Trivial"]]
 NodeSerialized = List[Trivial]
 
 
-@dataclass
+@slotted_dataclass
+class StepsNode(BaseNode):
+    "Node with child nodes, its methods run the steps with an explicit stack"
+
+    def unparse(self) -> str:
+        return run_steps(self.unparse_steps(), "unparse")
+
+    @abstractmethod
+    def unparse_steps(self) -> Steps[str]:
+        "`unparse` steps: yield child nodes and get their source code"
+
+    def serialize(self) -> NodeSerialized:
+        return run_steps(self.serialize_steps(), "serialize")
+
+    @abstractmethod
+    def serialize_steps(self) -> Steps[NodeSerialized]:
+        "`serialize` steps: yield child nodes and get their representation"
+
+    @classmethod
+    def unserialize(cls, data: List[Any]) -> Self:
+        return run_steps(cls.unserialize_steps(data), "unserialize")
+
+    @classmethod
+    @abstractmethod
+    def unserialize_steps(cls, data: List[Any]) -> Steps[Self]:  # noqa: B902
+        "`unserialize` steps: yield node classes with their data and get nodes"
+
+
+@slotted_dataclass
 class TextNode(BaseNode):
     "Last chance node"
     type = "text"
@@ -288,10 +527,10 @@ class TextNode(BaseNode):
     @classmethod
     def parse_action(cls, text: str, loc: int, toks: pp.ParseResults):
         "Parse action for the text parse element"
-        short_text = text[loc : 100 + loc]
-        warn_msg = f"TextNode: Can't parse text {short_text!r}"
-        warnings.warn(warn_msg, category=ParseWarning, stacklevel=3)
-        return cls(value=toks.as_list()[0])
+        value = toks[0]
+        node = cls(value=value)
+        stats.fallback(node, text, loc, loc + len(value), stacklevel=3)
+        return node
 
     @classmethod
     def get_parser(cls):
@@ -314,7 +553,7 @@ class TextNode(BaseNode):
         return cls(value=data[1])
 
 
-@dataclass
+@slotted_dataclass
 class LineBreakNode(BaseNode):
     "Line break"
     type = "lb"
@@ -343,7 +582,7 @@ class LineBreakNode(BaseNode):
         return cls()
 
 
-@dataclass
+@slotted_dataclass
 class ParameterNameNode(BaseNode):
     "Parameter name"
     type = "parameter_name"
@@ -375,15 +614,27 @@ class ParameterNameNode(BaseNode):
         return cls(name=data[1])
 
 
-@dataclass
+@slotted_dataclass
 class ParameterValueNode(BaseNode):
     "Parameter node"
     type = "parameter_value"
-    value: Decimal
-    esd: Decimal | None = None
+    value: Numeric
+    esd: Numeric | None = None
     backtick: bool = False
-    lim_min: Decimal | None = None
-    lim_max: Decimal | None = None
+    lim_min: Numeric | None = None
+    lim_max: Numeric | None = None
+
+    # `unparse` result, anything else goes to the parser
+    UNPARSED_RE = re.compile(
+        r"([+-]?(?:\d+\.\d*|\.\d+|\d+))(`)?(?:_([+-]?(?:\d+\.\d*|\.\d+|\d+)))?"
+        r"(?:_LIMIT_MIN_([+-]?(?:\d+\.\d*|\.\d+|\d+)))?"
+        r"(?:_LIMIT_MAX_([+-]?(?:\d+\.\d*|\.\d+|\d+)))?"
+    )
+
+    @staticmethod
+    def make_number(text: str) -> Numeric:
+        "Number of the source text, same as the `number` parse element makes"
+        return numeric.make(text) if "." in text else numeric.make_integer(text)
 
     @classmethod
     def parse_action(cls, toks: pp.ParseResults):
@@ -419,14 +670,24 @@ class ParameterValueNode(BaseNode):
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
         if not isinstance(data[1], str):
             raise ReconstructException("assert type(data[1]) == str", data)
-        return cls.parse(data[1])
+        match = cls.UNPARSED_RE.fullmatch(data[1])
+        if match is None:
+            return cls.parse(data[1])
+        value, backtick, esd, lim_min, lim_max = match.groups()
+        return cls(
+            value=cls.make_number(value),
+            esd=None if esd is None else cls.make_number(esd),
+            backtick=backtick is not None,
+            lim_min=None if lim_min is None else cls.make_number(lim_min),
+            lim_max=None if lim_max is None else cls.make_number(lim_max),
+        )
 
 
 ParameterEquationValue = Union["FormulaNode", TextNode]
 
 
-@dataclass
-class ParameterEquationNode(BaseNode):
+@slotted_dataclass
+class ParameterEquationNode(StepsNode):
     "Parameter equation like = a + 1; : 0"
     type = "prm_eq"
     formula: ParameterEquationValue
@@ -454,40 +715,36 @@ class ParameterEquationNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().parameter_equation
 
-    def unparse(self):
-        equation = f"= {self.formula.unparse()};"
-        return (
-            equation
-            if self.reporting is None
-            else f"{equation} : {str(self.reporting.unparse())}"
-        )
+    def unparse_steps(self):
+        equation = f"= {(yield self.formula)};"
+        if self.reporting is None:
+            return equation
+        return f"{equation} : {str((yield self.reporting))}"
 
-    def serialize(self) -> NodeSerialized:
-        reporting = [self.reporting.serialize()] if self.reporting is not None else []
-        return [self.type, self.formula.serialize(), *reporting]
+    def serialize_steps(self):
+        formula = yield self.formula
+        reporting = [(yield self.reporting)] if self.reporting is not None else []
+        return [self.type, formula, *reporting]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) < 2:
             raise ReconstructException("assert len >= 2", data)
         if data[0] != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        formula = cls.match_unserialize(cls.parameter_equation_value_clses(), data[1])
-        reporting = (
-            None
-            if len(data) < 3
-            else cls.match_unserialize(
-                cls.parameter_equation_reporting_clses(), data[2]
-            )
-        )
+        formula = yield cls.kind_of("parameter_equation_value_clses", data[1]), data[1]
+        reporting = None
+        if len(data) >= 3:
+            kind = cls.kind_of("parameter_equation_reporting_clses", data[2])
+            reporting = yield kind, data[2]
         return cls(formula, reporting)
 
 
 ParameterValue = Union[ParameterValueNode, ParameterEquationNode, TextNode]
 
 
-@dataclass
-class ParameterNode(BaseNode):
+@slotted_dataclass
+class ParameterNode(StepsNode):
     """
     [!|@] [name] [E]
       [min !E] [max !E] [del !E] [update !E]
@@ -558,7 +815,7 @@ class ParameterNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().parameter
 
-    def unparse(self):
+    def unparse_steps(self):
         strings = []
         if self.prm_to_be_fixed:
             strings.append("!")
@@ -567,33 +824,33 @@ class ParameterNode(BaseNode):
         for key in self.optional_keys:
             o_key = f"prm_{key}"
             val = getattr(self, o_key, None)
-            if isinstance(val, BaseNode):
+            if val is not None and isinstance(val, BaseNode):
                 if key in ["name", "value"]:
-                    strings.append(val.unparse())
+                    strings.append((yield val))
                 else:
-                    strings += [key, val.unparse()]
+                    strings += [key, (yield val)]
         if self.next:
-            strings.append(self.next.unparse())
+            strings.append((yield self.next))
         return " ".join(strings)
 
-    def serialize(self) -> NodeSerialized:
+    def serialize_steps(self):
         short = {}
         if self.prm_to_be_fixed:
             short["!"] = True
         if self.prm_to_be_refined:
             short["@"] = True
         if self.next:
-            short[">"] = self.next.serialize()
+            short[">"] = yield self.next
 
         prm_opt_keys = map(lambda x: f"prm_{x}", self.optional_keys)
         for d_key, s_key in zip(prm_opt_keys, self.short_keys):  # noqa: B905
             val = getattr(self, d_key, None)
-            if isinstance(val, BaseNode):
-                short[s_key] = val.serialize()
+            if val is not None and isinstance(val, BaseNode):
+                short[s_key] = yield val
         return [self.type, short]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) < 2:
             raise ReconstructException("assert len >= 2", data)
         if data[0] != cls.type:
@@ -611,32 +868,27 @@ class ParameterNode(BaseNode):
                 val = opts[s_key]
                 if o_key == "prm_name":
                     param.prm_name = cls.parameter_name_cls().unserialize(val)
-                elif o_key == "prm_value":
-                    param.prm_value = cls.match_unserialize(
-                        cls.parameter_value_clses(), val
-                    )
                 else:
-                    setattr(
-                        param,
-                        o_key,
-                        cls.match_unserialize(cls.parameter_value_clses(), val),
-                    )
+                    kind = cls.kind_of("parameter_value_clses", val)
+                    setattr(param, o_key, (yield kind, val))
         if opts.get("!") is True:
             param.prm_to_be_fixed = True
         if opts.get("@") is True:
             param.prm_to_be_refined = True
         if opts.get(">") is not None:
-            param.next = cls.unserialize(opts[">"])
+            param.next = yield cls, opts[">"]
 
         return param
 
 
-@dataclass
+@slotted_dataclass
 class PrmNode(ParameterNode):
     "prm E [min !E] [max !E] [del !E] [update !E] [stop_when !E] [val_on_continue !E]"
     # pylint: disable=too-many-instance-attributes
+    # pylint doesn't know `slotted_dataclass` makes a dataclass of `field()`s
+    # pylint: disable=invalid-field-call
     type = "prm"
-    prm_value: ParameterValue
+    prm_value: ParameterValue = None  # type: ignore[assignment]
     prm_to_be_fixed: bool = False
     prm_to_be_refined: bool = field(default_factory=lambda: False, init=False)
     prm_name: ParameterNameNode | None = None
@@ -672,26 +924,28 @@ class PrmNode(ParameterNode):
     def get_parser(cls):
         return cls.get_grammar().prm
 
-    def unparse(self):
-        return f"prm {super().unparse()}"
+    def unparse_steps(self):
+        return f"prm {(yield from super().unparse_steps())}"
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, *super().serialize()[1:]]
+    def serialize_steps(self):
+        return [self.type, *(yield from super().serialize_steps())[1:]]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) < 2:
             raise ReconstructException("assert len >= 2", data)
         if data[0] != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
         p_type = cls.parameter_cls().type
-        param = cls.parameter_cls().unserialize([p_type, data[1]])
+        param = yield cls.parameter_cls(), [p_type, data[1]]
         return cls.from_parameter(param)
 
 
-@dataclass
-class FunctionCallNode(BaseNode):
+@slotted_dataclass
+class FunctionCallNode(StepsNode):
     "Function call node like `sin(a)`"
+    # pylint doesn't know `slotted_dataclass` makes a dataclass of `field()`s
+    # pylint: disable=invalid-field-call
     type = "func_call"
     name: str
     args: list[FormulaNode | str | None | TextNode] = field(default_factory=list)
@@ -716,61 +970,90 @@ class FunctionCallNode(BaseNode):
     @classmethod
     def unparse_args(cls, args: list[FormulaNode | str | None | TextNode]):
         "Reconstruct args"
+        return run_steps(cls.unparse_args_steps(args), "unparse")
+
+    @classmethod
+    def unparse_args_steps(cls, args: list[FormulaNode | str | None | TextNode]):
+        "`unparse_args` steps"
         result = []
         for x in args:
             if isinstance(x, BaseNode):
-                result.append(x.unparse())
+                result.append((yield x))
             if isinstance(x, str):
                 result.append(json.dumps(x))
             if x is None:
                 result.append("")
         return ", ".join(result)
 
-    def unparse(self):
-        return f"{self.name}({self.unparse_args(self.args)})"
+    def unparse_steps(self):
+        return f"{self.name}({(yield from self.unparse_args_steps(self.args))})"
 
-    def serialize(self) -> NodeSerialized:
-        args = [(x.serialize() if isinstance(x, BaseNode) else x) for x in self.args]
+    @staticmethod
+    def serialize_args_steps(args: list[FormulaNode | str | None | TextNode]):
+        "`serialize` steps of function call args"
+        result = []
+        for x in args:
+            result.append((yield x) if isinstance(x, BaseNode) else x)
+        return result
+
+    def serialize_steps(self):
+        args = yield from self.serialize_args_steps(self.args)
         return [self.type, self.name, *args]
 
+    @classmethod
+    def func_call_arg_clses(cls):
+        "Function call argument classes"
+        return (cls.formula_cls(), cls.text_cls())
+
     @classmethod
     def unserialize_args(cls, data: list[Any]):
         "Reconstruct args"
-        kinds = (cls.formula_cls(), cls.text_cls())
-        return [
-            (
-                cls.match_unserialize(kinds, x)
-                if isinstance(x, list)
-                else cast(Union[str, None], x)
-            )
-            for x in data
-        ]
+        return run_steps(cls.unserialize_args_steps(data), "unserialize")
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_args_steps(cls, data: list[Any]):
+        "`unserialize_args` steps"
+        result = []
+        for x in data:
+            if isinstance(x, list):
+                result.append((yield cls.kind_of("func_call_arg_clses", x), x))
+            else:
+                result.append(cast(Union[str, None], x))
+        return result
+
+    @classmethod
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) < 2:
             raise ReconstructException("assert len >= 2", data)
         if data[0] != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        return cls(name=data[1], args=cls.unserialize_args(data[2:]))
+        return cls(name=data[1], args=(yield from cls.unserialize_args_steps(data[2:])))
+
+
+class OpAssoc(Enum):
+    "Operator associativity, same members as `pyparsing.OpAssoc`"
+    LEFT = 1
+    RIGHT = 2
 
 
-@dataclass
-class FormulaOp(BaseNode):
+@slotted_dataclass
+class FormulaOp(StepsNode):
     "Formula base operator"
+    # pylint doesn't know `slotted_dataclass` makes a dataclass of `field()`s
+    # pylint: disable=invalid-field-call
     operator: str = field(init=False)
-    assoc: pp.helpers.OpAssoc = field(init=False)
+    assoc: OpAssoc = field(init=False)
     num_operands: int = field(init=False)
 
 
-@dataclass
+@slotted_dataclass
 class FormulaUnaryPlus(FormulaOp):
     "Formula unary plus operation"
     type = "+1"
     operator = "+"
     operand: FormulaValue
     num_operands = 1
-    assoc = pp.helpers.OpAssoc.RIGHT
+    assoc = OpAssoc.RIGHT
 
     @classmethod
     def parse_action(cls, toks: ParseResults):
@@ -785,30 +1068,24 @@ class FormulaUnaryPlus(FormulaOp):
     def get_parser(cls):
         return cls.get_grammar().formula_unary_plus_op
 
-    def unparse(self):
-        return " ".join([self.operator, self.operand.unparse()])
+    def unparse_steps(self):
+        return " ".join([self.operator, (yield self.operand)])
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, self.operand.serialize()]
+    def serialize_steps(self):
+        return [self.type, (yield self.operand)]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) != 2:
             raise ReconstructException("assert len == 2", data)
         typ, operand_serial = data
         if typ != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        kinds = (
-            cls.func_call_cls(),
-            cls.parameter_cls(),
-            *cls.formula_arith_op_clses(),
-            cls.text_cls(),
-        )
-        operand = cls.match_unserialize(kinds, operand_serial)
-        return cls(operand=operand)
+        kind = cls.kind_of("formula_unary_operand_clses", operand_serial)
+        return cls(operand=(yield kind, operand_serial))
 
 
-@dataclass
+@slotted_dataclass
 class FormulaUnaryMinus(FormulaUnaryPlus):
     "Formula unary plus operation"
     type = "-1"
@@ -828,14 +1105,14 @@ class FormulaUnaryMinus(FormulaUnaryPlus):
         return cls.get_grammar().formula_unary_minus_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaAdd(FormulaOp):
     "Formula addition operation"
     type = "+"
     operator = "+"
     operands: List[FormulaValue]
     num_operands = 2
-    assoc = pp.helpers.OpAssoc.LEFT
+    assoc = OpAssoc.LEFT
 
     @classmethod
     def parse_action(cls, toks: ParseResults):
@@ -850,50 +1127,54 @@ class FormulaAdd(FormulaOp):
     def get_parser(cls):
         return cls.get_grammar().formula_add_op
 
-    def unparse(self):
+    def unparse_steps(self):
         "Unparse and add brackets"
         precendence = {"+": 1, "-": 1, "*": 2, "/": 2, "^": 3}
         out = []
-        for operand in self.operands:
+        for idx, operand in enumerate(self.operands):
             parentheses = False
-            operand_src = operand.unparse()
+            operand_src = yield operand
+            if isinstance(operand, FormulaConstant):
+                operand = operand.source
             # pylint: disable=isinstance-second-argument-not-valid-type
             if isinstance(operand, self.formula_arith_op_clses()):
+                outer = precendence.get(self.operator, 1)
+                inner = precendence.get(operand.operator, 1)
+                # operators of a level apply left to right, `a - (b + c)`, and
+                # a run of the same one is a single node, `(a - b) - c`
+                same_level = self.operator in precendence and (
+                    idx > 0 or operand.operator == self.operator
+                )
                 if (
                     operand.num_operands > 1
-                    and operand.assoc == pp.helpers.OpAssoc.LEFT
-                    and (
-                        precendence.get(self.operator, 1)
-                        > precendence.get(operand.operator, 1)
-                    )
+                    and operand.assoc == OpAssoc.LEFT
+                    and (outer > inner or (same_level and outer == inner))
                 ):
                     parentheses = True
 
             out.append(f"( {operand_src} )" if parentheses else operand_src)
         return f" {self.operator} ".join(out)
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, *[x.serialize() for x in self.operands]]
+    def serialize_steps(self):
+        result: NodeSerialized = [self.type]
+        for operand in self.operands:
+            result.append((yield operand))
+        return result
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) <= 2:
             raise ReconstructException("assert len > 2", data)
         typ, *operands = data
         if typ != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        kinds = (
-            cls.func_call_cls(),
-            cls.parameter_cls(),
-            *cls.formula_arith_op_clses(),
-            *cls.formula_comp_op_clses(),
-            cls.text_cls(),
-        )
-        ops = [cls.match_unserialize(kinds, x) for x in operands]
+        ops = []
+        for operand in operands:
+            ops.append((yield cls.kind_of("formula_operand_clses", operand), operand))
         return cls(operands=ops)
 
 
-@dataclass
+@slotted_dataclass
 class FormulaSub(FormulaAdd):
     "Formula subtraction operation"
     type = "-"
@@ -904,7 +1185,7 @@ class FormulaSub(FormulaAdd):
         return cls.get_grammar().formula_sub_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaMul(FormulaAdd):
     "Formula multiplication operation"
     type = "*"
@@ -915,7 +1196,7 @@ class FormulaMul(FormulaAdd):
         return cls.get_grammar().formula_mul_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaDiv(FormulaAdd):
     "Formula division operation"
     type = "/"
@@ -926,7 +1207,7 @@ class FormulaDiv(FormulaAdd):
         return cls.get_grammar().formula_div_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaExp(FormulaAdd):
     "Formula expanentiation operation"
     type = "^"
@@ -948,7 +1229,7 @@ FormulaArithOps = Union[
 ]
 
 
-@dataclass
+@slotted_dataclass
 class FormulaEQ(FormulaAdd):
     "Formula equality comparison operation"
     type = "=="
@@ -958,12 +1239,15 @@ class FormulaEQ(FormulaAdd):
     def get_parser(cls):
         return cls.get_grammar().formula_eq_op
 
-    def unparse(self):
+    def unparse_steps(self):
         "Unparse and add brackets"
-        return f" {self.operator} ".join([x.unparse() for x in self.operands])
+        out = []
+        for operand in self.operands:
+            out.append((yield operand))
+        return f" {self.operator} ".join(out)
 
 
-@dataclass
+@slotted_dataclass
 class FormulaNE(FormulaAdd):
     "Formula not equality comparison operation"
     type = "!="
@@ -974,7 +1258,7 @@ class FormulaNE(FormulaAdd):
         return cls.get_grammar().formula_ne_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaLE(FormulaAdd):
     "Formula less comparison operation"
     type = "<"
@@ -985,7 +1269,7 @@ class FormulaLE(FormulaAdd):
         return cls.get_grammar().formula_le_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaLT(FormulaAdd):
     "Formula less than comparison operation"
     type = "<="
@@ -996,7 +1280,7 @@ class FormulaLT(FormulaAdd):
         return cls.get_grammar().formula_lt_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaGE(FormulaAdd):
     "Formula greater comparison operation"
     type = ">"
@@ -1007,7 +1291,7 @@ class FormulaGE(FormulaAdd):
         return cls.get_grammar().formula_ge_op
 
 
-@dataclass
+@slotted_dataclass
 class FormulaGT(FormulaAdd):
     "Formula greater than comparison operation"
     type = ">="
@@ -1027,12 +1311,47 @@ FormulaCompOps = Union[
     FormulaGT,
 ]
 FormulaValue = Union[
-    FunctionCallNode, ParameterNode, FormulaArithOps, FormulaCompOps, TextNode
+    FunctionCallNode,
+    ParameterNode,
+    FormulaArithOps,
+    FormulaCompOps,
+    TextNode,
+    "FormulaConstant",
 ]
 
 
-@dataclass
-class FormulaNode(BaseNode):
+@slotted_dataclass
+class FormulaConstant:
+    """
+    Folded value of a constant subexpression
+
+    Made by `optimize` only, unparsed and serialized as the subexpression. It
+    isn't a parsed node, no grammar or type tag dispatches to it.
+    """
+
+    type = "constant"
+    value: float
+    source: FormulaValue
+
+    def unparse(self) -> str:
+        "Source code of the subexpression"
+        return run_steps(self.unparse_steps(), "unparse")
+
+    def unparse_steps(self) -> Steps[str]:
+        "`unparse` steps: yield the subexpression"
+        return (yield self.source)
+
+    def serialize(self) -> NodeSerialized:
+        "Representation of the subexpression"
+        return run_steps(self.serialize_steps(), "serialize")
+
+    def serialize_steps(self) -> Steps[NodeSerialized]:
+        "`serialize` steps: yield the subexpression"
+        return (yield self.source)
+
+
+@slotted_dataclass
+class FormulaNode(StepsNode):
     "Infix notation formula node"
     type = "formula"
     value: FormulaValue
@@ -1046,31 +1365,24 @@ class FormulaNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().formula
 
-    def unparse(self) -> str:
-        return self.value.unparse()
+    def unparse_steps(self):
+        return (yield self.value)
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, self.value.serialize()]
+    def serialize_steps(self):
+        return [self.type, (yield self.value)]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) != 2:
             raise ReconstructException("assert len == 2", data)
         typ, val = data
         if typ != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        kinds = (
-            cls.func_call_cls(),
-            cls.parameter_cls(),
-            *cls.formula_arith_op_clses(),
-            *cls.formula_comp_op_clses(),
-            cls.text_cls(),
-        )
-        return cls(value=cls.match_unserialize(kinds, val))
+        return cls(value=(yield cls.kind_of("formula_operand_clses", val), val))
 
 
-@dataclass
-class LocalNode(BaseNode):
+@slotted_dataclass
+class LocalNode(StepsNode):
     "Local node"
     type = "local"
     value: ParameterNode
@@ -1086,24 +1398,24 @@ class LocalNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().local
 
-    def unparse(self) -> str:
-        return " ".join([self.type, self.value.unparse()])
+    def unparse_steps(self):
+        return " ".join([self.type, (yield self.value)])
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, self.value.serialize()]
+    def serialize_steps(self):
+        return [self.type, (yield self.value)]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) != 2:
             raise ReconstructException("assert len == 2", data)
         typ, val = data
         if typ != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        return cls(value=cls.parameter_cls().unserialize(val))
+        return cls(value=(yield cls.parameter_cls(), val))
 
 
-@dataclass
-class ExistingPrmNode(BaseNode):
+@slotted_dataclass
+class ExistingPrmNode(StepsNode):
     "Existing prm node"
     type = "existing_prm"
     name: ParameterNameNode
@@ -1123,16 +1435,18 @@ class ExistingPrmNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().existing_prm
 
-    def unparse(self) -> str:
-        return (
-            f"{self.type} {self.name.unparse()} {self.op} {self.modificator.unparse()};"
-        )
+    def unparse_steps(self):
+        name = yield self.name
+        modificator = yield self.modificator
+        return f"{self.type} {name} {self.op} {modificator};"
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, self.name.serialize(), self.op, self.modificator.serialize()]
+    def serialize_steps(self):
+        name = yield self.name
+        modificator = yield self.modificator
+        return [self.type, name, self.op, modificator]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) != 4:
             raise ReconstructException("assert len == 4", data)
         typ, name, op, mod = data
@@ -1141,11 +1455,11 @@ class ExistingPrmNode(BaseNode):
         return cls(
             name=cls.parameter_name_cls().unserialize(name),
             op=op,
-            modificator=cls.formula_cls().unserialize(mod),
+            modificator=(yield cls.formula_cls(), mod),
         )
 
 
-@dataclass
+@slotted_dataclass
 class NumRunsNode(BaseNode):
     "Num runs node"
     type = "num_runs"
@@ -1188,20 +1502,26 @@ class NumRunsNode(BaseNode):
         )
 
 
-@dataclass
+@slotted_dataclass
 class XddNode(BaseNode):
     "Xdd node"
     type = "xdd"
     filename: str | None = None
     inline_data_xy: bool = False
-    inline_data: List[Decimal] | None = None
-    range: Decimal | None = None
+    inline_data: NumberArray | None = None
+    range: Numeric | None = None
     xye_format: bool = False
     gsas_format: bool = False
     fullprof_format: bool = False
     gui_reload: bool = False
     gui_ignore: bool = False
 
+    def __post_init__(self):
+        if self.inline_data is not None and not isinstance(
+            self.inline_data, NumberArray
+        ):
+            self.inline_data = NumberArray(map(str, self.inline_data))
+
     @classmethod
     def parse_action(cls, toks: pp.ParseResults):
         "Parse action for the xdd node"
@@ -1209,7 +1529,7 @@ class XddNode(BaseNode):
         return cls(
             filename=data.get("xdd_filename", None),
             inline_data_xy=data.get("xdd_data_xy", False),
-            inline_data=data.get("xdd_data", None),
+            inline_data=data.get("xdd_data", [None])[0],
             range=data.get("xdd_range"),
             xye_format=data.get("xye_format", False),
             gsas_format=data.get("gsas_format", False),
@@ -1228,9 +1548,9 @@ class XddNode(BaseNode):
             filename_dbl_quote_esc = self.filename.replace('"', r"\"")
             result += f' "{filename_dbl_quote_esc}"'
         if self.filename is None and self.inline_data:
-            in_parts = (["_xy"] if self.inline_data_xy else []) + list(
-                map(str, self.inline_data)
-            )
+            in_parts = (["_xy"] if self.inline_data_xy else []) + [
+                self.inline_data.text
+            ]
             result += " " + " ".join(["{", *in_parts, "}"])
         if self.range:
             result += f" range {self.range}"
@@ -1253,8 +1573,11 @@ class XddNode(BaseNode):
             kv["filename"] = self.filename
         if self.filename is None and self.inline_data_xy:
             flags.append("_xy")
-        if self.filename is None and isinstance(self.inline_data, list):
-            kv["inline_data"] = [str(x) for x in self.inline_data]
+        if self.filename is None and self.inline_data is not None:
+            if numeric.get_packed_arrays():
+                kv["inline_data_packed"] = self.inline_data.pack()
+            else:
+                kv["inline_data"] = self.inline_data.lexemes()
         if self.range is not None:
             kv["range"] = str(self.range)
         if self.xye_format:
@@ -1281,17 +1604,23 @@ class XddNode(BaseNode):
         flags = data[2] if len(data) > 2 else []
         if not isinstance(flags, list):
             raise ReconstructException("assert isinstance(data[2], list)", data)
+        inline_data = None
+        if isinstance(opts.get("inline_data"), list):
+            inline_data = numeric.make_array(opts["inline_data"])
+        elif isinstance(opts.get("inline_data_packed"), str):
+            try:
+                inline_data = NumberArray.unpack(opts["inline_data_packed"])
+            except ValueError as err:
+                raise ReconstructException(
+                    f"invalid inline_data_packed: {err}", data
+                ) from err
 
         return cls(
             filename=opts.get("filename"),
             inline_data_xy="_xy" in flags,
-            inline_data=(
-                [Decimal(x) for x in opts["inline_data"]]
-                if isinstance(opts.get("inline_data"), list)
-                else None
-            ),
+            inline_data=inline_data,
             range=(
-                Decimal(opts["range"])
+                numeric.make(opts["range"])
                 if isinstance(opts.get("range"), (int, float, str))
                 else None
             ),
@@ -1303,8 +1632,8 @@ class XddNode(BaseNode):
         )
 
 
-@dataclass
-class AxialConvNode(BaseNode):
+@slotted_dataclass
+class AxialConvNode(StepsNode):
     "axial_conv node"
     type = "axial_conv"
     filament_length: ParameterNode
@@ -1331,38 +1660,38 @@ class AxialConvNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().axial_conv
 
-    def unparse(self) -> str:
+    def unparse_steps(self):
         result = (
             "axial_conv"
-            f" filament_length {self.filament_length.unparse()}"
-            f" sample_length {self.sample_length.unparse()}"
-            f" receiving_slit_length {self.receiving_slit_length.unparse()}"
+            f" filament_length {(yield self.filament_length)}"
+            f" sample_length {(yield self.sample_length)}"
+            f" receiving_slit_length {(yield self.receiving_slit_length)}"
         )
         if self.primary_soller_angle is not None:
-            result += f" primary_soller_angle {self.primary_soller_angle.unparse()}"
+            result += f" primary_soller_angle {(yield self.primary_soller_angle)}"
         if self.secondary_soller_angle is not None:
-            result += f" secondary_soller_angle {self.secondary_soller_angle.unparse()}"
+            result += f" secondary_soller_angle {(yield self.secondary_soller_angle)}"
         if self.axial_n_beta is not None:
-            result += f" axial_n_beta {self.axial_n_beta.unparse()}"
+            result += f" axial_n_beta {(yield self.axial_n_beta)}"
         return result
 
-    def serialize(self) -> NodeSerialized:
+    def serialize_steps(self):
         args = [
-            self.filament_length.serialize(),
-            self.sample_length.serialize(),
-            self.receiving_slit_length.serialize(),
+            (yield self.filament_length),
+            (yield self.sample_length),
+            (yield self.receiving_slit_length),
         ]
         opts = {}
         if self.primary_soller_angle is not None:
-            opts["p"] = self.primary_soller_angle.serialize()
+            opts["p"] = yield self.primary_soller_angle
         if self.secondary_soller_angle is not None:
-            opts["s"] = self.secondary_soller_angle.serialize()
+            opts["s"] = yield self.secondary_soller_angle
         if self.axial_n_beta is not None:
-            opts["b"] = self.axial_n_beta.serialize()
+            opts["b"] = yield self.axial_n_beta
         return [self.type, args] if not opts else [self.type, args, opts]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) not in [2, 3]:
             raise ReconstructException("assert len in [2, 3]", data)
         if data[0] != cls.type:
@@ -1376,25 +1705,26 @@ class AxialConvNode(BaseNode):
         if not isinstance(opts, dict):
             raise ReconstructException("assert isinstance(data[2], dict)", data)
 
+        param_cls = cls.parameter_cls()
         return cls(
-            filament_length=cls.parameter_cls().unserialize(args[0]),
-            sample_length=cls.parameter_cls().unserialize(args[1]),
-            receiving_slit_length=cls.parameter_cls().unserialize(args[2]),
+            filament_length=(yield param_cls, args[0]),
+            sample_length=(yield param_cls, args[1]),
+            receiving_slit_length=(yield param_cls, args[2]),
             primary_soller_angle=(
-                cls.parameter_cls().unserialize(opts["p"]) if "p" in opts else None
+                (yield param_cls, opts["p"]) if "p" in opts else None
             ),
             secondary_soller_angle=(
-                cls.parameter_cls().unserialize(opts["s"]) if "s" in opts else None
-            ),
-            axial_n_beta=(
-                cls.parameter_cls().unserialize(opts["b"]) if "b" in opts else None
+                (yield param_cls, opts["s"]) if "s" in opts else None
             ),
+            axial_n_beta=((yield param_cls, opts["b"]) if "b" in opts else None),
         )
 
 
-@dataclass
-class BkgNode(BaseNode):
+@slotted_dataclass
+class BkgNode(StepsNode):
     "bkg node"
+    # pylint doesn't know `slotted_dataclass` makes a dataclass of `field()`s
+    # pylint: disable=invalid-field-call,not-an-iterable
     type = "bkg"
     params: list[ParameterNode] = field(default_factory=list)
 
@@ -1407,26 +1737,35 @@ class BkgNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().bkg
 
-    def unparse(self) -> str:
-        tail = " ".join([x.unparse() for x in self.params])
+    def unparse_steps(self):
+        params = []
+        for param in self.params:
+            params.append((yield param))
+        tail = " ".join(params)
         return f"{self.type} {tail}"
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, *[x.serialize() for x in self.params]]
+    def serialize_steps(self):
+        result: NodeSerialized = [self.type]
+        for param in self.params:
+            result.append((yield param))
+        return result
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) < 2:
             raise ReconstructException("assert len >= 2", data)
         if data[0] != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
         if not all(isinstance(x, list) for x in data[1:]):
             raise ReconstructException("assert all of data[1:] of list type", data)
-        return cls(params=[cls.parameter_cls().unserialize(x) for x in data[1:]])
+        params = []
+        for param in data[1:]:
+            params.append((yield cls.parameter_cls(), param))
+        return cls(params=params)
 
 
-@dataclass
-class ScaleNode(BaseNode):
+@slotted_dataclass
+class ScaleNode(StepsNode):
     "scale node"
     type = "scale"
     param: ParameterNode
@@ -1440,21 +1779,21 @@ class ScaleNode(BaseNode):
     def get_parser(cls):
         return cls.get_grammar().scale
 
-    def unparse(self) -> str:
-        return f"{self.type} {self.param.unparse()}"
+    def unparse_steps(self):
+        return f"{self.type} {(yield self.param)}"
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, self.param.serialize()]
+    def serialize_steps(self):
+        return [self.type, (yield self.param)]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) != 2:
             raise ReconstructException("assert len == 2", data)
         if data[0] != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
         if not isinstance(data[1], list):
             raise ReconstructException("assert isinstance(data[1], list)", data)
-        return cls(param=cls.parameter_cls().unserialize(data[1]))
+        return cls(param=(yield cls.parameter_cls(), data[1]))
 
 
 RootMacroCommonStatemtents = Union[
@@ -1474,9 +1813,11 @@ RootMacroCommonStatemtents = Union[
 MacroStatements = RootMacroCommonStatemtents
 
 
-@dataclass
-class MacroNode(BaseNode):
+@slotted_dataclass
+class MacroNode(StepsNode):
     "Macro node"
+    # pylint doesn't know `slotted_dataclass` makes a dataclass of `field()`s
+    # pylint: disable=invalid-field-call,not-an-iterable
     type = "macro"
     name: str
     args: list[FormulaNode | str | None | TextNode] = field(default_factory=list)
@@ -1513,34 +1854,43 @@ class MacroNode(BaseNode):
             cls.xdd_cls(),
         )
 
-    def unparse(self):
+    def unparse_steps(self):
         result = f"macro {self.name}"
 
         if self.args:
-            result += f"({FunctionCallNode.unparse_args(self.args)})"
+            result += f"({(yield from FunctionCallNode.unparse_args_steps(self.args))})"
 
-        stmts = [x.unparse() if isinstance(x, BaseNode) else x for x in self.statements]
+        stmts = []
+        for stmt in self.statements:
+            stmts.append((yield stmt) if isinstance(stmt, BaseNode) else stmt)
         if not stmts:
             result += " {}"
         if len(stmts) == 1:
             result += " { " + stmts[0] + " }"
         if len(stmts) > 1:
-            result += " {\n"
+            fragments = [result, " {\n"]
             for idx, stmt in enumerate(stmts):
-                delim = "" if idx == 0 or stmt == "\n" else "\n"
-                result += f"{delim}{stmt}"
-            result += "}"
+                fragments.append("" if idx == 0 or stmt == "\n" else "\n")
+                fragments.append(stmt)
+            fragments.append("}")
+            result = "".join(fragments)
         return result
 
-    def serialize(self) -> NodeSerialized:
-        args = [(x.serialize() if isinstance(x, BaseNode) else x) for x in self.args]
-        stmts = [
-            (x.serialize() if isinstance(x, BaseNode) else x) for x in self.statements
-        ]
+    @staticmethod
+    def serialize_statements_steps(statements: list[MacroStatements | str]):
+        "`serialize` steps of macro statements, strings are kept as they are"
+        result = []
+        for stmt in statements:
+            result.append(stmt if isinstance(stmt, str) else (yield stmt))
+        return result
+
+    def serialize_steps(self):
+        args = yield from FunctionCallNode.serialize_args_steps(self.args)
+        stmts = yield from self.serialize_statements_steps(self.statements)
         return [self.type, self.name, args, stmts]
 
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) != 4:
             raise ReconstructException("assert len == 4", data)
         if data[0] != cls.type:
@@ -1552,29 +1902,30 @@ class MacroNode(BaseNode):
         if not isinstance(data[3], list):
             raise ReconstructException("assert type of data[3] == list", data)
 
-        stmts = [
-            (
-                x
-                if isinstance(x, str)
-                else cls.match_unserialize(cls.macro_statement_clses(), x)
-            )
-            for x in data[3]
-        ]
-        return cls(
-            name=data[1],
-            args=cls.func_call_cls().unserialize_args(data[2]),
-            statements=stmts,
-        )
+        args = yield from cls.func_call_cls().unserialize_args_steps(data[2])
+        stmts = []
+        for stmt in data[3]:
+            if isinstance(stmt, str):
+                stmts.append(stmt)
+            else:
+                kind = cls.kind_of("macro_statement_clses", stmt)
+                stmts.append((yield kind, stmt))
+        return cls(name=data[1], args=args, statements=stmts)
 
 
 RootStatements = Union[RootMacroCommonStatemtents, MacroNode]
 
 
-@dataclass
-class RootNode(BaseNode):
+@slotted_dataclass
+class RootNode(StepsNode):
     "Root node of AST"
+    # pylint doesn't know `slotted_dataclass` makes a dataclass of `field()`s
+    # pylint: disable=invalid-field-call,not-an-iterable,no-member
+    # pylint: disable=unsubscriptable-object
     type = "topas"
     statements: list[RootStatements] = field(default_factory=list)
+    # top level statements source offsets, see `pytopas.incremental`
+    spans: list[Any] | None = field(default=None, compare=False, repr=False)
 
     @classmethod
     def parse_action(cls, toks: pp.ParseResults):
@@ -1583,13 +1934,19 @@ class RootNode(BaseNode):
         if len(stmts) and stmts[-1] == LineBreakNode():
             stmts = stmts[:-1]
         inst = cls(statements=[])
-        # concat text nodes
+        # concat text nodes, values of a run are joined once at the end
+        runs: dict[int, list[str]] = {}
         for stmt in stmts:
             last_stmt = inst.statements[-1] if inst.statements else None
             if isinstance(last_stmt, TextNode) and isinstance(stmt, TextNode):
-                last_stmt.value = f"{last_stmt.value} {stmt.value}"
+                run_idx = len(inst.statements) - 1
+                runs.setdefault(run_idx, [last_stmt.value]).append(stmt.value)
+                stats.join(last_stmt, stmt)
             else:
                 inst.statements.append(stmt)
+        for run_idx, values in runs.items():
+            text = cast(TextNode, inst.statements[run_idx])
+            text.value = " ".join(values)
 
         return inst
 
@@ -1621,24 +1978,37 @@ class RootNode(BaseNode):
         result = super().parse(text, parse_all=parse_all, print_dump=print_dump)
         return result  # type: ignore[assignment]
 
-    def unparse(self):
-        result = ""
+    def delimited_statements(self) -> Iterator[tuple[str, RootStatements]]:
+        "Statements with the delimiter written before each of them"
         for idx, stmt in enumerate(self.statements):
-            delim = "" if idx == 0 or isinstance(stmt, (LineBreakNode,)) else "\n"
-            result += f"{delim}{stmt.unparse()}"
+            yield "" if idx == 0 or isinstance(stmt, (LineBreakNode,)) else "\n", stmt
+
+    def unparse_steps(self):
+        fragments: list[str] = []
+        for delim, stmt in self.delimited_statements():
+            fragments.append(delim)
+            fragments.append((yield stmt))
+        return "".join(fragments)
+
+    def unparse_to(self, fp: IO[str]):
+        "Write reconstructed source code to the file statement by statement"
+        for delim, stmt in self.delimited_statements():
+            fp.write(delim)
+            fp.write(stmt.unparse())
+
+    def serialize_steps(self):
+        result: NodeSerialized = [self.type]
+        for stmt in self.statements:
+            result.append((yield stmt))
         return result
 
-    def serialize(self) -> NodeSerialized:
-        return [self.type, *[x.serialize() for x in self.statements]]
-
     @classmethod
-    def unserialize(cls, data: list[Any]):
+    def unserialize_steps(cls, data: list[Any]):
         if not hasattr(data, "__len__") or len(data) < 1:
             raise ReconstructException("assert len >= 1", data)
         if data[0] != cls.type:
             raise ReconstructException(f"assert data[0] == {cls.type}", data)
-        return cls(
-            statements=[
-                cls.match_unserialize(cls.root_statement_clses(), x) for x in data[1:]
-            ]
-        )
+        stmts = []
+        for stmt in data[1:]:
+            stmts.append((yield cls.kind_of("root_statement_clses", stmt), stmt))
+        return cls(statements=stmts)
@@ -0,0 +1,141 @@
+"""
+Batch conversion of many TOPAS files to JSON
+
+Directories are searched recursively for `SUFFIXES` files, glob patterns are
+expanded with `**` support. Files are parsed by a pool of worker processes, the
+grammar is built once per worker.
+
+Every file gets one JSON report line: the file path, the parse time in seconds
+and the number of text fallbacks, plus the serialized tree or the path of the
+written `.json` file when outputs mirror the input tree in a directory.
+A file that can't be read or parsed gets an `error` instead, the other files
+are still converted.
+"""
+
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from . import numeric, stats
+from .cache import ParseCache
+from .parser import Parser
+
+SUFFIXES = (".inp", ".str")
+
+
+def _glob_base(pattern: str) -> Path:
+    "Leading directories of the pattern without wildcards"
+    parts = Path(pattern).parts
+    for idx, part in enumerate(parts):
+        if glob.has_magic(part):  # type: ignore[attr-defined]
+            return Path(*parts[:idx]) if idx else Path()
+    return Path(pattern).parent
+
+
+def expand(patterns: Iterable[str]) -> List[Tuple[Path, Path]]:
+    "Files of directories, glob patterns and paths with paths relative to them"
+    result = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            result += [
+                (x, x.relative_to(path))
+                for x in sorted(path.rglob("*"))
+                if x.is_file() and x.suffix.lower() in SUFFIXES
+            ]
+            continue
+        base = _glob_base(pattern)
+        result += [
+            (Path(x), Path(x).relative_to(base))
+            for x in sorted(glob.glob(pattern, recursive=True))
+            if os.path.isfile(x)
+        ]
+    return result
+
+
+def convert(
+    path: Path,
+    relative: Path,
+    output_dir: Optional[Path] = None,
+    number_mode: str = numeric.DECIMAL,
+    cache: Optional[ParseCache] = None,
+    packed: bool = False,
+) -> str:
+    "Parse the file and return its report line, see `numeric.packed_arrays`"
+    report = {"file": str(path)}
+    output = None
+    try:
+        text = path.read_text()
+        start = time.perf_counter()
+        if output_dir is None:
+            with numeric.packed_arrays(packed):
+                tree, parse_stats = Parser.parse_with_stats(
+                    text, number_mode=number_mode, cache=cache
+                )
+            report["tree"] = tree
+        else:
+            output = output_dir / relative.with_name(f"{relative.name}.json")
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with stats.collect() as parse_stats, output.open("w") as fp:
+                with numeric.packed_arrays(packed):
+                    Parser.parse_to(fp, text, number_mode=number_mode, cache=cache)
+            report["output"] = str(output)
+        report["seconds"] = round(time.perf_counter() - start, 6)
+        report["fallbacks"] = parse_stats.fallbacks
+    # one file, too deeply nested for example, doesn't stop the batch
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        report = {"file": str(path), "error": f"{type(err).__name__}: {err}"}
+        if output is not None:
+            output.unlink(missing_ok=True)
+    return json.dumps(report)
+
+
+def run(
+    patterns: Iterable[str],
+    fp: IO[str],
+    output_dir: Optional[Path] = None,
+    processes: Optional[int] = 1,
+    number_mode: str = numeric.DECIMAL,
+    cache: Optional[ParseCache] = None,
+    packed: bool = False,
+):
+    """
+    Convert files of the patterns and write NDJSON report lines to the file
+
+    Files are parsed by a pool of `processes` workers when `processes` isn't 1,
+    `None` means all CPUs. Reports are written in the order of files.
+    """
+    files = expand(patterns)
+    paths = [x for x, _ in files]
+    relatives = [x for _, x in files]
+    outputs = [output_dir] * len(files)
+    modes = [number_mode] * len(files)
+    caches = [cache] * len(files)
+    packs = [packed] * len(files)
+    pool = None
+    if processes != 1:
+        # workers don't share the memoization setting of this process
+        from . import memo  # pylint: disable=import-outside-toplevel
+
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=memo.set_cache_size_limit,
+            initargs=(memo.get_cache_size_limit(),),
+        )
+    try:
+        lines: Iterator[str] = (
+            pool.map(
+                convert, paths, relatives, outputs, modes, caches, packs, chunksize=8
+            )
+            if pool is not None
+            else map(convert, paths, relatives, outputs, modes, caches, packs)
+        )
+        for line in lines:
+            fp.write(f"{line}\n")
+    finally:
+        if pool is not None:
+            pool.shutdown()
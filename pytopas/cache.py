@@ -0,0 +1,204 @@
+"""
+Persistent content addressed parse cache
+
+Serialized trees are stored in files named by a hash of the source text, the
+numbers mode, whether number arrays are packed, the pytopas version and the
+grammar version (a hash of the package sources). Text fallbacks and parse
+failure diagnostics are stored with the tree and reported again on a hit, the
+same as after a parse.
+
+Entries are written to temporary files and renamed, so any number of processes
+can share a cache directory. Hits touch the entry, least recently used entries
+are evicted when the directory grows over `max_size` bytes.
+
+Eviction lists the whole directory, so it isn't done on every write. The
+`evicted` marker file keeps the size of the cache after the last eviction,
+a process evicts again when that size with the bytes the process wrote since
+goes over `max_size`, or when the marker is older than `EVICT_SECONDS`. The
+marker is shared by all processes and survives pickling of the cache.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Union
+
+from . import diagnostics, numeric, stats
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+# writes of other processes aren't counted, evict after a while anyway
+EVICT_SECONDS = 60
+MARKER_NAME = "evicted"
+
+
+@lru_cache(maxsize=None)
+def grammar_version() -> str:
+    "Hash of the package sources"
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def default_path() -> Path:
+    "`$PYTOPAS_CACHE_DIR` or `pytopas` in the user cache directory"
+    if os.environ.get("PYTOPAS_CACHE_DIR"):
+        return Path(os.environ["PYTOPAS_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "pytopas"
+
+
+class CacheEntry(NamedTuple):
+    "Serialized tree with text fallbacks and diagnostics of the parse"
+    tree: Any
+    parse_stats: stats.ParseStats
+    parse_diagnostics: List[diagnostics.Diagnostic]
+
+    def report(self, text: str):
+        "Report fallbacks and diagnostics of the parse of the text"
+        parse_stats = self.parse_stats
+        for start, end in zip(parse_stats.starts, parse_stats.ends):
+            stats.record_fallback(text, start, end, stacklevel=3)
+        for diagnostic in self.parse_diagnostics:
+            diagnostics.report(diagnostic, stacklevel=3)
+
+
+class ParseCache:
+    "Parse results in files of a directory"
+    __slots__ = ("path", "max_size", "_written")
+
+    def __init__(
+        self, path: Union[str, Path, None] = None, max_size: int = DEFAULT_MAX_SIZE
+    ):
+        self.path = Path(path) if path is not None else default_path()
+        self.max_size = max_size
+        # bytes written by this process since the last eviction
+        self._written = 0
+
+    def __repr__(self):
+        return f"ParseCache({str(self.path)!r}, max_size={self.max_size})"
+
+    def __getstate__(self):
+        return (self.path, self.max_size)
+
+    def __setstate__(self, state):
+        self.path, self.max_size = state
+        self._written = 0
+
+    @staticmethod
+    def key(text: str, number_mode: str) -> str:
+        "Content address of the parse result"
+        from . import __VERSION__  # pylint: disable=import-outside-toplevel
+
+        # packed xdd data is another serialized tree of the same text
+        packed = "\0packed" if numeric.get_packed_arrays() else ""
+        digest = hashlib.sha256(
+            f"{__VERSION__}\0{grammar_version()}\0{number_mode}{packed}\0".encode()
+        )
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        "File of the entry"
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, text: str, number_mode: str) -> Optional[CacheEntry]:
+        "Cached parse result of the text or `None`"
+        path = self.entry_path(self.key(text, number_mode))
+        try:
+            with path.open(encoding="utf-8") as fp:
+                data = json.load(fp)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        parse_stats = stats.ParseStats()
+        parse_stats.starts.extend(data["starts"])
+        parse_stats.ends.extend(data["ends"])
+        return CacheEntry(
+            data["tree"],
+            parse_stats,
+            [diagnostics.Diagnostic(text, *x) for x in data["diagnostics"]],
+        )
+
+    def put(self, text: str, number_mode: str, entry: CacheEntry):
+        "Store parse result of the text"
+        path = self.entry_path(self.key(text, number_mode))
+        data = {
+            "tree": entry.tree,
+            "starts": entry.parse_stats.starts.tolist(),
+            "ends": entry.parse_stats.ends.tolist(),
+            "diagnostics": [[x.loc, x.expected] for x in entry.parse_diagnostics],
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                    json.dump(data, fp)
+                    self._written += fp.tell()
+                os.replace(tmp_name, path)
+            except BaseException:
+                os.unlink(tmp_name)
+                raise
+        except OSError:
+            # the cache is an optimization only
+            return
+        if self.needs_eviction():
+            self.evict()
+
+    @property
+    def marker_path(self) -> Path:
+        "File with the size of the cache after the last eviction"
+        return self.path / MARKER_NAME
+
+    def needs_eviction(self) -> bool:
+        "Is the cache over `max_size` or is the last eviction too old?"
+        marker = self.marker_path
+        try:
+            if time.time() - marker.stat().st_mtime > EVICT_SECONDS:
+                return True
+            size = int(marker.read_text(encoding="ascii"))
+        except (OSError, ValueError):
+            return True
+        return size + self._written > self.max_size
+
+    def size(self) -> int:
+        "Total size of the entries in bytes"
+        return sum(x.stat().st_size for x in self.path.glob("*/*.json"))
+
+    def evict(self):
+        "Remove least recently used entries until the cache fits `max_size`"
+        entries = []
+        for path in self.path.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:  # pragma: no cover
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:  # pragma: no cover
+                continue
+            total -= size
+        self._written = 0
+        try:
+            self.marker_path.write_text(str(total), encoding="ascii")
+        except OSError:  # pragma: no cover
+            pass
+
+    def clear(self):
+        "Remove all entries"
+        for path in [*self.path.glob("*/*.json"), self.marker_path]:
+            try:
+                path.unlink()
+            except OSError:
+                continue
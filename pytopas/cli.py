@@ -3,11 +3,12 @@
 import argparse
 import json
 import sys
-import warnings
 from io import TextIOWrapper
+from pathlib import Path
 from typing import List, Optional
 
-from .exc import ParseWarning
+from . import batch, diagnostics, numeric
+from .cache import ParseCache
 from .parser import Parser
 
 
@@ -21,30 +22,93 @@ def _topas2json_parse_args(args: Optional[List[str]] = None) -> argparse.Namespa
     arg_parser.add_argument(
         "file",
         type=argparse.FileType("r"),
+        nargs="?",
         help="Path to TOPAS file or '-' for stdin input",
     )
+    arg_parser.add_argument(
+        "--batch",
+        nargs="+",
+        metavar="DIR|GLOB",
+        help="Convert INP/STR files of directories and glob patterns, "
+        "write a JSON report line per file",
+    )
+    arg_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        help="Batch mode: write .json files mirroring the input tree here "
+        "instead of trees in report lines",
+    )
     arg_parser.add_argument(
         "--ignore-warnings",
         action="store_true",
         help="Don't print parsing warnings",
         default=False,
     )
-    return arg_parser.parse_args(args=args is not None and args or sys.argv[1:])
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of parsing processes for large files or batch files, "
+        "0 for all CPUs, the default in batch mode",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use the parse cache in $PYTOPAS_CACHE_DIR or ~/.cache/pytopas",
+        default=False,
+    )
+    arg_parser.add_argument(
+        "--numbers",
+        choices=numeric.MODES,
+        help="Parse numbers to decimals or keep their source text",
+        default=numeric.DECIMAL,
+    )
+    arg_parser.add_argument(
+        "--packed-xdd",
+        action="store_true",
+        help="Write xdd inline data as base64 of its values, not a list of "
+        "numbers, the source text of the numbers is lost",
+        default=False,
+    )
+    result = arg_parser.parse_args(args=args is not None and args or sys.argv[1:])
+    if (result.file is None) == (result.batch is None):
+        arg_parser.error("either file or --batch is required")
+    return result
 
 
 def topas2json(args: Optional[argparse.Namespace] = None):
     "CLI tool that converts TOPAS to JSON"
 
     args = args is not None and args or _topas2json_parse_args()
+    from . import memo  # pylint: disable=import-outside-toplevel
+
+    memo.enable_memoization()
+    cache = None if args.no_cache else ParseCache()
+    if args.batch:
+        batch.run(
+            args.batch,
+            sys.stdout,
+            output_dir=args.output_dir,
+            processes=args.jobs or None,
+            number_mode=args.numbers,
+            cache=cache,
+            packed=args.packed_xdd,
+        )
+        return
     file: TextIOWrapper = args.file
     input_topas = file.read()
     file.close()
 
-    with warnings.catch_warnings():
-        if args.ignore_warnings:
-            warnings.filterwarnings("ignore", category=ParseWarning)
-        serialized = Parser.parse(input_topas)
-        print(json.dumps(serialized))
+    packed = numeric.packed_arrays(args.packed_xdd)
+    with diagnostics.warn(not args.ignore_warnings), packed:
+        Parser.parse_to(
+            sys.stdout,
+            input_topas,
+            processes=1 if args.jobs is None else args.jobs or None,
+            number_mode=args.numbers,
+            cache=cache,
+        )
+        sys.stdout.write("\n")
 
 
 def _json2topas_parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
@@ -70,7 +134,37 @@ def json2topas(args: Optional[argparse.Namespace] = None):
     file.close()
 
     try:
-        src = Parser.reconstruct(json.loads(input_json))
-        print(src)
+        Parser.reconstruct_to(sys.stdout, json.loads(input_json))
+        sys.stdout.write("\n")
     except json.JSONDecodeError as exp:
         raise exp
+
+
+def _pytopas_parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    "Parse pytopas args"
+    arg_parser = argparse.ArgumentParser(prog="pytopas", description="TOPAS parser")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser(
+        "serve",
+        help="Run parse daemon",
+        description="Keep the grammar loaded and answer JSON-RPC parse and "
+        "reconstruct requests, one JSON object per line",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        help="Path to Unix socket to listen on, stdin/stdout if not given",
+    )
+    return arg_parser.parse_args(args=args is not None and args or sys.argv[1:])
+
+
+def pytopas(args: Optional[argparse.Namespace] = None):
+    "CLI tool with pytopas commands"
+
+    args = args is not None and args or _pytopas_parse_args()
+    if args.command == "serve":
+        # Unix sockets aren't available everywhere
+        # pylint: disable-next=import-outside-toplevel
+        from . import memo, server
+
+        memo.enable_memoization()
+        server.serve(args.socket, sys.stdin, sys.stdout)
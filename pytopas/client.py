@@ -0,0 +1,123 @@
+"""
+Client of the parse daemon
+
+Requests are sent to the daemon of `pytopas serve --socket`. When no daemon
+listens on the socket, the source is parsed in this process instead. The
+parser is imported only then, a client that talks to the daemon doesn't build
+the grammar.
+"""
+
+import json
+import os
+import socket
+import tempfile
+from typing import Any, Optional
+
+# must match `server.RECONSTRUCT_ERROR`, the server isn't imported here
+RECONSTRUCT_ERROR = 1
+
+
+class DaemonError(Exception):
+    "Error response of the daemon"
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def default_socket_path() -> str:
+    "`$PYTOPAS_SOCKET` or `pytopas.sock` in the runtime or temporary directory"
+    if os.environ.get("PYTOPAS_SOCKET"):
+        return os.environ["PYTOPAS_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "pytopas.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else ""
+    return os.path.join(tempfile.gettempdir(), f"pytopas-{uid}.sock")
+
+
+class Client:
+    "Connection to the daemon"
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: float = 60):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._rfile: Any = None
+        self._last_id = 0
+
+    def connect(self):
+        "Connect to the daemon, `OSError` if there is none"
+        if self._sock is not None:
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+
+    def close(self):
+        "Close the connection"
+        if self._sock is not None:
+            self._rfile.close()
+            self._sock.close()
+            self._sock = self._rfile = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def call(self, method: str, **params) -> Any:
+        "Result of the remote method"
+        self.connect()
+        assert self._sock is not None
+        self._last_id += 1
+        request = {"jsonrpc": "2.0", "id": self._last_id, "method": method}
+        request["params"] = params
+        self._sock.sendall(f"{json.dumps(request)}\n".encode("utf-8"))
+        line = self._rfile.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("Daemon closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            error = response["error"]
+            if error["code"] == RECONSTRUCT_ERROR:
+                # pylint: disable-next=import-outside-toplevel
+                from .exc import ReconstructException
+
+                raise ReconstructException(error["message"])
+            raise DaemonError(error["code"], error["message"])
+        return response["result"]
+
+
+def parse(
+    text: str, number_mode: str = "decimal", socket_path: Optional[str] = None
+) -> Any:
+    "Serialized tree of the source by the daemon or in this process"
+    try:
+        with Client(socket_path) as client:
+            return client.call("parse", text=text, number_mode=number_mode)
+    except OSError:
+        pass
+    from .parser import Parser  # pylint: disable=import-outside-toplevel
+
+    return Parser.parse(text, number_mode=number_mode)
+
+
+def reconstruct(data: Any, socket_path: Optional[str] = None) -> str:
+    "Source code of the serialized tree by the daemon or in this process"
+    try:
+        with Client(socket_path) as client:
+            return client.call("reconstruct", data=data)
+    except OSError:
+        pass
+    from .parser import Parser  # pylint: disable=import-outside-toplevel
+
+    return Parser.reconstruct(data)
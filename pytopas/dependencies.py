@@ -0,0 +1,188 @@
+"""
+Equation dependency graph
+
+Equations are the formulas of parameter values (`prm b = a * 2;`, also of
+unnamed parameters like `y = d;` of a `site`) and of `existing_prm` updates.
+An equation depends on the last equation of every name its formula references.
+Names without equations are refined or constant values, they are leaves.
+
+Several equations of a name are chained in source order, so `existing_prm`
+updates follow the equation they update. A reference of an `existing_prm` to
+its own name is to the value before the update and isn't a cycle. A compound
+update like `existing_prm a += 2;` reads that value too, it is a referrer of
+its name. Macro definitions are templates, their equations are skipped.
+
+The graph is kept in lists indexed by equation, `order` and `affected` are
+linear in the size of the (affected) graph apart from a heap which keeps
+independent equations in source order.
+"""
+
+import heapq
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from . import symbols
+from .ast import (
+    BaseNode,
+    ExistingPrmNode,
+    MacroNode,
+    ParameterEquationNode,
+    ParameterNode,
+    RootNode,
+)
+from .exc import DependencyCycleException
+
+
+class Equation(NamedTuple):
+    "Equation of a parameter value or an `existing_prm` update"
+    # `None` for unnamed parameters
+    name: Optional[str]
+    # `ParameterNode` or `ExistingPrmNode`
+    node: BaseNode
+    formula: Any
+    # top level statement of the node
+    statement: Any
+    # referenced names in source order
+    references: Tuple[str, ...]
+
+
+def _references(formula: Any) -> Tuple[str, ...]:
+    sites = symbols.statement_sites(formula, referring=True)
+    return tuple({x.name: None for x in sites if x.kind == symbols.REFERENCE})
+
+
+def find_equations(tree: Any) -> List[Equation]:
+    "Equations of the tree in source order"
+    statements = tree.statements if isinstance(tree, RootNode) else [tree]
+    result = []
+    for statement in statements:
+        stack = [statement]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, list):
+                stack += reversed(value)
+                continue
+            names = symbols.child_fields(value)
+            if names is None or isinstance(value, MacroNode):
+                continue
+            if isinstance(value, ExistingPrmNode):
+                formula = value.modificator
+                name: Optional[str] = value.name.name
+                result.append(
+                    Equation(name, value, formula, statement, _references(formula))
+                )
+                continue
+            children = [getattr(value, x) for x in names]
+            if isinstance(value, ParameterNode) and isinstance(
+                value.prm_value, ParameterEquationNode
+            ):
+                formula = value.prm_value.formula
+                name = value.prm_name.name if value.prm_name is not None else None
+                result.append(
+                    Equation(name, value, formula, statement, _references(formula))
+                )
+                children = [x for x in children if x is not value.prm_value]
+            stack += reversed([x for x in children if x is not None])
+    return result
+
+
+class DependencyGraph:
+    "Dependencies between equations of a tree"
+    __slots__ = ("equations", "definitions", "referrers", "predecessors", "successors")
+
+    def __init__(self, tree: Any):
+        self.equations = find_equations(tree)
+        # name -> indexes of its equations in source order
+        self.definitions: Dict[str, List[int]] = {}
+        # name -> indexes of equations referencing it
+        self.referrers: Dict[str, List[int]] = {}
+        # index -> indexes of equations it depends on, and the other way around
+        self.predecessors: List[List[int]] = [[] for _ in self.equations]
+        self.successors: List[List[int]] = [[] for _ in self.equations]
+        for idx, equation in enumerate(self.equations):
+            if equation.name is not None:
+                definitions = self.definitions.setdefault(equation.name, [])
+                if definitions:
+                    self.predecessors[idx].append(definitions[-1])
+                definitions.append(idx)
+        for idx, equation in enumerate(self.equations):
+            node = equation.node
+            update = isinstance(node, ExistingPrmNode)
+            references = equation.references
+            # `existing_prm a += 2;` reads the value of `a`
+            if isinstance(node, ExistingPrmNode) and node.op != "=":
+                references = tuple(dict.fromkeys((node.name.name, *references)))
+            for name in references:
+                self.referrers.setdefault(name, []).append(idx)
+                definitions = self.definitions.get(name)
+                if definitions and not (update and name == equation.name):
+                    self.predecessors[idx].append(definitions[-1])
+        for idx, predecessors in enumerate(self.predecessors):
+            predecessors[:] = dict.fromkeys(predecessors)
+            for pred in predecessors:
+                self.successors[pred].append(idx)
+
+    def __len__(self):
+        return len(self.equations)
+
+    def dependencies(self, equation: int) -> List[Equation]:
+        "Equations the equation of the index depends on"
+        return [self.equations[x] for x in self.predecessors[equation]]
+
+    def _order(self, indexes: Set[int]) -> List[int]:
+        "Topological order of the equations of the indexes"
+        indegree = {
+            x: sum(y in indexes for y in self.predecessors[x]) for x in indexes
+        }
+        ready = [x for x, degree in indegree.items() if not degree]
+        heapq.heapify(ready)
+        result = []
+        while ready:
+            idx = heapq.heappop(ready)
+            result.append(idx)
+            for succ in self.successors[idx]:
+                if succ in indegree:
+                    indegree[succ] -= 1
+                    if not indegree[succ]:
+                        heapq.heappush(ready, succ)
+        if len(result) < len(indexes):
+            raise DependencyCycleException(self._find_cycle(indegree))
+        return result
+
+    def _find_cycle(self, indegree: Dict[int, int]) -> List[Equation]:
+        "A cycle of the equations left with dependencies"
+        # every one of them depends on another one of them
+        idx = min(x for x, degree in indegree.items() if degree)
+        path: Dict[int, None] = {}
+        while idx not in path:
+            path[idx] = None
+            idx = next(x for x in self.predecessors[idx] if indegree.get(x, 0))
+        cycle = list(path)
+        return [self.equations[x] for x in cycle[cycle.index(idx) :]]
+
+    def order(self) -> List[Equation]:
+        """
+        Equations in evaluation order, independent ones in source order
+
+        `DependencyCycleException` is raised if there is a cycle.
+        """
+        indexes = self._order(set(range(len(self.equations))))
+        return [self.equations[x] for x in indexes]
+
+    def cycle(self) -> Optional[List[Equation]]:
+        "Equations of a dependency cycle, each depends on the next one, or `None`"
+        try:
+            self._order(set(range(len(self.equations))))
+        except DependencyCycleException as err:
+            return err.cycle
+        return None
+
+    def affected(self, names: Iterable[str]) -> List[Equation]:
+        "Equations to evaluate again after values of the names change, in order"
+        affected: Set[int] = set()
+        stack = [x for name in names for x in self.referrers.get(name, ())]
+        while stack:
+            idx = stack.pop()
+            if idx not in affected:
+                affected.add(idx)
+                stack += self.successors[idx]
+        return [self.equations[x] for x in self._order(affected)]
@@ -0,0 +1,116 @@
+"""
+Parse failure diagnostics
+
+A failed parse is recorded as a `Diagnostic`: the source, the failure location
+and the expected tokens. Nothing is formatted until the diagnostic is rendered,
+the parser stack walk of `ParseException.explain` is skipped altogether.
+
+Inside `collect` diagnostics are appended to a list. Otherwise they are
+reported as `ParseWarning` if warnings are enabled with `set_warnings` or
+`warn`, parse warnings are off by default.
+"""
+
+import warnings
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+from .exc import ParseWarning
+
+if TYPE_CHECKING:
+    import pyparsing as pp  # pragma: no cover
+
+_collected: Optional[List["Diagnostic"]] = None
+_warnings = False
+
+
+class Diagnostic:
+    "Location and expected tokens of a parse failure"
+    __slots__ = ("text", "loc", "expected")
+
+    def __init__(self, text: str, loc: int, expected: str):
+        self.text = text
+        self.loc = loc
+        self.expected = expected
+
+    @classmethod
+    def from_exception(cls, err: "pp.ParseException") -> "Diagnostic":
+        "Diagnostic of the parse exception"
+        return cls(err.pstr, err.loc, err.msg)
+
+    @property
+    def lineno(self) -> int:
+        "Line number of the failure, starting from 1"
+        import pyparsing as pp  # pylint: disable=import-outside-toplevel
+
+        return pp.lineno(self.loc, self.text)
+
+    @property
+    def col(self) -> int:
+        "Column of the failure, starting from 1"
+        import pyparsing as pp  # pylint: disable=import-outside-toplevel
+
+        return pp.col(self.loc, self.text)
+
+    @property
+    def line(self) -> str:
+        "Source line of the failure"
+        import pyparsing as pp  # pylint: disable=import-outside-toplevel
+
+        return pp.line(self.loc, self.text)
+
+    def render(self) -> str:
+        "Failure report: the line, a marker under the location and the message"
+        import pyparsing as pp  # pylint: disable=import-outside-toplevel
+
+        err = pp.ParseException(self.text, self.loc, self.expected)
+        return f"{self.line}\n{' ' * (self.col - 1)}^\nParseException: {err}"
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return f"Diagnostic(loc={self.loc}, expected={self.expected!r})"
+
+
+def warnings_enabled() -> bool:
+    "Are parse warnings enabled?"
+    return _warnings
+
+
+def set_warnings(enabled: bool):
+    "Enable or disable parse warnings"
+    global _warnings  # pylint: disable=global-statement
+    _warnings = enabled
+
+
+@contextmanager
+def warn(enabled: bool = True) -> Iterator[None]:
+    "Enable or disable parse warnings inside the context"
+    prev = _warnings
+    set_warnings(enabled)
+    try:
+        yield
+    finally:
+        set_warnings(prev)
+
+
+def report(diagnostic: Diagnostic, stacklevel: int = 1):
+    "Collect the diagnostic or warn about it outside of `collect`"
+    if _collected is not None:
+        _collected.append(diagnostic)
+    elif _warnings:
+        warnings.warn(
+            diagnostic.render(), category=ParseWarning, stacklevel=stacklevel + 1
+        )
+
+
+@contextmanager
+def collect() -> Iterator[List[Diagnostic]]:
+    "Collect diagnostics to the yielded list instead of warnings"
+    global _collected  # pylint: disable=global-statement
+    prev = _collected
+    _collected = []
+    try:
+        yield _collected
+    finally:
+        _collected = prev
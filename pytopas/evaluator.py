@@ -0,0 +1,310 @@
+"""
+Formula evaluation
+
+`compile_formula` turns a formula into a Python function of the values of the
+parameters it references. The formula is translated to a Python expression
+once, parameters become positional arguments and number literals are inlined,
+so names from the source never get into the compiled code. Functions are
+compiled once per expression and shared by equal formulas, like the ones of
+many `site` lines.
+
+`evaluate` is the plain tree-walking evaluator, it gives the same results and
+is used for formulas nested too deep for the Python parser.
+
+`*` and `/` share a precedence level, as do `+` and `-`, the operators of a
+level are applied from left to right, `8 / 2 * 4` is `(8 / 2) * 4`,
+`a ^ 2 ^ 3` is `(a ^ 2) ^ 3` and `a < b < c` is `(a < b) < c`, comparisons
+give booleans.
+`^` is `math.pow`, it raises `ValueError` instead of making complex numbers.
+Known TOPAS functions are `FUNCTIONS`, `If` evaluates the taken branch only.
+Constants `Pi`, `Deg` and `Rad` are `CONSTANTS`, folded `FormulaConstant`
+values of `optimize` are leaves.
+"""
+
+import math
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from .ast import (
+    BaseNode,
+    FormulaAdd,
+    FormulaConstant,
+    FormulaNode,
+    FormulaUnaryMinus,
+    FormulaUnaryPlus,
+    FunctionCallNode,
+    ParameterNode,
+    ParameterValueNode,
+)
+from .exc import EvaluateException
+
+FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "Sqrt": math.sqrt,
+    "Sin": math.sin,
+    "Cos": math.cos,
+    "Tan": math.tan,
+    "ArcSin": math.asin,
+    "ArcCos": math.acos,
+    "ArcTan": math.atan,
+    "Exp": math.exp,
+    "Ln": math.log,
+    "Abs": abs,
+    "Min": min,
+    "Max": max,
+    "Mod": math.fmod,
+}
+CONSTANTS: Dict[str, float] = {
+    "Pi": math.pi,
+    "Deg": 180 / math.pi,
+    "Rad": math.pi / 180,
+}
+# node type tag to Python operator
+OPERATORS = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+    "/": "/",
+    "^": "_pow",
+    "==": "==",
+    "!=": "!=",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+}
+# left associative in Python too, the rest is nested explicitly
+CHAINED = ("+", "-", "*", "/")
+# applied as functions
+CALLED = ("^",)
+# deeper expressions are evaluated by `evaluate`
+MAX_DEPTH = 64
+
+_apply: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": lambda x, y: x + y,
+    "-": lambda x, y: x - y,
+    "*": lambda x, y: x * y,
+    "/": lambda x, y: x / y,
+    "^": math.pow,
+    "==": lambda x, y: x == y,
+    "!=": lambda x, y: x != y,
+    "<": lambda x, y: x < y,
+    "<=": lambda x, y: x <= y,
+    ">": lambda x, y: x > y,
+    ">=": lambda x, y: x >= y,
+}
+
+
+def _children(node: Any) -> List[Any]:
+    "Operands of the formula node, `EvaluateException` if it can't be evaluated"
+    if isinstance(node, FormulaNode):
+        return [node.value]
+    if isinstance(node, FormulaConstant):
+        return []
+    if isinstance(node, FormulaUnaryPlus):
+        return [node.operand]
+    if isinstance(node, FormulaAdd) and node.type in OPERATORS:
+        return node.operands
+    if isinstance(node, FunctionCallNode):
+        if node.name != "If" and node.name not in FUNCTIONS:
+            raise EvaluateException(f"Unknown function {node.name!r}")
+        if node.name == "If" and len(node.args) != 3:
+            raise EvaluateException("If takes 3 arguments")
+        if not all(isinstance(x, FormulaNode) for x in node.args):
+            raise EvaluateException(f"Can't evaluate arguments of {node.name!r}")
+        return node.args
+    if isinstance(node, ParameterNode) and node.next is None:
+        if node.prm_name is not None:
+            return []
+        if isinstance(node.prm_value, ParameterValueNode):
+            return []
+    name = type(node).__name__ if isinstance(node, BaseNode) else repr(node)
+    raise EvaluateException(f"Can't evaluate {name}")
+
+
+def _leaf(node: ParameterNode, values: Mapping[str, Any]) -> Any:
+    if node.prm_name is None:
+        return float(node.prm_value.value)  # type: ignore[union-attr]
+    name = node.prm_name.name
+    if name in CONSTANTS:
+        return CONSTANTS[name]
+    return values[name]
+
+
+def evaluate(formula: Any, values: Mapping[str, Any]) -> Any:
+    """
+    Value of the formula node for the values of parameters
+
+    `KeyError` is raised for missing values, `EvaluateException` for formulas
+    which can't be evaluated.
+    """
+    results: List[Any] = []
+    # (node, state): 0 to visit, 1 to apply, 2 to take a branch of `If`
+    stack: List[Tuple[Any, int]] = [(formula, 0)]
+    while stack:
+        node, state = stack.pop()
+        if state == 2:
+            stack.append((node.args[1] if results.pop() else node.args[2], 0))
+            continue
+        children = _children(node)
+        if state == 0:
+            if isinstance(node, FunctionCallNode) and node.name == "If":
+                stack += [(node, 2), (children[0], 0)]
+            else:
+                stack.append((node, 1))
+                stack += [(x, 0) for x in reversed(children)]
+            continue
+        if isinstance(node, ParameterNode):
+            results.append(_leaf(node, values))
+            continue
+        if isinstance(node, FormulaConstant):
+            results.append(node.value)
+            continue
+        args = results[len(results) - len(children) :]
+        del results[len(results) - len(children) :]
+        if isinstance(node, FunctionCallNode):
+            results.append(FUNCTIONS[node.name](*args))
+        elif isinstance(node, FormulaUnaryMinus):
+            results.append(-args[0])
+        elif isinstance(node, FormulaAdd):
+            value = args[0]
+            apply = _apply[node.type]
+            for arg in args[1:]:
+                value = apply(value, arg)
+            results.append(value)
+        else:
+            results.append(args[0])
+    return results[0]
+
+
+class CompiledFormula:
+    "Formula compiled to a function of the values of the referenced parameters"
+    __slots__ = ("names", "source", "function")
+
+    def __init__(
+        self, names: Tuple[str, ...], source: Optional[str], function: Callable
+    ):
+        # parameter names in the order of the function arguments
+        self.names = names
+        # Python expression, `None` if the formula is evaluated by `evaluate`
+        self.source = source
+        self.function = function
+
+    def __repr__(self):
+        return f"CompiledFormula({self.names!r}, {self.source!r})"
+
+    def __call__(self, values: Mapping[str, Any]) -> Any:
+        "Value of the formula for the values of parameters"
+        return self.function(*[values[x] for x in self.names])
+
+
+def _number(value: float) -> str:
+    if math.isfinite(value):
+        return repr(value)
+    return f"float({str(value)!r})"
+
+
+def _emit(
+    node: Any, args: List[str], names: Dict[str, int], bound: Mapping[str, str]
+) -> str:
+    "Python expression of the node with the expressions of its children"
+    if isinstance(node, FormulaConstant):
+        return _number(node.value)
+    if isinstance(node, ParameterNode):
+        if node.prm_name is None:
+            return _number(float(node.prm_value.value))  # type: ignore[union-attr]
+        name = node.prm_name.name
+        if name in CONSTANTS:
+            return _number(CONSTANTS[name])
+        if name in bound:
+            return bound[name]
+        return f"_{names[name]}"
+    if isinstance(node, FunctionCallNode):
+        if node.name == "If":
+            return f"({args[1]} if {args[0]} else {args[2]})"
+        return f"_{node.name}({', '.join(args)})"
+    if isinstance(node, FormulaUnaryMinus):
+        return f"(-{args[0]})"
+    if isinstance(node, FormulaAdd):
+        operator = OPERATORS[node.type]
+        if node.type in CHAINED:
+            return f"({f' {operator} '.join(args)})"
+        value = args[0]
+        for arg in args[1:]:
+            if node.type in CALLED:
+                value = f"{operator}({value}, {arg})"
+            else:
+                value = f"({value} {operator} {arg})"
+        return value
+    return args[0]
+
+
+def _translate(
+    formula: Any,
+    names: Optional[Dict[str, int]] = None,
+    bound: Optional[Mapping[str, str]] = None,
+    temporaries: Optional[List[str]] = None,
+    emit: Callable[..., str] = _emit,
+) -> Tuple[Optional[str], Tuple[str, ...]]:
+    """
+    Python expression of the formula, `None` if it's too deep, and argument names
+
+    Referenced names become arguments `_0`, `_1`, ... numbered in `names`,
+    unless they are `bound` to expressions. Subexpressions of `MAX_DEPTH` are
+    appended to `temporaries` as `_t0`, `_t1`, ... if it's given, the formula
+    is never too deep then.
+    """
+    names = {} if names is None else names
+    bound = {} if bound is None else bound
+    # expressions and depths of evaluated children
+    results: List[Tuple[str, int]] = []
+    stack: List[Tuple[Any, bool]] = [(formula, False)]
+    too_deep = False
+    while stack:
+        node, visited = stack.pop()
+        children = _children(node)
+        if not visited:
+            stack.append((node, True))
+            stack += [(x, False) for x in reversed(children)]
+            continue
+        if isinstance(node, ParameterNode) and node.prm_name is not None:
+            name = node.prm_name.name
+            if name not in CONSTANTS and name not in bound:
+                names.setdefault(name, len(names))
+        args = results[len(results) - len(children) :]
+        del results[len(results) - len(children) :]
+        depth = max((x[1] for x in args), default=0) + 1
+        too_deep = too_deep or depth > MAX_DEPTH
+        source = "" if too_deep else emit(node, [x[0] for x in args], names, bound)
+        if temporaries is not None and depth >= MAX_DEPTH:
+            temporaries.append(source)
+            source, depth = f"_t{len(temporaries) - 1}", 1
+        results.append((source, depth))
+    return None if too_deep else results[0][0], tuple(names)
+
+
+@lru_cache(maxsize=4096)
+def _function(source: str, count: int) -> Callable:
+    "Compiled function of the expression of `count` arguments"
+    namespace = {f"_{name}": function for name, function in FUNCTIONS.items()}
+    namespace["_pow"] = math.pow
+    namespace["__builtins__"] = {"float": float}
+    args = ", ".join(f"_{x}" for x in range(count))
+    # the expression is made by `_emit` of numbers, operators and known names
+    return eval(f"lambda {args}: {source}", namespace)  # pylint: disable=eval-used
+
+
+def compile_formula(formula: Any) -> CompiledFormula:
+    """
+    Compile the formula node to a function of parameter values
+
+    `EvaluateException` is raised for formulas which can't be evaluated.
+    """
+    source, names = _translate(formula)
+    if source is None:
+        keys = names
+
+        def function(*args):
+            return evaluate(formula, dict(zip(keys, args)))
+
+        return CompiledFormula(names, None, function)
+    return CompiledFormula(names, source, _function(source, len(names)))
@@ -1,10 +1,11 @@
-"Common exceptions and warnings"
+"""
+Common exceptions and warnings
 
-import pyparsing as pp
+`ParseException` subclasses the exception of pyparsing, it's defined on first
+access so that importing the exceptions doesn't import pyparsing.
+"""
 
-
-class ParseException(pp.ParseException):
-    "Parse error"
+from typing import Any, List
 
 
 class ReconstructException(Exception):
@@ -13,3 +14,28 @@ class ReconstructException(Exception):
 
 class ParseWarning(RuntimeWarning):
     "Parse warning"
+
+
+class EvaluateException(Exception):
+    "Formula can't be evaluated"
+
+
+class DependencyCycleException(Exception):
+    "Equations depend on each other"
+
+    def __init__(self, cycle: List[Any]):
+        names = [str(x.name) for x in cycle]
+        super().__init__(f"Dependency cycle: {' -> '.join(names + names[:1])}")
+        self.cycle = cycle
+
+
+def __getattr__(name: str) -> Any:
+    if name != "ParseException":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import pyparsing as pp  # pylint: disable=import-outside-toplevel
+
+    class ParseException(pp.ParseException):
+        "Parse error"
+
+    globals()[name] = ParseException
+    return ParseException
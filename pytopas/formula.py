@@ -0,0 +1,250 @@
+"""
+Precedence climbing formula parser
+
+Drop-in replacement for the `infix_notation` formulas of the grammar.
+`infix_notation` creates a `Forward` with lookahead for every precedence level,
+so every operand is re-parsed on every level. Here operators are matched by
+plain string comparison, operands are parsed by the given parse element
+exactly once per position, so time is linear in the formula length.
+
+Trees are the same as `infix_notation` makes with the `fold_level` actions:
+
+* a level has one unary operator or binary operators of the same precedence,
+  like `*` and `/`, unary levels go first;
+* binary operators of a level are applied left to right, a run of the same
+  operator makes one n-ary node: `a - b - c + d` is `+(-(a, b, c), d)`;
+* arithmetic parentheses contain arithmetic expressions only,
+  comparison parentheses contain any formula.
+"""
+
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import pyparsing as pp
+
+from . import lexer
+
+WHITESPACE = frozenset(" \n\t\r")
+
+Result = Optional[Tuple[int, Any]]
+
+
+class FormulaOpDef:
+    "Operator definition, any class with the attributes of `FormulaOp` fits"
+    operator: str
+    num_operands: int
+    # `OpAssoc` of `pytopas.ast` or `pyparsing`
+    assoc: Enum
+    parse_action: Callable[[Any], Any]
+
+
+# binary operators of a level share the precedence, a single one may be bare
+OpLevel = Union[FormulaOpDef, Sequence[FormulaOpDef]]
+
+
+def fold_level(group: List[Any], make: Callable[[str, List[Any], int], Any]) -> Any:
+    """
+    Node of the operand and operator tokens of a binary level, left to right
+
+    `make(operator, tokens, last)` makes the node of a run of the same
+    operator, `last` is the index of the last operand of the run in `group`.
+    """
+    node = group[0]
+    idx = 1
+    while idx < len(group):
+        operator = group[idx]
+        run = [node]
+        while idx < len(group) and group[idx] == operator:
+            run += group[idx : idx + 2]
+            idx += 2
+        node = make(operator, run, idx - 1)
+    return node
+
+
+def _levels(levels: Sequence[OpLevel]) -> Tuple[Tuple[FormulaOpDef, ...], ...]:
+    "Levels with a tuple of operators each"
+    result = tuple(tuple(x) if isinstance(x, Sequence) else (x,) for x in levels)
+    for level in result:
+        for op in level:
+            if (op.num_operands, op.assoc.name) not in ((1, "RIGHT"), (2, "LEFT")):
+                raise ValueError(f"Unsupported operator {op.operator!r}")
+        if len(level) > 1 and any(x.num_operands != 2 for x in level):
+            raise ValueError("Unary operators need a level each")
+    return result
+
+
+class _State:
+    "State of a single formula parse"
+    __slots__ = ("instring", "do_actions", "spans", "memo")
+
+    def __init__(self, instring: str, do_actions: bool, spans: Dict[int, int]):
+        self.instring = instring
+        self.do_actions = do_actions
+        self.spans = spans
+        self.memo: Dict[Tuple[int, int], Result] = {}
+
+
+class FormulaEngine(pp.Token):
+    "Formula parse element"
+
+    ARITH = 0
+    COMP = 1
+
+    def __init__(
+        self,
+        element: pp.ParserElement,
+        arith_ops: Sequence[OpLevel],
+        comp_ops: Sequence[OpLevel],
+        lpar: str = "(",
+        rpar: str = ")",
+    ):
+        super().__init__()
+        self.element = element
+        # precedence levels, highest first
+        self.arith_ops = _levels(arith_ops)
+        self.comp_ops = _levels(comp_ops)
+        self.lpar = lpar
+        self.rpar = rpar
+        self.mayReturnEmpty = False
+        self.mayIndexError = False
+        self.errmsg = "Expected formula"
+        # called with the source, start, end and node of every operator node
+        self.node_actions: List[Callable[[str, int, int, Any], None]] = []
+
+    def ignore(self, other: pp.ParserElement) -> pp.ParserElement:
+        if not isinstance(other, pp.Suppress) or other not in self.ignoreExprs:
+            super().ignore(other)
+            self.element.ignore(self.ignoreExprs[-1])
+        return self
+
+    def recurse(self) -> List[pp.ParserElement]:
+        return [self.element]
+
+    def parseImpl(self, instring, loc, do_actions=True):
+        spans = lexer.cached_comment_spans(instring)
+        state = _State(instring, do_actions, spans)
+        result = self._expr(state, self.COMP, loc)
+        if result is None:
+            raise pp.ParseException(instring, loc, self.errmsg, self)
+        return result[0], [result[1]]
+
+    def _skip(self, state: _State, loc: int) -> int:
+        "Skip whitespace and comments"
+        instring, spans = state.instring, state.spans
+        while True:
+            while loc < len(instring) and instring[loc] in WHITESPACE:
+                loc += 1
+            end = spans.get(loc)
+            if end is None:
+                return loc
+            loc = end
+
+    def _match(self, state: _State, loc: int, literal: str) -> Optional[int]:
+        "Match literal after whitespace, return end location"
+        loc = self._skip(state, loc)
+        if state.instring.startswith(literal, loc):
+            return loc + len(literal)
+        return None
+
+    def _make(
+        self, state: _State, op: FormulaOpDef, group: List[Any], loc: int, end: int
+    ) -> Any:
+        "Make node with the operator's parse action"
+        if not state.do_actions:
+            return group
+        node = op.parse_action([group])
+        if self.node_actions:
+            start = self._skip(state, loc)
+            for action in self.node_actions:
+                action(state.instring, start, end, node)
+        return node
+
+    def _expr(self, state: _State, layer: int, loc: int) -> Result:
+        "Arithmetic or comparison expression"
+        key = (layer, loc)
+        if key not in state.memo:
+            levels = self.arith_ops if layer == self.ARITH else self.comp_ops
+            state.memo[key] = self._level(state, layer, levels, len(levels) - 1, loc)
+        return state.memo[key]
+
+    def _level(
+        self,
+        state: _State,
+        layer: int,
+        levels: Tuple[Tuple[FormulaOpDef, ...], ...],
+        idx: int,
+        loc: int,
+    ) -> Result:
+        "Expression of the precedence level `idx` and higher"
+        if idx < 0:
+            return self._operand(state, layer, loc)
+        level = levels[idx]
+
+        if level[0].num_operands == 1:
+            op = level[0]
+            op_end = self._match(state, loc, op.operator)
+            if op_end is not None:
+                result = self._level(state, layer, levels, idx, op_end)
+                if result is not None:
+                    node = self._make(
+                        state, op, [op.operator, result[1]], loc, result[0]
+                    )
+                    return result[0], node
+            return self._level(state, layer, levels, idx - 1, loc)
+
+        result = self._level(state, layer, levels, idx - 1, loc)
+        if result is None:
+            return None
+        end, first = result
+        group = [first]
+        # end of every operand of the group
+        ends = [end]
+        while True:
+            for op in level:
+                op_end = self._match(state, end, op.operator)
+                if op_end is not None:
+                    break
+            else:
+                break
+            result = self._level(state, layer, levels, idx - 1, op_end)
+            if result is None:
+                break
+            end = result[0]
+            group += [op.operator, result[1]]
+            ends += [end, end]
+        if len(group) == 1:
+            return end, first
+        by_operator = {x.operator: x for x in level}
+        node = fold_level(
+            group,
+            lambda operator, run, last: self._make(
+                state, by_operator[operator], run, loc, ends[last]
+            ),
+        )
+        return end, node
+
+    def _operand(self, state: _State, layer: int, loc: int) -> Result:
+        "Formula element, nested expression or expression in parentheses"
+        if layer == self.ARITH:
+            try:
+                end, toks = self.element._parse(  # pylint: disable=protected-access
+                    state.instring, loc, state.do_actions
+                )
+                return end, (toks[0] if state.do_actions else toks)
+            except pp.ParseException:
+                pass
+        else:
+            result = self._expr(state, self.ARITH, loc)
+            if result is not None:
+                return result
+
+        start = self._match(state, loc, self.lpar)
+        if start is None:
+            return None
+        result = self._expr(state, layer, start)
+        if result is None:
+            return None
+        end = self._match(state, result[0], self.rpar)
+        if end is None:
+            return None
+        return end, result[1]
@@ -1,12 +1,13 @@
 "Trivial grammar"
-from decimal import Decimal
-from typing import Type
+from typing import Callable, Dict, Tuple, Type
 
 import pyparsing as pp
 
-from . import ast
+from . import ast, lexer, numeric
+from .formula import FormulaEngine, fold_level
 
-# NOTE: packrat is not working!
+# NOTE: pyparsing packrat is not compatible with the left recursion,
+# use `memo` instead
 pp.ParserElement.enable_left_recursion()
 
 
@@ -27,11 +28,52 @@ line_comment = pp.Regex(r"'.*")("line_comment").suppress()
 block_comment = pp.c_style_comment("block_comment").suppress()
 
 
+class LexedComment(pp.Token):
+    """
+    Line or block comment looked up in the lexer's table
+
+    Same matches as `line_comment | block_comment`, but the source is scanned
+    only once instead of trying both regexes before every parse element.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.mayReturnEmpty = False
+        self.mayIndexError = False
+        self.errmsg = "Expected comment"
+
+    def parseImpl(self, instring, loc, do_actions=True):
+        end = lexer.cached_comment_spans(instring).get(loc)
+        if end is None:
+            raise pp.ParseException(instring, loc, self.errmsg, self)
+        return end, []
+
+
+comment = LexedComment()("comment").suppress()
+
+
 # simple numbers
 integer = pp.common.integer("integer")
 signed_integer = pp.common.signed_integer("signed_integer")
-real = pp.common.real("real").set_parse_action(pp.token_map(Decimal))
-number = (real | signed_integer)("number").set_parse_action(pp.token_map(Decimal))
+
+
+def real_action(toks: pp.ParseResults):
+    "Real number in the current numbers mode"
+    return numeric.make(toks[0])
+
+
+def signed_integer_number_action(toks: pp.ParseResults):
+    "Integer number in the current numbers mode"
+    return numeric.make_integer(toks[0])
+
+
+real = pp.common.real("real").set_parse_action(real_action)
+# the source text of the integer, not its `int` value
+number = (
+    real | pp.Regex(r"[+-]?\d+").set_parse_action(signed_integer_number_action)
+)("number")
+# same matches as `number`, but the source text is kept as is
+number_lexeme = pp.Regex(r"[+-]?(?:\d+\.\d*|\.\d+|\d+)")
 
 
 #
@@ -210,10 +252,6 @@ def make_formula_unary_op(node: Type[ast.FormulaUnaryPlus]):
     return pp.Group(operator + operand).add_parse_action(node.parse_action)
 
 
-formula_unary_plus_op = make_formula_unary_op(ast.FormulaUnaryPlus)
-formula_unary_minus_op = make_formula_unary_op(ast.FormulaUnaryMinus)
-
-
 def make_formula_binary_op(node: Type[ast.FormulaAdd]):
     "Create parsing element for binary compare operator"
     operator = pp.Literal(node.operator)("operator")
@@ -221,35 +259,86 @@ def make_formula_binary_op(node: Type[ast.FormulaAdd]):
     return pp.Group(operand + operator + operand).add_parse_action(node.parse_action)
 
 
-formula_add_op = make_formula_binary_op(ast.FormulaAdd)
-formula_sub_op = make_formula_binary_op(ast.FormulaSub)
-formula_mul_op = make_formula_binary_op(ast.FormulaMul)
-formula_div_op = make_formula_binary_op(ast.FormulaDiv)
-formula_exp_op = make_formula_binary_op(ast.FormulaExp)
-formula_eq_op = make_formula_binary_op(ast.FormulaEQ)
-formula_ne_op = make_formula_binary_op(ast.FormulaNE)
-formula_le_op = make_formula_binary_op(ast.FormulaLE)
-formula_lt_op = make_formula_binary_op(ast.FormulaLT)
-formula_ge_op = make_formula_binary_op(ast.FormulaGE)
-formula_gt_op = make_formula_binary_op(ast.FormulaGT)
+def make_infix_level(level: Tuple[Type[ast.FormulaOp], ...]):
+    "`infix_notation` operator tuple of a precedence level, see `fold_level`"
+    op = level[0]
+    assoc = pp.OpAssoc[op.assoc.name]
+    if len(level) == 1:
+        return (op.operator, op.num_operands, assoc, op.parse_action)
+    by_operator = {x.operator: x for x in level}
+
+    def action(toks: pp.ParseResults):
+        return fold_level(
+            list(toks[0]),
+            lambda operator, run, _: by_operator[operator].parse_action([run]),
+        )
+
+    operators = pp.one_of([x.operator for x in level])
+    return (operators, op.num_operands, assoc, action)
+
+
+def make_formula_arith_expr():
+    "Arithmetic formula of `infix_notation`, see `formula_engine`"
+    return pp.helpers.infix_notation(
+        formula_element,
+        [
+            make_infix_level(x)
+            # pylint: disable-next=not-an-iterable
+            for x in ast.FormulaNode.formula_arith_op_levels()
+        ],
+        lpar=LPAR.suppress(),
+        rpar=RPAR.suppress(),
+    )
+
+
+def make_formula_comp_expr():
+    "Formula of `infix_notation`, see `formula_engine`"
+    return pp.helpers.infix_notation(
+        __getattr__("formula_arith_expr"),
+        [
+            make_infix_level(x)
+            # pylint: disable-next=not-an-iterable
+            for x in ast.FormulaNode.formula_comp_op_levels()
+        ],
+    )
+
 
-formula_arith_expr = pp.helpers.infix_notation(
+# rules the root parser doesn't use are built on first access
+LAZY_RULES: Dict[str, Callable[[], pp.ParserElement]] = {
+    "formula_unary_plus_op": lambda: make_formula_unary_op(ast.FormulaUnaryPlus),
+    "formula_unary_minus_op": lambda: make_formula_unary_op(ast.FormulaUnaryMinus),
+    "formula_add_op": lambda: make_formula_binary_op(ast.FormulaAdd),
+    "formula_sub_op": lambda: make_formula_binary_op(ast.FormulaSub),
+    "formula_mul_op": lambda: make_formula_binary_op(ast.FormulaMul),
+    "formula_div_op": lambda: make_formula_binary_op(ast.FormulaDiv),
+    "formula_exp_op": lambda: make_formula_binary_op(ast.FormulaExp),
+    "formula_eq_op": lambda: make_formula_binary_op(ast.FormulaEQ),
+    "formula_ne_op": lambda: make_formula_binary_op(ast.FormulaNE),
+    "formula_le_op": lambda: make_formula_binary_op(ast.FormulaLE),
+    "formula_lt_op": lambda: make_formula_binary_op(ast.FormulaLT),
+    "formula_ge_op": lambda: make_formula_binary_op(ast.FormulaGE),
+    "formula_gt_op": lambda: make_formula_binary_op(ast.FormulaGT),
+    "formula_arith_expr": make_formula_arith_expr,
+    "formula_comp_expr": make_formula_comp_expr,
+}
+
+
+def __getattr__(name: str) -> pp.ParserElement:
+    "Lazy rule, built on first access and kept in the module"
+    if name not in LAZY_RULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in globals():
+        globals()[name] = LAZY_RULES[name]()
+    return globals()[name]
+
+
+# same trees as formula_comp_expr, but linear time
+formula_engine = FormulaEngine(
     formula_element,
-    [
-        (x.operator, x.num_operands, x.assoc, x.parse_action)
-        for x in ast.FormulaNode.formula_arith_op_clses()  # pylint: disable=not-an-iterable
-    ],
-    lpar=LPAR.suppress(),
-    rpar=RPAR.suppress(),
-)
-formula_comp_expr = pp.helpers.infix_notation(
-    formula_arith_expr,
-    [
-        (x.operator, x.num_operands, x.assoc, x.parse_action)
-        for x in ast.FormulaNode.formula_comp_op_clses()  # pylint: disable=not-an-iterable
-    ],
+    ast.FormulaNode.formula_arith_op_levels(),
+    ast.FormulaNode.formula_comp_op_levels(),
 )
-formula <<= (formula_comp_expr)("formula")
+formula <<= (formula_engine)("formula")
 formula.add_parse_action(ast.FormulaNode.parse_action)
 
 # The local keyword is used for defining named parameters
@@ -301,7 +390,9 @@ xdd_inline_data = (
     + pp.Opt(
         pp.Keyword("_xy")("xdd_data_xy").add_parse_action(lambda toks: toks[0] == "_xy")
     )
-    + number[1, ...]("xdd_data")
+    + number_lexeme[1, ...]
+    .set_parse_action(lambda toks: [numeric.parse_array(toks)])
+    .set_results_name("xdd_data")
     + pp.Literal("}").suppress()
 ).set_results_name("xdd_inline_data")
 xdd_optional = (
@@ -400,8 +491,7 @@ macro_statement = (
     | quoted_str
     | pp.OneOrMore(text, stop_on=pp.Literal("}"))  # NOTE: no nested {}
 )("macro_statement")
-macro_statement.ignore(line_comment)
-macro_statement.ignore(block_comment)
+macro_statement.ignore(comment)
 macro_body = (
     pp.Literal("{").suppress()
     + macro_statement[...]("macro_statements")
@@ -427,5 +517,4 @@ root = (
     | text
 )[...]
 root.set_parse_action(ast.RootNode.parse_action)
-root.ignore(line_comment)
-root.ignore(block_comment)
+root.ignore(comment)
@@ -0,0 +1,164 @@
+"""
+Incremental re-parse of edited sources
+
+`parse` records source offsets of every top level statement in `RootNode.spans`.
+`reparse` uses them to parse again only the statements around an edit: the parse
+starts at the statement in front of the edit and stops as soon as a statement
+ends where an old statement ended behind the edit. The old statements after it
+are reused with shifted offsets, the text there is the same.
+
+The grammar looks behind the end of a statement. Block comments and brackets
+still open at the edit may be closed by it, so the parse starts in front of the
+outermost of them. The statement in front of the start is parsed again too, and
+the parse starts even earlier while that statement changes. The result is equal
+to `RootNode.parse` of the edited source.
+"""
+
+import copy
+from bisect import bisect_left
+from typing import Any, List, NamedTuple, Optional, Tuple, Type
+
+import pyparsing as pp
+
+from . import lexer, memo, parallel
+from .ast import RootNode, TextNode
+
+
+class StatementSpan(NamedTuple):
+    "Top level statement nodes and their source offsets"
+    start: int
+    end: int
+    nodes: List[Any]
+
+
+def _build(root_cls: Type[RootNode], spans: List[StatementSpan]) -> RootNode:
+    # the root parse action concatenates text nodes in place, keep spans intact
+    nodes = [
+        copy.copy(x) if isinstance(x, TextNode) else x
+        for span in spans
+        for x in span.nodes
+    ]
+    tree = root_cls.parse_action(pp.ParseResults(nodes))
+    tree.spans = spans
+    return tree
+
+
+def _parse_from(
+    root_cls: Type[RootNode], src: str, spans: List[StatementSpan], loc: int
+) -> Tuple[List[StatementSpan], int]:
+    "Parse statements from `loc` and append them to `spans`"
+    pp.ParserElement.reset_cache()
+    with memo.parsing():
+        for start, loc, toks in parallel.iter_statements(root_cls, src, loc):
+            spans.append(StatementSpan(start, loc, toks))
+    return spans, loc
+
+
+def parse(text: str, root_cls: Type[RootNode] = RootNode) -> "RootNode | TextNode":
+    "Parse text and record statement spans for `reparse`"
+    root = root_cls.get_parser()
+    src = text if root.keepTabs else text.expandtabs()
+    spans, loc = _parse_from(root_cls, src, [], 0)
+    if root.preParse(src, loc) < len(src):
+        # syntax error: the usual fallback
+        return root_cls.parse(text)
+    return _build(root_cls, spans)
+
+
+def _expand_edit(
+    text: str, offset: int, deleted: int, inserted: str
+) -> Tuple[int, int, str]:
+    "Same edit of the text with expanded tabs: whole lines around it are replaced"
+    start = text.rfind("\n", 0, offset) + 1
+    end = text.find("\n", offset + deleted)
+    if end < 0:
+        end = len(text)
+    return (
+        len(text[:start].expandtabs()),
+        len(text[start:end].expandtabs()),
+        (text[start:offset] + inserted + text[offset + deleted : end]).expandtabs(),
+    )
+
+
+def _open_start(text: str, offset: int) -> int:
+    "Start of the outermost block comment or bracket still open at `offset`"
+    prefix = text[:offset]
+    # a comment can start at any `/*`, see `lexer.comment_spans`
+    last_close = prefix.rfind("*/")
+    start = prefix.find("/*", max(last_close - 1, 0) if last_close >= 0 else 0)
+    if start >= 0:
+        offset = start
+        prefix = text[:offset]
+    tokens = lexer.tokenize(prefix)
+    opened: List[int] = []
+    for idx, kind in enumerate(tokens.kinds):
+        if kind != lexer.TokenKind.PUNCT:
+            continue
+        value = tokens.value(idx)
+        if value in "({":
+            opened.append(tokens.starts[idx])
+        elif value in ")}" and opened:
+            opened.pop()
+    return opened[0] if opened else offset
+
+
+def _reparse_from(
+    root_cls: Type[RootNode],
+    src: str,
+    spans: List[StatementSpan],
+    index: int,
+    edit: Tuple[int, int, str],
+) -> Optional[List[StatementSpan]]:
+    """
+    Parse statements from the `index` one until they are in sync with old spans,
+    `None` if the text doesn't parse completely
+    """
+    offset, deleted, inserted = edit
+    delta = len(inserted) - deleted
+    old_ends = {x.end: idx for idx, x in enumerate(spans)}
+    result = spans[:index]
+    loc = spans[index].start
+    pp.ParserElement.reset_cache()
+    with memo.parsing():
+        for start, loc, toks in parallel.iter_statements(root_cls, src, loc):
+            result.append(StatementSpan(start, loc, toks))
+            old_idx = old_ends.get(loc - delta)
+            if loc >= offset + len(inserted) and old_idx is not None:
+                return result + [
+                    StatementSpan(x.start + delta, x.end + delta, x.nodes)
+                    for x in spans[old_idx + 1 :]
+                ]
+    # the line break at the end of text is always in sync, this is a syntax error
+    return None
+
+
+def reparse(
+    tree: "RootNode | TextNode", text: str, offset: int, deleted: int, inserted: str
+) -> "RootNode | TextNode":
+    """
+    Parse the `text` of the `tree` after replacing `deleted` characters at
+    `offset` with `inserted` text. Nodes of untouched statements are reused.
+    """
+    if offset < 0 or deleted < 0 or offset + deleted > len(text):
+        raise ValueError(f"Invalid edit at {offset} of {deleted} characters")
+    new_text = text[:offset] + inserted + text[offset + deleted :]
+    if not isinstance(tree, RootNode) or not tree.spans:
+        return parse(new_text)
+    root_cls = type(tree)
+    src = new_text
+    edit = (offset, deleted, inserted)
+    if not root_cls.get_parser().keepTabs:
+        src = new_text.expandtabs()
+        edit = _expand_edit(text, offset, deleted, inserted)
+
+    spans: List[StatementSpan] = tree.spans
+    start = _open_start(src, edit[0]) if edit[0] else 0
+    index = max(bisect_left([x.end for x in spans], start) - 1, 0)
+    while True:
+        result = _reparse_from(root_cls, src, spans, index, edit)
+        if result is None:
+            # syntax error: the usual fallback
+            return root_cls.parse(new_text)
+        if not index or result[index : index + 1] == spans[index : index + 1]:
+            return _build(root_cls, result)
+        index -= 1
@@ -0,0 +1,169 @@
+"""
+Single pass TOPAS lexer
+
+Turns source into a compact token stream: token kinds and offsets are kept
+in parallel arrays, the token text is sliced from the source on demand.
+Numbers follow the grammar's `parameter_value`: unsigned value with optional
+backtick, esd and limits suffixes. Signs are operators.
+"""
+
+import re
+from array import array
+from enum import IntEnum
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+
+class TokenKind(IntEnum):
+    "Token kind"
+    COMMENT = 0
+    LINE_BREAK = 1
+    STRING = 2
+    NUMBER = 3
+    NAME = 4
+    KEYWORD = 5
+    OPERATOR = 6
+    PUNCT = 7
+    TEXT = 8
+
+
+KEYWORDS = frozenset(
+    (
+        "axial_conv",
+        "axial_n_beta",
+        "bkg",
+        "del",
+        "existing_prm",
+        "filament_length",
+        "fullprof_format",
+        "gsas_format",
+        "gui_ignore",
+        "gui_reload",
+        "local",
+        "macro",
+        "max",
+        "min",
+        "num_runs",
+        "primary_soller_angle",
+        "prm",
+        "range",
+        "receiving_slit_length",
+        "sample_length",
+        "scale",
+        "secondary_soller_angle",
+        "stop_when",
+        "update",
+        "val_on_continue",
+        "xdd",
+        "xye_format",
+    )
+)
+
+_NUMBER = r"(?:\d+\.\d*|\.\d+|\d+)"
+_SIGNED_NUMBER = rf"[+-]?{_NUMBER}"
+TOKEN_RE = re.compile(
+    "|".join(
+        [
+            r"(?P<COMMENT>'.*|/\*(?:[^*]|\*(?!/))*\*/)",
+            r"(?P<LINE_BREAK>\n)",
+            r"(?P<WS>[^\S\n]+)",
+            r'(?P<STRING>"(?:[^"\n\r\\]|""|\\(?:[^x]|x[0-9a-fA-F]+))*")',
+            rf"(?P<NUMBER>{_NUMBER}`?(?:_{_SIGNED_NUMBER})?"
+            rf"(?:_LIMIT_M(?:IN|AX)_{_SIGNED_NUMBER}){{0,2}})",
+            r"(?P<NAME>[A-Za-z][A-Za-z0-9_]*)",
+            r"(?P<OPERATOR>==|!=|<=|>=|[-+*/^]=|[-+*/^<>=])",
+            r"(?P<PUNCT>[(){},;:!@`])",
+            r"(?P<TEXT>\S)",
+        ]
+    )
+)
+COMMENT_START_RE = re.compile(r"'|/\*")
+
+
+class Token(NamedTuple):
+    "Single token"
+    kind: TokenKind
+    start: int
+    end: int
+    value: str
+
+
+class Tokens:
+    "Compact token stream"
+    __slots__ = ("text", "kinds", "starts", "ends")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.kinds = array("B")
+        self.starts = array("l")
+        self.ends = array("l")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, idx: int) -> Token:
+        start, end = self.starts[idx], self.ends[idx]
+        return Token(TokenKind(self.kinds[idx]), start, end, self.text[start:end])
+
+    def __iter__(self) -> Iterator[Token]:
+        return (self[idx] for idx in range(len(self)))
+
+    def value(self, idx: int) -> str:
+        "Token text"
+        return self.text[self.starts[idx] : self.ends[idx]]
+
+
+def tokenize(text: str) -> Tokens:
+    "Split text to tokens, whitespace is dropped"
+    tokens = Tokens(text)
+    kinds, starts, ends = tokens.kinds, tokens.starts, tokens.ends
+    name_kind, keyword_kind = TokenKind.NAME, TokenKind.KEYWORD
+    for match in TOKEN_RE.finditer(text):
+        group = match.lastgroup
+        if group == "WS":
+            continue
+        kind = TokenKind[group]  # type: ignore[misc]
+        if kind is name_kind and match.group() in KEYWORDS:
+            kind = keyword_kind
+        kinds.append(kind)
+        starts.append(match.start())
+        ends.append(match.end())
+    return tokens
+
+
+def comment_spans(text: str) -> Dict[int, int]:
+    """
+    Start and end offsets of every comment that could be matched at some
+    position, even in the middle of other tokens, the way grammar's ignored
+    `line_comment` and `block_comment` do
+    """
+    spans = {}
+    for match in COMMENT_START_RE.finditer(text):
+        start = match.start()
+        if match.group() == "'":
+            end = text.find("\n", start)
+            spans[start] = len(text) if end < 0 else end
+        else:
+            end = text.find("*/", start + 2)
+            if end >= 0:
+                spans[start] = end + 2
+    return spans
+
+
+# source of the running parse and its comment spans, see `memo.parsing`
+_comments: Tuple[Optional[str], Dict[int, int]] = (None, {})
+
+
+def cached_comment_spans(text: str) -> Dict[int, int]:
+    "`comment_spans` of the text, kept for the next calls until the parse ends"
+    global _comments  # pylint: disable=global-statement
+    src, spans = _comments
+    if src is not text:
+        spans = comment_spans(text)
+        _comments = (text, spans)
+    return spans
+
+
+def clear_comment_cache():
+    "Forget the source and comment spans of the last parse"
+    global _comments  # pylint: disable=global-statement
+    _comments = (None, {})
@@ -0,0 +1,194 @@
+"""
+Memoized parsing compatible with the left recursion
+
+pyparsing can't use packrat and bounded recursion together, and the bounded
+recursion memo forgets a `Forward` match as soon as its search is finished.
+This module caches results of `Forward` and alternative elements like packrat
+does, but stores only results that didn't touch an unfinished left recursive
+`Forward` search.
+
+Memoization is off until `enable_memoization` is called, the command line
+tools turn it on. The cache belongs to a single `parsing()` context of a
+thread. `ParserElement._parse` is replaced only while such a context is
+active, other threads without a context parse as before, and it is restored
+when the last context exits. The source string of the parse is released when
+the context exits too.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Set, Tuple
+
+import pyparsing as pp
+
+from . import lexer
+
+DEFAULT_CACHE_SIZE = 100_000
+# alternatives are parsed again on backtracking, results of other elements are
+# cheaper to make again than to keep
+MEMO_TYPES = frozenset((pp.MatchFirst, pp.Or))
+
+
+class MemoCache:
+    "Bounded FIFO cache of parse results of a single parse"
+
+    def __init__(self, size: int):
+        self.size = size
+        self.not_in_cache = object()
+        self.data: OrderedDict[Tuple[Any, ...], Any] = OrderedDict()
+        self.active: Set[Tuple[pp.ParserElement, int]] = set()
+        self.recursions = 0
+
+    def get(self, key: Tuple[Any, ...]) -> Any:
+        "Get cached value or `not_in_cache` sentinel"
+        return self.data.get(key, self.not_in_cache)
+
+    def set(self, key: Tuple[Any, ...], value: Any):
+        "Cache value and drop the oldest one if size limit is reached"
+        data = self.data
+        data[key] = value
+        if len(data) > self.size:
+            data.popitem(last=False)
+
+    def clear(self):
+        "Forget everything"
+        self.data.clear()
+        self.active.clear()
+        self.recursions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+
+_cache_size: Optional[int] = None
+# cache of the `parsing()` context of the thread
+_local = threading.local()
+_lock = threading.Lock()
+# number of active `parsing()` contexts and `ParserElement._parse` they replaced
+_contexts = 0
+_orig_parse: Optional[Callable[..., Tuple[int, pp.ParseResults]]] = None
+
+
+def _parse_memo(
+    self: pp.ParserElement, instring: str, loc: int, do_actions=True, callPreParse=True
+) -> Tuple[int, pp.ParseResults]:
+    "Replacement for the `ParserElement._parse`"
+    # pylint: disable=invalid-name,protected-access
+    cache: Optional[MemoCache] = getattr(_local, "cache", None)
+    if cache is None:
+        assert _orig_parse is not None
+        return _orig_parse(self, instring, loc, do_actions, callPreParse)
+    if type(self) not in MEMO_TYPES and not isinstance(self, pp.Forward):
+        return self._parseNoCache(instring, loc, do_actions, callPreParse)
+    lookup = (self, instring, loc, callPreParse, do_actions)
+    value = cache.get(lookup)
+    if value is not cache.not_in_cache:
+        if isinstance(value, Exception):
+            # a raised exception keeps the frames of its traceback alive
+            raise value.__class__(*value.args)
+        return value[0], value[1].copy()
+
+    recursions = cache.recursions
+    active_key = None
+    if isinstance(self, pp.Forward):
+        active_key = (self, loc)
+        if active_key in cache.active:
+            # left recursive call: result depends on the search in progress
+            cache.recursions += 1
+            active_key = None
+        else:
+            cache.active.add(active_key)
+    try:
+        value = self._parseNoCache(instring, loc, do_actions, callPreParse)
+    except pp.ParseBaseException as err:
+        if cache.recursions == recursions:
+            cache.set(lookup, err.__class__(*err.args))
+        raise
+    finally:
+        if active_key is not None:
+            cache.active.discard(active_key)
+    if cache.recursions == recursions:
+        cache.set(lookup, (value[0], value[1].copy()))
+    return value
+
+
+def enable_memoization(cache_size_limit: int = DEFAULT_CACHE_SIZE):
+    "Enable memoized parsing with at most `cache_size_limit` cached results"
+    if cache_size_limit <= 0:
+        raise ValueError(f"Invalid cache size limit {cache_size_limit}")
+    if pp.ParserElement._packratEnabled:  # pylint: disable=protected-access
+        raise RuntimeError("pyparsing packrat is enabled already")
+    global _cache_size  # pylint: disable=global-statement
+    _cache_size = cache_size_limit
+
+
+def disable_memoization():
+    "Disable memoized parsing"
+    global _cache_size  # pylint: disable=global-statement
+    _cache_size = None
+
+
+def is_memoization_enabled() -> bool:
+    "Is memoized parsing enabled?"
+    return _cache_size is not None
+
+
+def get_cache_size_limit() -> Optional[int]:
+    "Cache size limit of memoized parsing, `None` if it's disabled"
+    return _cache_size
+
+
+def set_cache_size_limit(cache_size_limit: Optional[int]):
+    "Enable memoized parsing with the limit or disable it with `None`"
+    if cache_size_limit is None:
+        disable_memoization()
+    else:
+        enable_memoization(cache_size_limit)
+
+
+def get_cache() -> Optional[MemoCache]:
+    "Cache of the current `parsing()` context of the thread"
+    return getattr(_local, "cache", None)
+
+
+@contextmanager
+def _memoized(cache_size: int) -> Iterator[None]:
+    "Memoize parsing of the thread"
+    global _contexts, _orig_parse  # pylint: disable=global-statement
+    # pylint: disable=protected-access
+    with _lock:
+        if not _contexts:
+            _orig_parse = pp.ParserElement._parse
+            pp.ParserElement._parse = _parse_memo  # type: ignore[assignment]
+        _contexts += 1
+    _local.cache = MemoCache(cache_size)
+    try:
+        yield
+    finally:
+        _local.cache = None
+        with _lock:
+            _contexts -= 1
+            if not _contexts:
+                # kept for threads which are still in a `_parse_memo` call
+                pp.ParserElement._parse = _orig_parse  # type: ignore[assignment]
+
+
+@contextmanager
+def parsing() -> Iterator[None]:
+    """
+    Top level parse context: memoize the parse if enabled, free the cache and
+    the source kept by the lexer after
+    """
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    try:
+        if _cache_size is None or depth:
+            yield
+        else:
+            with _memoized(_cache_size):
+                yield
+    finally:
+        _local.depth = depth
+        if not depth:
+            lexer.clear_comment_cache()
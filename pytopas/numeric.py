@@ -0,0 +1,221 @@
+"""
+Numeric values of parsed sources
+
+Numbers are parsed to `Decimal` by default. The lexeme mode keeps the source
+text of every number in a `Number` instead: it is cheaper to make, `float` is
+computed only when asked for and cached, `Decimal` is made on request only.
+The text is unparsed as is, so the numbers round trip byte-exact.
+
+The mode is a context variable, every thread and asyncio task has its own.
+Switch it for a parse with `mode`.
+
+Long runs of numbers like xdd inline data are kept in a `NumberArray` in any
+mode: packed floats plus their text, no object per number. The text is the
+source text in the lexeme mode and the text of decimals in the decimal mode.
+They are serialized as a list of their text, within `packed_arrays` as the
+base64 of their little-endian doubles, which is smaller and faster to load but
+keeps the values only, not the text.
+"""
+
+import base64
+import sys
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Union, overload
+
+DECIMAL = "decimal"
+LEXEME = "lexeme"
+MODES = (DECIMAL, LEXEME)
+
+_mode: ContextVar[str] = ContextVar("pytopas_numbers_mode", default=DECIMAL)
+_packed: ContextVar[bool] = ContextVar("pytopas_packed_arrays", default=False)
+
+
+class Number:
+    "Number kept as its source text"
+    __slots__ = ("text", "_float")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._float: Optional[float] = None
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Number({self.text!r})"
+
+    def __float__(self) -> float:
+        if self._float is None:
+            self._float = float(self.text)
+        return self._float
+
+    def __bool__(self):
+        return float(self) != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Number):
+            return self.text == other.text
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def to_decimal(self) -> Decimal:
+        "Exact value of the number"
+        return Decimal(self.text)
+
+
+Numeric = Union[Decimal, Number]
+
+
+class NumberArray:
+    """
+    Packed float values of numbers with their source text
+
+    `values` supports the buffer protocol, `numpy.asarray(x.values)` is a view.
+    """
+
+    __slots__ = ("text", "values")
+
+    def __init__(self, lexemes: Iterable[str]):
+        lexemes = list(lexemes)
+        self.text = " ".join(lexemes)
+        self.values = array("d", map(float, lexemes))
+
+    @classmethod
+    def from_text(cls, text: str) -> "NumberArray":
+        "Numbers of whitespace separated text"
+        return cls(text.split())
+
+    def __len__(self):
+        return len(self.values)
+
+    @overload
+    def __getitem__(self, idx: int) -> float:
+        ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> "array[float]":
+        ...
+
+    def __getitem__(self, idx):
+        return self.values[idx]
+
+    def __iter__(self) -> Iterator[float]:
+        return iter(self.values)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"NumberArray({self.text!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, NumberArray):
+            return self.text == other.text
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def lexemes(self) -> List[str]:
+        "Source text of every number"
+        return self.text.split()
+
+    def to_decimals(self) -> List[Decimal]:
+        "Exact values of the numbers"
+        return [Decimal(x) for x in self.lexemes()]
+
+    def pack(self) -> str:
+        "Base64 of the little-endian doubles of the values"
+        values = self.values
+        if sys.byteorder == "big":
+            values = array("d", values)
+            values.byteswap()
+        return base64.b64encode(values.tobytes()).decode("ascii")
+
+    @classmethod
+    def unpack(cls, data: str) -> "NumberArray":
+        "Numbers of `pack` data, their text is the one of `make_array` numbers"
+        values = array("d", base64.b64decode(data, validate=True))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return make_array(map(repr, values))
+
+
+def get_mode() -> str:
+    "Current numbers mode"
+    return _mode.get()
+
+
+def _check(name: str):
+    if name not in MODES:
+        raise ValueError(f"Unknown numbers mode {name!r}")
+
+
+def set_mode(name: str):
+    "Parse numbers to `Decimal` or keep their lexemes from now on in this context"
+    _check(name)
+    _mode.set(name)
+
+
+def get_packed_arrays() -> bool:
+    "Whether number arrays are serialized packed"
+    return _packed.get()
+
+
+@contextmanager
+def packed_arrays(enabled: bool = True) -> Iterator[None]:
+    "Serialize number arrays as base64 of their values within the context"
+    token = _packed.set(enabled)
+    try:
+        yield
+    finally:
+        _packed.reset(token)
+
+
+@contextmanager
+def mode(name: str) -> Iterator[None]:
+    "Parse numbers in the given mode within the context"
+    _check(name)
+    token = _mode.set(name)
+    try:
+        yield
+    finally:
+        _mode.reset(token)
+
+
+def make(value: Union[str, int, float]) -> Numeric:
+    "Number of the value in the current mode"
+    if _mode.get() == LEXEME:
+        return Number(str(value))
+    return Decimal(value)
+
+
+def make_array(values: Iterable[Union[str, int, float]]) -> NumberArray:
+    "Packed numbers of the values, their text is the one of `make` numbers"
+    if _mode.get() == LEXEME:
+        return NumberArray(map(str, values))
+    return NumberArray(str(Decimal(x)) for x in values)
+
+
+def parse_array(lexemes: Iterable[str]) -> NumberArray:
+    """
+    Packed numbers of the source lexemes, in the decimal mode their text is
+    the one of `make` numbers for reals and `make_integer` ones for integers
+    """
+    if _mode.get() == LEXEME:
+        return NumberArray(lexemes)
+    return NumberArray(
+        str(Decimal(x) if "." in x else Decimal(int(x))) for x in lexemes
+    )
+
+
+def make_integer(text: str) -> Numeric:
+    "Integer number of the source text in the current mode"
+    if _mode.get() == LEXEME:
+        return Number(text)
+    # `Decimal(int(...))` drops the sign of zero and the leading zeros
+    return Decimal(int(text))
@@ -0,0 +1,247 @@
+"""
+Source offsets of parsed nodes
+
+Offsets are recorded only on request, nodes have no fields for them: the
+table keeps start and end offsets in parallel integer arrays, rows are looked
+up by the node id. Offsets refer to the text with expanded tabs.
+
+While recording, every parse element which makes nodes gets one more parse
+action. Its `loc` is the start of the match, the end is found by matching the
+element again without parse actions. The formula engine reports the nodes it
+makes itself. The first match wins: nodes are made by the innermost element,
+outer ones only pass them through. Nodes made by parse actions from other
+nodes get the offsets of their children after the parse.
+"""
+
+import dataclasses
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+import pyparsing as pp
+
+from . import ast, lexer
+from .formula import WHITESPACE, FormulaEngine
+
+Span = Tuple[int, int]
+
+# the grammar is shared, only one recording at a time
+_recording = threading.Lock()
+
+
+class OffsetTable:
+    "Start and end offsets of nodes"
+    __slots__ = ("_index", "_nodes", "starts", "ends")
+
+    def __init__(self):
+        self._index: Dict[int, int] = {}
+        # keeps recorded nodes alive, so their ids can't be reused
+        self._nodes: List[Any] = []
+        self.starts = array("l")
+        self.ends = array("l")
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node: Any) -> bool:
+        return id(node) in self._index
+
+    def __getitem__(self, node: Any) -> Span:
+        idx = self._index[id(node)]
+        return self.starts[idx], self.ends[idx]
+
+    def get(self, node: Any, default: Optional[Span] = None) -> Optional[Span]:
+        "Offsets of the node or `default`"
+        idx = self._index.get(id(node))
+        if idx is None:
+            return default
+        return self.starts[idx], self.ends[idx]
+
+    def add(self, node: Any, start: int, end: int):
+        "Add node offsets unless it's known already"
+        if id(node) in self._index:
+            return
+        self._index[id(node)] = len(self._nodes)
+        self._nodes.append(node)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def compact(self, tree: Any) -> "OffsetTable":
+        """
+        Table of the tree nodes only. Offsets cover offsets of children,
+        unknown offsets are made of them.
+        """
+        table = OffsetTable()
+        self._join_texts(tree)
+        for node in _walk(tree):
+            spans = [x for x in map(table.get, _children(node)) if x is not None]
+            span = self.get(node)
+            if span is not None:
+                spans.append(span)
+            if spans:
+                table.add(node, min(x[0] for x in spans), max(x[1] for x in spans))
+        return table
+
+    def _join_texts(self, tree: Any):
+        """
+        Extend offsets of root text nodes to the text nodes the root parse
+        action has concatenated them with
+        """
+        if not isinstance(tree, ast.RootNode):
+            return
+        # dropped text nodes are still in the table
+        texts = sorted(
+            (self.starts[idx], self.ends[idx])
+            for idx, node in enumerate(self._nodes)
+            if isinstance(node, ast.TextNode)
+        )
+        text_starts = [x[0] for x in texts]
+        # start of the next statement with known offsets
+        limit = None
+        for statement in reversed(tree.statements):
+            span = self.get(statement)
+            if span is None:
+                continue
+            if isinstance(statement, ast.TextNode):
+                last = len(texts) if limit is None else bisect_left(text_starts, limit)
+                end = max(span[1], texts[last - 1][1])
+                self.ends[self._index[id(statement)]] = end
+            limit = span[0]
+
+
+class _Recorder:
+    "Adds nodes matched by parse elements to the table"
+
+    def __init__(self, table: OffsetTable):
+        self.table = table
+        self._src: Optional[str] = None
+        self._comments: Dict[int, int] = {}
+        self._comment_ends: Dict[int, int] = {}
+
+    def _trim(self, instring: str, start: int, end: int) -> Span:
+        "Drop whitespace and comments around the match"
+        if instring is not self._src:
+            self._src = instring
+            self._comments = lexer.cached_comment_spans(instring)
+            self._comment_ends = {v: k for k, v in reversed(self._comments.items())}
+        comments, comment_ends = self._comments, self._comment_ends
+        while start < end:
+            if instring[start] in WHITESPACE:
+                start += 1
+            elif comments.get(start, end + 1) <= end:
+                start = comments[start]
+            else:
+                break
+        while start < end:
+            if instring[end - 1] in WHITESPACE:
+                end -= 1
+            elif comment_ends.get(end, -1) >= start:
+                end = comment_ends[end]
+            else:
+                break
+        return start, end
+
+    def add(self, instring: str, start: int, end: int, nodes: List[Any], trim=True):
+        "Add offsets of the nodes matched by a parse element"
+        # line end matches after the end of text
+        end = min(end, len(instring))
+        if trim:
+            # expressions report the location before whitespace and
+            # the end after optional elements which skipped it
+            start, end = self._trim(instring, start, end)
+        for node in nodes:
+            self.table.add(node, start, end)
+
+    def action(self, element: pp.ParserElement) -> Callable[..., None]:
+        "Parse action which adds the nodes made by the element"
+        trim = not isinstance(element, pp.Token)
+
+        def record(instring: str, loc: int, toks: pp.ParseResults):
+            nodes = [x for x in toks if isinstance(x, ast.BaseNode)]
+            if nodes:
+                end = element.parseImpl(instring, loc, False)[0]
+                self.add(instring, loc, end, nodes, trim)
+
+        return record
+
+    def formula_action(self, instring: str, start: int, end: int, node: Any):
+        "Node action of the formula engine"
+        self.add(instring, start, end, [node], False)
+
+
+def _children(node: Any) -> Iterator[ast.BaseNode]:
+    "Child nodes in the order of fields"
+    stack = [
+        getattr(node, x.name) for x in reversed(dataclasses.fields(node)) if x.compare
+    ]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, ast.BaseNode):
+            yield value
+        elif isinstance(value, list):
+            stack += reversed(value)
+
+
+def _walk(tree: Any) -> Iterator[ast.BaseNode]:
+    "Nodes of the tree, children go first"
+    if not isinstance(tree, ast.BaseNode):
+        return
+    stack: List[Tuple[ast.BaseNode, bool]] = [(tree, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            yield node
+            continue
+        stack.append((node, True))
+        stack += [(x, False) for x in reversed(list(_children(node)))]
+
+
+def _node_elements(element: pp.ParserElement) -> List[pp.ParserElement]:
+    "Parse elements which make nodes"
+    result = []
+    seen = set()
+    stack = [element]
+    while stack:
+        element = stack.pop()
+        if id(element) in seen:
+            continue
+        seen.add(id(element))
+        if element.parseAction or isinstance(element, FormulaEngine):
+            result.append(element)
+        stack += element.recurse()
+    return result
+
+
+@contextmanager
+def recording(node_cls: Type[ast.BaseNode] = ast.RootNode) -> Iterator[OffsetTable]:
+    "Record offsets of the nodes made by the `node_cls` parser"
+    if not _recording.acquire(blocking=False):
+        raise RuntimeError("Offsets are recorded already")
+    table = OffsetTable()
+    recorder = _Recorder(table)
+    elements = _node_elements(node_cls.get_parser())
+    saved = [x.parseAction for x in elements]
+    for element in elements:
+        if isinstance(element, FormulaEngine):
+            element.node_actions = [recorder.formula_action]
+        else:
+            element.parseAction = [*element.parseAction, recorder.action(element)]
+    try:
+        yield table
+    finally:
+        for element, actions in zip(elements, saved):
+            element.parseAction = actions
+            if isinstance(element, FormulaEngine):
+                element.node_actions = []
+        _recording.release()
+
+
+def parse(
+    text: str, node_cls: Type[ast.BaseNode] = ast.RootNode
+) -> Tuple[Any, OffsetTable]:
+    "Parse text with the `node_cls` parser, return tree and its offsets table"
+    with recording(node_cls) as table:
+        tree = node_cls.parse(text)
+    return tree, table.compact(tree)
@@ -0,0 +1,232 @@
+"""
+Formula optimization
+
+`optimize` folds constant subexpressions of the formulas of a tree and shares
+equal subexpressions between all of them, formulas are replaced in place.
+
+Plain numbers, the constants of `evaluator.CONSTANTS` and operators and known
+functions of constants are evaluated once to `FormulaConstant` values, like
+`1/4` or `Sqrt(2) * Pi`. Subexpressions which can't be evaluated, like `1/0`,
+are kept, and so are refined or fixed parameters and values with an esd or
+limits, like `@ 0.25` or `0.25_0.01`. A constant keeps its subexpression, it's
+unparsed and serialized as it was, so the source and JSON of the tree don't
+change.
+
+Nodes are hash-consed: the key of a node is its type with its field values,
+children by the identity of their shared nodes, other values by their type
+and text, so `1` and `1.0` stay apart. Equal subexpressions, like the ones of
+generated `site` lines, become a single object. Shared nodes must not be
+changed in place, a change would show up in every formula they are in.
+
+Nodes are visited with an explicit stack, formulas of any depth are fine.
+"""
+
+import dataclasses
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import evaluator, symbols
+from .ast import (
+    BaseNode,
+    FormulaConstant,
+    FormulaNode,
+    FormulaOp,
+    FunctionCallNode,
+    ParameterNode,
+    ParameterValueNode,
+)
+from .exc import EvaluateException
+
+_init_fields: Dict[type, Tuple[str, ...]] = {}
+# fields which make a parameter more than a number
+_PARAMETER_EXTRAS = (
+    "prm_min",
+    "prm_max",
+    "prm_del",
+    "prm_update",
+    "prm_stop_when",
+    "prm_val_on_continue",
+    "next",
+)
+# `isinstance` of the abstract base class is slow, results are kept by class
+_node_classes: Dict[type, bool] = {}
+
+
+def _fields(kind: type) -> Tuple[str, ...]:
+    "Names of the init fields of the node class"
+    try:
+        return _init_fields[kind]
+    except KeyError:
+        pass
+    names = tuple(x.name for x in dataclasses.fields(kind) if x.init)
+    _init_fields[kind] = names
+    return names
+
+
+def _is_node(value: Any) -> bool:
+    kind = type(value)
+    try:
+        return _node_classes[kind]
+    except KeyError:
+        pass
+    result = _node_classes[kind] = isinstance(value, (BaseNode, FormulaConstant))
+    return result
+
+
+def _is_number(node: ParameterNode) -> bool:
+    "Is the parameter a plain number or constant: not refined, no esd or limits"
+    if node.prm_name is not None and node.prm_name.name not in evaluator.CONSTANTS:
+        return False
+    if node.prm_to_be_fixed or node.prm_to_be_refined:
+        return False
+    if any(getattr(node, x) is not None for x in _PARAMETER_EXTRAS):
+        return False
+    value = node.prm_value
+    return value is None or (
+        isinstance(value, ParameterValueNode)
+        and not value.backtick
+        and value.esd is None
+        and value.lim_min is None
+        and value.lim_max is None
+    )
+
+
+def _key(value: Any) -> Any:
+    "Hashable key of a field value, nodes are shared already"
+    if _is_node(value):
+        return id(value)
+    if isinstance(value, list):
+        return tuple(_key(x) for x in value)
+    return type(value), str(value)
+
+
+def _children(node: Any) -> List[Any]:
+    "Child nodes of the node"
+    result = []
+    for name in _fields(type(node)):
+        value = getattr(node, name)
+        if isinstance(value, list):
+            result += [x for x in value if _is_node(x)]
+        elif _is_node(value):
+            result.append(value)
+    return result
+
+
+def _is_constant(node: Any) -> bool:
+    "Is the node a constant or a formula of one"
+    if isinstance(node, FormulaNode):
+        return isinstance(node.value, FormulaConstant)
+    return isinstance(node, FormulaConstant)
+
+
+def _rebuild(node: Any, replace: Callable[[Any], Any]) -> Any:
+    "Node with replaced children, the node itself if none is different"
+    values = {}
+    changed = False
+    for name in _fields(type(node)):
+        value = getattr(node, name)
+        if isinstance(value, list):
+            new = [replace(x) if _is_node(x) else x for x in value]
+            changed = changed or any(x is not y for x, y in zip(new, value))
+        elif _is_node(value):
+            new = replace(value)
+            changed = changed or new is not value
+        else:
+            new = value
+        values[name] = new
+    return type(node)(**values) if changed else node
+
+
+class Optimizer:
+    "Folds constants and shares subexpressions of formulas, the nodes are kept"
+    __slots__ = ("_nodes", "_sources")
+
+    def __init__(self):
+        # node key -> shared node
+        self._nodes: Dict[Tuple[Any, ...], Any] = {}
+        # shared formula node id -> formula node of the source of its constant
+        self._sources: Dict[int, FormulaNode] = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _share(self, node: Any) -> Any:
+        kind = type(node)
+        key = (kind, *(_key(getattr(node, x)) for x in _fields(kind)))
+        return self._nodes.setdefault(key, node)
+
+    def _source(self, node: Any) -> Any:
+        "Subexpression of a constant as it was"
+        if isinstance(node, FormulaNode):
+            return self._sources[id(node)]
+        return node.source
+
+    def _fold(self, node: Any) -> Optional[FormulaConstant]:
+        "Constant of the shared node, `None` if it isn't one"
+        if isinstance(node, ParameterNode):
+            if not _is_number(node):
+                return None
+            source = node
+        elif isinstance(node, (FormulaOp, FunctionCallNode)):
+            # arguments may be strings too
+            is_call = isinstance(node, FunctionCallNode)
+            children = node.args if is_call else _children(node)
+            if not all(_is_constant(x) for x in children):
+                return None
+            source = self._share(_rebuild(node, self._source))
+        else:
+            return None
+        try:
+            value = float(evaluator.evaluate(node, {}))
+        except (ArithmeticError, EvaluateException, TypeError, ValueError):
+            return None
+        return self._share(FormulaConstant(value=value, source=source))
+
+    def formula(self, value: Any) -> Any:
+        "Optimized formula value, made of shared nodes"
+        done: Dict[int, Any] = {}
+        # (node, its children after they are done or `None` to visit them)
+        stack: List[Tuple[Any, Optional[List[Any]]]] = [(value, None)]
+        while stack:
+            node, children = stack.pop()
+            if id(node) in done:
+                continue
+            if children is None:
+                if isinstance(node, FormulaConstant):
+                    # optimized already, the source is optimized again
+                    children = [node.source]
+                else:
+                    children = _children(node)
+                stack.append((node, children))
+                stack += [(x, None) for x in reversed(children)]
+                continue
+            if isinstance(node, FormulaConstant):
+                done[id(node)] = done[id(node.source)]
+                continue
+            shared = self._share(_rebuild(node, lambda x: done[id(x)]))
+            if isinstance(shared, FormulaNode) and _is_constant(shared):
+                source = self._share(FormulaNode(value=shared.value.source))
+                self._sources[id(shared)] = source
+            done[id(node)] = self._fold(shared) or shared
+        return done[id(value)]
+
+    def optimize(self, tree: Any) -> Any:
+        "Optimize the formulas of the tree in place, returns the tree"
+        stack = [tree]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, list):
+                stack += value
+                continue
+            names = symbols.child_fields(value)
+            if names is None:
+                continue
+            if isinstance(value, FormulaNode):
+                value.value = self.formula(value.value)
+                continue
+            stack += [getattr(value, x) for x in names]
+        return tree
+
+
+def optimize(tree: Any) -> Any:
+    "Fold constants and share subexpressions of the formulas of the tree in place"
+    return Optimizer().optimize(tree)
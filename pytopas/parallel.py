@@ -0,0 +1,266 @@
+"""
+Statement level chunking and multi-process parsing
+
+The source is cut at line breaks in front of top level statement keywords,
+outside of `{ }` blocks (macro bodies, xdd inline data) and comments.
+Chunks are parsed in a process pool and merged by the root parse action,
+so adjacent text nodes are concatenated the same way as in a single parse.
+
+The grammar is whitespace insensitive and a statement may continue on the next
+line (`bkg 1 2` followed by `prm a 1` on the next line is one `bkg` statement),
+so every cut is checked: the last statement of a chunk is parsed again in the
+full source, the cut is kept only if it ends at the same place. A rejected cut
+is moved to where that statement ends in the full source and the chunks around
+it are parsed again, they are merged only if it ends past the next cut. The
+result is the same as `RootNode.parse` of the whole source.
+
+Names and numbers after a bare name are a single statement, `iters 100000`
+followed by `xdd "a.xy"` on the next line is one, so no cut is made after such
+a run. An equation takes the whitespace after its `;`, a cut after it is made
+in front of the next keyword.
+"""
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+import pyparsing as pp
+
+from . import diagnostics, lexer, memo, numeric, stats
+from .ast import RootNode, TextNode, iter_text_nodes
+
+DEFAULT_CHUNK_SIZE = 32 * 1024
+STATEMENT_KEYWORDS = frozenset(
+    (
+        "axial_conv",
+        "bkg",
+        "existing_prm",
+        "local",
+        "macro",
+        "num_runs",
+        "prm",
+        "scale",
+        "xdd",
+    )
+)
+_SKIP_KINDS = (lexer.TokenKind.COMMENT, lexer.TokenKind.LINE_BREAK)
+_RUN_KINDS = (lexer.TokenKind.NAME, lexer.TokenKind.NUMBER, lexer.TokenKind.KEYWORD)
+
+
+@dataclass
+class ChunkResult:
+    "Statements of a parsed chunk"
+    statements: List[Any]
+    # start, end and number of tokens of the last statement
+    last: Optional[Tuple[int, int, int]]
+    # text fallbacks, offsets in the chunk
+    fallbacks: stats.ParseStats
+
+
+def split_points(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[int]:
+    "Candidate cut offsets at least `chunk_size` characters apart"
+    tokens = lexer.tokenize(text)
+    points: List[int] = []
+    depth = 0
+    last_end = -1
+    line_start = False
+    # kind of the last token of the run of names, numbers and keywords, and
+    # whether a bare name chain, a name after a name or a number, is in the run
+    run: Optional[int] = None
+    chain = False
+    semicolon = False
+    next_point = chunk_size
+    for idx, kind in enumerate(tokens.kinds):
+        if kind in _SKIP_KINDS:
+            line_start = line_start or kind == lexer.TokenKind.LINE_BREAK
+            continue
+        value = tokens.value(idx) if kind not in _RUN_KINDS else ""
+        if kind in _RUN_KINDS:
+            chain = chain or (
+                kind == lexer.TokenKind.NAME and run != lexer.TokenKind.KEYWORD
+            )
+            run = kind
+        elif value not in ("+", "-", "!"):
+            # signs and fixed flags go with the numbers and names of a run
+            run, chain = None, False
+        if value == "{":
+            depth += 1
+        elif value == "}":
+            depth = max(depth - 1, 0)
+        elif (
+            kind == lexer.TokenKind.KEYWORD
+            and line_start
+            and not (depth or chain)
+            and last_end >= next_point
+            and tokens.value(idx) in STATEMENT_KEYWORDS
+        ):
+            # cut right after the previous statement, whitespace goes forward,
+            # an equation takes the whitespace after its `;` though
+            points.append(tokens.starts[idx] if semicolon else last_end)
+            next_point = last_end + chunk_size
+        semicolon = value == ";"
+        line_start = False
+        last_end = tokens.ends[idx]
+    return points
+
+
+def iter_statements(
+    root_cls: Type[RootNode], text: str, loc: int = 0
+) -> Iterator[Tuple[int, int, List[Any]]]:
+    """
+    Parse top level statements one by one from `loc`, same loop as `ZeroOrMore`
+    of the root element. Yields start, end and tokens of every statement.
+    """
+    # pylint: disable=protected-access
+    root = root_cls.get_parser()
+    root.streamline()
+    statement = root.expr
+    while True:
+        start = root._skipIgnorables(text, loc) if loc else loc
+        try:
+            loc, toks = statement._parse(text, start)
+        except (pp.ParseException, IndexError):
+            return
+        yield start, loc, toks.as_list()
+
+
+def parse_chunk(
+    root_cls: Type[RootNode], text: str, number_mode: str = numeric.DECIMAL
+) -> Optional[ChunkResult]:
+    "Parse root statements of a chunk, `None` if it doesn't parse completely"
+    statements: List[Any] = []
+    last = None
+    loc = 0
+    pp.ParserElement.reset_cache()
+    # fallbacks are warned about by the caller, in the order of the source
+    with stats.collect() as fallbacks, diagnostics.warn(
+        False
+    ), memo.parsing(), numeric.mode(number_mode), stats.pending() as pending:
+        for start, loc, toks in iter_statements(root_cls, text):
+            statements += toks
+            if loc <= len(text):
+                last = (start, loc, len(toks))
+        if root_cls.get_parser().preParse(text, loc) < len(text):
+            return None
+        assert pending is not None
+        pending.settle(text, iter_text_nodes(statements))
+    if loc > len(text):
+        # line break matched at the end of chunk, the root parse action drops it
+        del statements[-1]
+    return ChunkResult(statements, last, fallbacks)
+
+
+def _check_cut(
+    root_cls: Type[RootNode], text: str, offset: int, cut: int, result: ChunkResult
+) -> Optional[int]:
+    """
+    Cut of the chunk from `offset` to `cut`: `cut` if its last statement ends
+    at the same place in the full text, its end there if it goes on over the
+    cut, `None` if it doesn't parse the same
+    """
+    if result.last is None:
+        return cut
+    start, end, count = result.last
+    statement = root_cls.get_parser().expr
+    # left recursion memo is keyed by location only, `parse_string` resets it too
+    pp.ParserElement.reset_cache()
+    with stats.collect(), diagnostics.warn(False), memo.parsing():
+        try:
+            # pylint: disable=protected-access
+            full_end, toks = statement._parse(text, offset + start)
+        except (pp.ParseException, IndexError):
+            return None
+    if full_end != offset + end:
+        # the statement goes on over the cut, the next one starts where it ends
+        return full_end if full_end > cut else None
+    tail = result.statements[len(result.statements) - count :]
+    return cut if toks.as_list() == tail else None
+
+
+def _chunks(bounds: List[int]) -> List[Tuple[int, int]]:
+    return list(zip(bounds, bounds[1:]))
+
+
+def _move_cuts(bounds: List[int], moved: Dict[int, Optional[int]]) -> List[int]:
+    "Bounds with the cuts moved, dropped if `None` or not between their neighbours"
+    result = [bounds[0]]
+    for idx, bound in enumerate(bounds[1:], 1):
+        cut = moved.get(bound, bound)
+        if (
+            cut is not None
+            and result[-1] < cut
+            and (idx == len(bounds) - 1 or cut < bounds[idx + 1])
+        ):
+            result.append(cut)
+    return result
+
+
+def parse(
+    text: str,
+    processes: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    root_cls: Type[RootNode] = RootNode,
+    executor: Optional[Executor] = None,
+) -> Union[RootNode, TextNode]:
+    """
+    Parse text in chunks with a pool of `processes` workers
+
+    `processes=1` parses chunks in this process, `executor` replaces the pool
+    """
+    root = root_cls.get_parser()
+    src = text if root.keepTabs else text.expandtabs()
+    bounds = [0, *split_points(src, chunk_size), len(src)]
+    if len(bounds) < 3:
+        return root_cls.parse(text)
+
+    pool = executor
+    if pool is None and processes != 1:
+        # workers don't share the memoization setting of this process
+        pool = ProcessPoolExecutor(
+            max_workers=processes or os.cpu_count(),
+            initializer=memo.set_cache_size_limit,
+            initargs=(memo.get_cache_size_limit(),),
+        )
+    results: Dict[Tuple[int, int], Optional[ChunkResult]] = {}
+    try:
+        while True:
+            todo = [x for x in _chunks(bounds) if x not in results]
+            parts = [src[start:end] for start, end in todo]
+            classes = [root_cls] * len(parts)
+            # workers don't share the numbers mode of this process
+            modes = [numeric.get_mode()] * len(parts)
+            done: Iterator[Optional[ChunkResult]] = (
+                pool.map(parse_chunk, classes, parts, modes)
+                if pool is not None
+                else map(parse_chunk, classes, parts, modes)
+            )
+            results.update(zip(todo, done))
+
+            if any(results[x] is None for x in _chunks(bounds)):
+                # syntax error: let the single parse deal with the fallback
+                return root_cls.parse(text)
+            cuts = {
+                end: _check_cut(root_cls, src, start, end, results[start, end])
+                for start, end in _chunks(bounds)[:-1]
+            }
+            cuts = {x: y for x, y in cuts.items() if y != x}
+            if not cuts:
+                break
+            bounds = _move_cuts(bounds, cuts)
+    finally:
+        if pool is not None and executor is None:
+            pool.shutdown()
+
+    statements: List[Any] = []
+    for start, end in _chunks(bounds):
+        result = results[start, end]
+        assert result is not None
+        statements += result.statements
+        fallbacks = result.fallbacks
+        for fallback_start, fallback_end in zip(fallbacks.starts, fallbacks.ends):
+            stats.record_fallback(
+                src, start + fallback_start, start + fallback_end, stacklevel=2
+            )
+    statements.append(root_cls.line_break_cls()())
+    return root_cls.parse_action(pp.ParseResults(statements))
@@ -1,21 +1,119 @@
 "TOPAS parser"
 
-from typing import Any, List
+import json
+from typing import IO, Any, List, Optional, Tuple, Union
 
-from .ast import NodeSerialized, RootNode
+from . import diagnostics, numeric, stats
+from .ast import NodeSerialized, RootNode, TextNode
+from .cache import CacheEntry, ParseCache
 
 
 class Parser:
     "TOPAS Parser"
 
     @staticmethod
-    def parse(text: str) -> NodeSerialized:
-        "Parse TOPAS source code to serialized tree"
-        tree = RootNode.parse(text)
-        return tree.serialize()
+    def parse_tree(
+        text: str, processes: Optional[int] = 1, number_mode: str = numeric.DECIMAL
+    ) -> Union[RootNode, TextNode]:
+        """
+        Parse TOPAS source code to syntax tree
+
+        Large sources are parsed in chunks by `processes` workers
+        when `processes` isn't 1, `None` means all CPUs.
+        `number_mode` is `numeric.DECIMAL` or `numeric.LEXEME`.
+        """
+        with numeric.mode(number_mode):
+            if processes == 1:
+                return RootNode.parse(text)
+            from . import parallel  # pylint: disable=import-outside-toplevel
+
+            return parallel.parse(text, processes=processes)
+
+    @staticmethod
+    def parse_cached(
+        text: str,
+        cache: ParseCache,
+        processes: Optional[int] = 1,
+        number_mode: str = numeric.DECIMAL,
+    ) -> CacheEntry:
+        """
+        Parse TOPAS source code to serialized tree unless it's in the cache
+
+        Fallbacks and diagnostics are reported after the parse or the lookup.
+        """
+        entry = cache.get(text, number_mode)
+        if entry is None:
+            with stats.collect() as parse_stats, diagnostics.collect() as collected:
+                with diagnostics.warn(False):
+                    tree = Parser.parse_tree(text, processes, number_mode)
+            entry = CacheEntry(tree.serialize(), parse_stats, collected)
+            cache.put(text, number_mode, entry)
+        entry.report(text)
+        return entry
+
+    @staticmethod
+    def parse(
+        text: str,
+        processes: Optional[int] = 1,
+        number_mode: str = numeric.DECIMAL,
+        cache: Optional[ParseCache] = None,
+    ) -> NodeSerialized:
+        "Parse TOPAS source code to serialized tree, see `parse_tree`, `parse_cached`"
+        if cache is not None:
+            return Parser.parse_cached(text, cache, processes, number_mode).tree
+        return Parser.parse_tree(text, processes, number_mode).serialize()
+
+    @staticmethod
+    def parse_with_stats(
+        text: str,
+        processes: Optional[int] = 1,
+        number_mode: str = numeric.DECIMAL,
+        cache: Optional[ParseCache] = None,
+    ) -> Tuple[NodeSerialized, stats.ParseStats]:
+        "Parse TOPAS source code to serialized tree and parse statistics"
+        with stats.collect() as parse_stats:
+            tree = Parser.parse(text, processes, number_mode, cache)
+        return tree, parse_stats
+
+    @staticmethod
+    def parse_to(
+        fp: IO[str],
+        text: str,
+        processes: Optional[int] = 1,
+        number_mode: str = numeric.DECIMAL,
+        cache: Optional[ParseCache] = None,
+    ):
+        """
+        Parse TOPAS source code and write serialized tree JSON to the file
+
+        Statements are serialized and written one by one, the output is
+        the same as `json.dumps` of the `parse` result.
+        """
+        if cache is not None:
+            json.dump(Parser.parse_cached(text, cache, processes, number_mode).tree, fp)
+            return
+        tree = Parser.parse_tree(text, processes, number_mode)
+        if not isinstance(tree, RootNode):
+            fp.write(json.dumps(tree.serialize()))
+            return
+        fp.write(f"[{json.dumps(tree.type)}")
+        for stmt in tree.statements:
+            fp.write(", ")
+            fp.write(json.dumps(stmt.serialize()))
+        fp.write("]")
 
     @staticmethod
     def reconstruct(data: List[Any]) -> str:
         "Reconstruct TOPAS source code from setialized tree"
         tree = RootNode.unserialize(data)
         return tree.unparse()
+
+    @staticmethod
+    def reconstruct_to(fp: IO[str], data: List[Any]):
+        """
+        Reconstruct TOPAS source code from serialized tree and write it to the file
+
+        Statements are unparsed and written one by one, the output is
+        the same as the `reconstruct` result.
+        """
+        RootNode.unserialize(data).unparse_to(fp)
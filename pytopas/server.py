@@ -0,0 +1,215 @@
+"""
+Long running parse daemon
+
+`pytopas serve` keeps the grammar built and warmed up and answers JSON-RPC 2.0
+requests, one JSON object per line, on stdin/stdout or a Unix socket.
+
+Methods:
+
+- `parse`: `{"text": str, "number_mode": "decimal" | "lexeme"}`, the result
+  is the serialized tree
+- `reconstruct`: `{"data": serialized tree}`, the result is the source code
+- `ping`: the result is the pytopas version
+
+Params are checked before the call, any other error of the call is an
+internal error. Requests are handled one at a time, connections of the socket
+are served by threads. A socket file is taken over only when no daemon
+answers on it, and only the socket file of the daemon is removed when it
+stops. See `pytopas.client` for the client.
+"""
+
+import errno
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import IO, Any, Callable, Dict, Optional, Tuple
+
+from . import numeric
+from .exc import ReconstructException
+from .parser import Parser
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+RECONSTRUCT_ERROR = 1
+
+# pyparsing keeps the state of a parse in class attributes
+_lock = threading.Lock()
+
+
+def _ping() -> str:
+    from . import __VERSION__  # pylint: disable=import-outside-toplevel
+
+    return __VERSION__
+
+
+def _parse(text: str, number_mode: str = numeric.DECIMAL) -> Any:
+    return Parser.parse(text, number_mode=number_mode)
+
+
+METHODS: Dict[str, Callable[..., Any]] = {
+    "parse": _parse,
+    "reconstruct": Parser.reconstruct,
+    "ping": _ping,
+}
+# method -> param -> (is it required, check of its value)
+PARAMS: Dict[str, Dict[str, Tuple[bool, Callable[[Any], bool]]]] = {
+    "parse": {
+        "text": (True, lambda x: isinstance(x, str)),
+        "number_mode": (False, lambda x: isinstance(x, str) and x in numeric.MODES),
+    },
+    "reconstruct": {"data": (True, lambda x: isinstance(x, list))},
+    "ping": {},
+}
+
+
+def _error(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": code, "message": message},
+    }
+
+
+def check_params(method: str, params: Dict[str, Any]) -> Optional[str]:
+    "Why the params don't fit the method, `None` if they do"
+    spec = PARAMS[method]
+    for name in params:
+        if name not in spec:
+            return f"unexpected param {name!r}"
+    for name, (required, check) in spec.items():
+        if name not in params:
+            if required:
+                return f"missing param {name!r}"
+        elif not check(params[name]):
+            return f"invalid param {name!r}"
+    return None
+
+
+def handle(request: Any) -> Dict[str, Any]:
+    "Response to the decoded JSON-RPC request"
+    if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+        return _error(None, INVALID_REQUEST, "Invalid Request")
+    request_id = request.get("id")
+    method = METHODS.get(request["method"])
+    if method is None:
+        return _error(request_id, METHOD_NOT_FOUND, "Method not found")
+    params = request.get("params", {})
+    if not isinstance(params, dict):
+        return _error(request_id, INVALID_PARAMS, "Invalid params")
+    reason = check_params(request["method"], params)
+    if reason is not None:
+        return _error(request_id, INVALID_PARAMS, f"Invalid params: {reason}")
+    try:
+        with _lock:
+            result = method(**params)
+    except ReconstructException as err:
+        return _error(request_id, RECONSTRUCT_ERROR, str(err))
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        # the daemon keeps serving other requests
+        return _error(request_id, INTERNAL_ERROR, f"Internal error: {err!r}")
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+
+def handle_line(line: str) -> str:
+    "Response line to the request line"
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return json.dumps(_error(None, PARSE_ERROR, "Parse error"))
+    return json.dumps(handle(request))
+
+
+def serve_stream(rfile: IO[str], wfile: IO[str]):
+    "Answer request lines of `rfile` until its end"
+    for line in rfile:
+        if not line.strip():
+            continue
+        wfile.write(f"{handle_line(line)}\n")
+        wfile.flush()
+
+
+def warm_up():
+    "Build the grammar and run every parse path once"
+    Parser.reconstruct(Parser.parse("prm a 1 macro m(x) { x } xdd { 1 2 }"))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = handle_line(line.decode("utf-8"))
+            self.wfile.write(f"{response}\n".encode("utf-8"))
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    "Daemon on a Unix socket"
+    daemon_threads = True
+    # device and inode of the socket file the daemon made
+    socket_id: Optional[Tuple[int, int]] = None
+
+    def server_bind(self):
+        super().server_bind()
+        stat = os.stat(self.server_address)
+        self.socket_id = (stat.st_dev, stat.st_ino)
+
+    def remove_socket(self):
+        "Remove the socket file unless it's another one now"
+        try:
+            stat = os.stat(self.server_address)
+            if (stat.st_dev, stat.st_ino) == self.socket_id:
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def is_listening(socket_path: str) -> bool:
+    "Does a daemon accept connections on the socket?"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+    return True
+
+
+def make_server(socket_path: str) -> UnixServer:
+    """
+    Daemon listening on the socket, a stale socket file is replaced
+
+    Raises `OSError` with `EADDRINUSE` if another daemon listens on it.
+    """
+    if is_listening(socket_path):
+        raise OSError(errno.EADDRINUSE, "A daemon listens on the socket", socket_path)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    return UnixServer(socket_path, _Handler)
+
+
+def serve(
+    socket_path: Optional[str] = None,
+    rfile: Optional[IO[str]] = None,
+    wfile: Optional[IO[str]] = None,
+):
+    """
+    Serve requests on the Unix socket or on the streams if no socket is given
+
+    The socket file is removed when the server stops, unless it was replaced.
+    """
+    warm_up()
+    if socket_path is None:
+        assert rfile is not None and wfile is not None
+        serve_stream(rfile, wfile)
+        return
+    with make_server(socket_path) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.remove_socket()
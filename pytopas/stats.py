@@ -0,0 +1,132 @@
+"""
+Parse statistics
+
+Parses inside `collect` are accounted in a `ParseStats`: text fallbacks are
+counted and their source offsets are recorded in integer arrays, nothing is
+formatted while parsing. Fallbacks are warned about as `ParseWarning` only when
+warnings are enabled, see `diagnostics.set_warnings`.
+
+The parser backtracks, and a memoized parse replays results without running
+their parse actions again, so text nodes made by parse actions may be dropped
+or made once for several places. Inside `pending` the offsets of text nodes
+are kept by node, and only the nodes of the final tree are accounted.
+"""
+
+import warnings
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import diagnostics
+from .exc import ParseWarning
+
+_collector: Optional["ParseStats"] = None
+_pending: Optional["PendingFallbacks"] = None
+
+
+class ParseStats:
+    "Text fallbacks of parses, `starts` and `ends` are source offsets"
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+
+    def __repr__(self):
+        return f"ParseStats(fallbacks={self.fallbacks})"
+
+    @property
+    def fallbacks(self) -> int:
+        "Number of text fallbacks"
+        return len(self.starts)
+
+    @property
+    def fallback_chars(self) -> int:
+        "Number of source characters parsed as text"
+        return sum(self.ends) - sum(self.starts)
+
+    def coverage(self, length: int) -> float:
+        "Share of `length` source characters parsed as anything but text"
+        return 1 - self.fallback_chars / length if length else 1.0
+
+    def record(self, start: int, end: int):
+        "Record text fallback at source offsets"
+        self.starts.append(start)
+        self.ends.append(end)
+
+
+def record_fallback(text: str, start: int, end: int, stacklevel: int = 1):
+    "Account text fallback of `text[start:end]`, warn if warnings are enabled"
+    if _collector is not None:
+        _collector.record(start, end)
+    if diagnostics.warnings_enabled():
+        warn_msg = f"TextNode: Can't parse text {text[start : 100 + start]!r}"
+        warnings.warn(warn_msg, category=ParseWarning, stacklevel=stacklevel + 1)
+
+
+class PendingFallbacks:
+    "Offsets of the text nodes of a parse in progress by node"
+    __slots__ = ("spans",)
+
+    def __init__(self):
+        # node id -> (node, its source offsets); the node keeps its id unique
+        self.spans: Dict[int, Tuple[Any, List[Tuple[int, int]]]] = {}
+
+    def add(self, node: Any, start: int, end: int):
+        "Keep the offsets of the text node"
+        self.spans[id(node)] = (node, [(start, end)])
+
+    def join(self, node: Any, other: Any):
+        "Text of `other` is appended to `node`, its offsets belong to it now"
+        joined = self.spans.get(id(other))
+        if joined is not None:
+            self.spans.setdefault(id(node), (node, []))[1].extend(joined[1])
+
+    def settle(self, text: str, nodes: Iterable[Any], stacklevel: int = 1):
+        "Account the fallbacks of the text nodes of the final tree"
+        found = [self.spans.get(id(x)) for x in nodes]
+        offsets = sorted(y for x in found if x is not None for y in x[1])
+        for start, end in offsets:
+            record_fallback(text, start, end, stacklevel=stacklevel + 1)
+
+
+def fallback(node: Any, text: str, start: int, end: int, stacklevel: int = 1):
+    "Account the text node of `text[start:end]` now or when the parse is settled"
+    if _pending is not None:
+        _pending.add(node, start, end)
+    else:
+        record_fallback(text, start, end, stacklevel=stacklevel + 1)
+
+
+def join(node: Any, other: Any):
+    "Text node `other` is merged into `node` by a parse action"
+    if _pending is not None:
+        _pending.join(node, other)
+
+
+@contextmanager
+def pending() -> Iterator[Optional[PendingFallbacks]]:
+    """
+    Keep fallbacks of a parse until it's settled with its final text nodes,
+    `None` is yielded if they are neither collected nor warned about
+    """
+    global _pending  # pylint: disable=global-statement
+    prev = _pending
+    accounted = _collector is not None or diagnostics.warnings_enabled()
+    _pending = PendingFallbacks() if accounted else None
+    try:
+        yield _pending
+    finally:
+        _pending = prev
+
+
+@contextmanager
+def collect() -> Iterator[ParseStats]:
+    "Account parses to the yielded stats"
+    global _collector  # pylint: disable=global-statement
+    prev = _collector
+    _collector = ParseStats()
+    try:
+        yield _collector
+    finally:
+        _collector = prev
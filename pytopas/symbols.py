@@ -0,0 +1,206 @@
+"""
+Parameter symbol index
+
+`SymbolIndex` maps parameter names to the sites where they are defined,
+referenced and updated, lookups are dict lookups. Sites are found in one walk
+over the tree:
+
+- definitions: named parameters of `prm`, `local`, `scale`, `bkg` and
+  `axial_conv` and named parameters with a value or a `!`/`@` flag anywhere,
+  like `x !x_w_1 0.25` of a `site`
+- references: other named parameters inside operators, function calls,
+  equations and `existing_prm` updates, and parameter names like the one of
+  `num_runs`; bare names elsewhere, like the keywords of `site Zr x`, aren't
+  sites
+- updates: `existing_prm` statements, the names in their formulas are
+  references
+
+Sites are indexed by top level statement. `replace` re-indexes replaced
+statements only, `update` finds them for a tree from `incremental.reparse`,
+statements it reuses are the same objects. Sites are kept by their statement
+and position, nodes shared by `optimize` are indexed at every place.
+"""
+
+import dataclasses
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .ast import (
+    AxialConvNode,
+    BaseNode,
+    BkgNode,
+    ExistingPrmNode,
+    FormulaConstant,
+    FormulaOp,
+    FunctionCallNode,
+    LocalNode,
+    ParameterEquationNode,
+    ParameterNameNode,
+    ParameterNode,
+    PrmNode,
+    RootNode,
+    ScaleNode,
+)
+
+DEFINITION = "definition"
+REFERENCE = "reference"
+UPDATE = "update"
+KINDS = (DEFINITION, REFERENCE, UPDATE)
+
+# direct parameter children of these nodes are definitions
+DEFINING_NODES = (LocalNode, ScaleNode, BkgNode, AxialConvNode)
+# bare parameter names inside these nodes are references
+REFERRING_NODES = (FormulaOp, FunctionCallNode, ParameterEquationNode, ExistingPrmNode)
+
+_child_fields: Dict[type, Optional[Tuple[str, ...]]] = {}
+
+
+class Site(NamedTuple):
+    "Definition, reference or update of a parameter"
+    kind: str
+    name: str
+    # `ParameterNode`, `ExistingPrmNode` or `ParameterNameNode`
+    node: BaseNode
+    # top level statement of the node
+    statement: Any
+
+
+def child_fields(value: Any) -> Optional[Tuple[str, ...]]:
+    "Names of the fields which may hold child nodes, `None` if it isn't a node"
+    kind = type(value)
+    try:
+        return _child_fields[kind]
+    except KeyError:
+        pass
+    names = None
+    # constants of `optimize` keep the subexpression they were folded from
+    if isinstance(value, (BaseNode, FormulaConstant)):
+        names = tuple(x.name for x in dataclasses.fields(value) if x.compare)
+    _child_fields[kind] = names
+    return names
+
+
+def statement_sites(statement: Any, referring: bool = False) -> Iterator[Site]:
+    "Sites of the statement in source order, `referring` for equation formulas"
+    # (value, is the value a direct child of a defining node, is it in a
+    # referring node)
+    stack: List[Tuple[Any, bool, bool]] = [(statement, False, referring)]
+    while stack:
+        value, defining, referring = stack.pop()
+        if isinstance(value, list):
+            stack += [(x, defining, referring) for x in reversed(value)]
+            continue
+        names = child_fields(value)
+        if names is None:
+            continue
+        children = [getattr(value, x) for x in names]
+        if isinstance(value, ExistingPrmNode):
+            yield Site(UPDATE, value.name.name, value, statement)
+            children = [x for x in children if x is not value.name]
+        elif isinstance(value, ParameterNode):
+            if value.prm_name is not None:
+                kind = REFERENCE if referring else None
+                if (
+                    defining
+                    or isinstance(value, PrmNode)
+                    or value.prm_value is not None
+                    or value.prm_to_be_fixed
+                    or value.prm_to_be_refined
+                ):
+                    kind = DEFINITION
+                if kind is not None:
+                    yield Site(kind, value.prm_name.name, value, statement)
+                children = [x for x in children if x is not value.prm_name]
+        elif isinstance(value, ParameterNameNode):
+            yield Site(REFERENCE, value.name, value, statement)
+        child_defining = isinstance(value, DEFINING_NODES)
+        child_referring = referring or isinstance(value, REFERRING_NODES)
+        stack += [
+            (x, child_defining, child_referring)
+            for x in reversed(children)
+            if x is not None
+        ]
+
+
+class SymbolIndex:
+    "Sites of parameter names of a tree"
+    __slots__ = ("_sites", "_statements")
+
+    def __init__(self, tree: Any = None):
+        # kind -> name -> (statement id, site position) -> site
+        self._sites: Dict[str, Dict[str, Dict[Tuple[int, int], Site]]] = {
+            x: {} for x in KINDS
+        }
+        # statement id -> statement and its sites, keeps statement ids unique
+        self._statements: Dict[int, Tuple[Any, List[Site]]] = {}
+        if tree is not None:
+            self.add_all(self._tree_statements(tree))
+
+    @staticmethod
+    def _tree_statements(tree: Any) -> List[Any]:
+        return tree.statements if isinstance(tree, RootNode) else [tree]
+
+    def __len__(self):
+        return sum(len(x) for by_name in self._sites.values() for x in by_name.values())
+
+    def __contains__(self, name: str) -> bool:
+        return any(name in x for x in self._sites.values())
+
+    def names(self) -> List[str]:
+        "Indexed parameter names"
+        return list({name: None for x in self._sites.values() for name in x})
+
+    def sites(self, name: str, kind: str) -> List[Site]:
+        "Sites of the kind of the name in the order they were indexed"
+        return list(self._sites[kind].get(name, {}).values())
+
+    def definitions(self, name: str) -> List[Site]:
+        "Definition sites of the name"
+        return self.sites(name, DEFINITION)
+
+    def references(self, name: str) -> List[Site]:
+        "Reference sites of the name"
+        return self.sites(name, REFERENCE)
+
+    def updates(self, name: str) -> List[Site]:
+        "`existing_prm` sites of the name"
+        return self.sites(name, UPDATE)
+
+    def add(self, statement: Any):
+        "Index sites of the top level statement"
+        if id(statement) in self._statements:
+            return
+        sites = list(statement_sites(statement))
+        self._statements[id(statement)] = (statement, sites)
+        for idx, site in enumerate(sites):
+            by_name = self._sites[site.kind]
+            by_name.setdefault(site.name, {})[id(statement), idx] = site
+
+    def add_all(self, statements: Iterable[Any]):
+        "Index sites of the top level statements"
+        for statement in statements:
+            self.add(statement)
+
+    def remove(self, statement: Any):
+        "Forget sites of the top level statement"
+        item = self._statements.pop(id(statement), None)
+        if item is None:
+            return
+        for idx, site in enumerate(item[1]):
+            by_name = self._sites[site.kind]
+            by_position = by_name[site.name]
+            del by_position[id(statement), idx]
+            if not by_position:
+                del by_name[site.name]
+
+    def replace(self, old: Iterable[Any], new: Iterable[Any]):
+        "Re-index replaced top level statements"
+        for statement in old:
+            self.remove(statement)
+        self.add_all(new)
+
+    def update(self, tree: Any):
+        "Re-index the statements of the tree which aren't indexed yet"
+        statements = self._tree_statements(tree)
+        current = {id(x) for x in statements}
+        removed = [x for key, (x, _) in self._statements.items() if key not in current]
+        self.replace(removed, statements)
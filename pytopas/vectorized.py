@@ -0,0 +1,179 @@
+"""
+Vectorized formula evaluation with NumPy
+
+Formulas and dependency-ordered groups of equations compile to functions of
+arrays of parameter values, every sample is evaluated in one pass of NumPy
+operations. NumPy is an optional dependency: `pip install pytopas[numpy]`.
+
+The translation is the one of `evaluator.compile_formula`. Comparisons give
+boolean masks, `If` is `numpy.where` of the masks and evaluates both branches.
+Invalid operations give `nan` and `inf` as NumPy does, without warnings.
+Subexpressions of deep formulas are assigned to temporaries, so unlike the
+scalar evaluator there is no fallback.
+
+A group of equations, like the ones of `DependencyGraph.order()` or
+`affected()`, compiles to a single function. An equation references the
+value of the last preceding equation of the name, names without one are
+arguments, `existing_prm` updates apply their operator to the previous value.
+"""
+
+from functools import lru_cache, reduce
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError as err:  # pragma: no cover
+    raise ImportError(
+        "pytopas.vectorized requires NumPy, install pytopas[numpy]"
+    ) from err
+
+from . import evaluator
+from .ast import ExistingPrmNode, FunctionCallNode
+from .dependencies import Equation
+
+FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "Sqrt": np.sqrt,
+    "Sin": np.sin,
+    "Cos": np.cos,
+    "Tan": np.tan,
+    "ArcSin": np.arcsin,
+    "ArcCos": np.arccos,
+    "ArcTan": np.arctan,
+    "Exp": np.exp,
+    "Ln": np.log,
+    "Abs": np.abs,
+    "Min": lambda *args: reduce(np.minimum, args),
+    "Max": lambda *args: reduce(np.maximum, args),
+    "Mod": np.fmod,
+}
+
+
+def _emit(node: Any, args: List[str], *context) -> str:
+    "Array expression of the node, `If` selects by the mask"
+    if isinstance(node, FunctionCallNode) and node.name == "If":
+        return f"_where({', '.join(args)})"
+    return evaluator._emit(node, args, *context)  # pylint: disable=protected-access
+
+
+def _translate(formula: Any, names, bound, temporaries) -> str:
+    source, _ = evaluator._translate(  # pylint: disable=protected-access
+        formula, names, bound, temporaries, _emit
+    )
+    return source  # type: ignore[return-value]
+
+
+def _exec(source: str) -> Callable:
+    "Function `_function` defined by the source"
+    namespace = {f"_{name}": function for name, function in FUNCTIONS.items()}
+    namespace.update(_pow=np.power, _where=np.where)
+    namespace["__builtins__"] = {"float": float}
+    # the source is made by `_emit` of numbers, operators and known names
+    exec(source, namespace)  # pylint: disable=exec-used
+    return namespace["_function"]
+
+
+# functions of single formulas are shared by equal formulas
+_function = lru_cache(maxsize=1024)(_exec)
+
+
+def _define(names: Dict[str, int], lines: List[str], result: str) -> str:
+    "Source of the function of arguments and assignments returning the result"
+    args = ", ".join(f"_{x}" for x in range(len(names)))
+    body = "".join(f"    {x}\n" for x in lines)
+    return f"def _function({args}):\n{body}    return {result}\n"
+
+
+def _arrays(names: Tuple[str, ...], values: Mapping[str, Any]) -> List[Any]:
+    return [np.asarray(values[x], dtype=float) for x in names]
+
+
+class VectorizedFormula(evaluator.CompiledFormula):
+    "Formula compiled to a function of arrays of parameter values"
+    __slots__ = ()
+
+    def __call__(self, values: Mapping[str, Any]) -> Any:
+        "Values of the formula for the arrays of parameter values"
+        with np.errstate(all="ignore"):
+            return self.function(*_arrays(self.names, values))
+
+
+class VectorizedEquations:
+    "Equations compiled to a function of arrays of parameter values"
+    __slots__ = ("equations", "names", "source", "function")
+
+    def __init__(
+        self,
+        equations: Sequence[Equation],
+        names: Tuple[str, ...],
+        source: str,
+        function: Callable,
+    ):
+        self.equations = equations
+        # names which aren't defined by the equations, the function arguments
+        self.names = names
+        self.source = source
+        self.function = function
+
+    def __repr__(self):
+        return f"VectorizedEquations({len(self.equations)}, {self.names!r})"
+
+    def __call__(self, values: Mapping[str, Any]) -> List[Any]:
+        "Values of the equations in their order for the arrays of parameter values"
+        with np.errstate(all="ignore"):
+            return self.function(*_arrays(self.names, values))
+
+    def values(self, values: Mapping[str, Any]) -> Dict[str, Any]:
+        "Parameter values updated by the values of the named equations"
+        result = dict(values)
+        for equation, value in zip(self.equations, self(values)):
+            if equation.name is not None:
+                result[equation.name] = value
+        return result
+
+
+def compile_formula(formula: Any) -> VectorizedFormula:
+    """
+    Compile the formula node to a function of arrays of parameter values
+
+    `EvaluateException` is raised for formulas which can't be evaluated.
+    """
+    names: Dict[str, int] = {}
+    lines: List[str] = []
+    source = _translate(formula, names, {}, lines)
+    lines = [f"_t{idx} = {x}" for idx, x in enumerate(lines)]
+    code = _define(names, lines, source)
+    return VectorizedFormula(tuple(names), code, _function(code))
+
+
+def compile_equations(equations: Sequence[Equation]) -> VectorizedEquations:
+    """
+    Compile equations in dependency order to a single function
+
+    `EvaluateException` is raised for formulas which can't be evaluated.
+    """
+    names: Dict[str, int] = {}
+    # names to variables of their last equations
+    bound: Dict[str, str] = {}
+    temporaries: List[str] = []
+    lines = []
+    for idx, equation in enumerate(equations):
+        start = len(temporaries)
+        source = _translate(equation.formula, names, bound, temporaries)
+        lines += [f"_t{x} = {temporaries[x]}" for x in range(start, len(temporaries))]
+        node = equation.node
+        if isinstance(node, ExistingPrmNode) and node.op != "=":
+            name = node.name.name
+            if name not in bound:
+                bound[name] = f"_{names.setdefault(name, len(names))}"
+            # the first character, the grammar accepts `*-` for `*=`
+            operator = node.op[0]
+            if operator == "^":
+                source = f"_pow({bound[name]}, {source})"
+            else:
+                source = f"({bound[name]} {operator} {source})"
+        lines.append(f"_e{idx} = {source}")
+        if equation.name is not None:
+            bound[equation.name] = f"_e{idx}"
+    result = f"[{', '.join(f'_e{x}' for x in range(len(equations)))}]"
+    code = _define(names, lines, result)
+    return VectorizedEquations(equations, tuple(names), code, _exec(code))
@@ -0,0 +1,12 @@
+"Shared fixtures"
+import pytest
+
+from pytopas import memo
+
+
+@pytest.fixture(autouse=True)
+def memo_restored():
+    "Command line tools turn memoization on, restore the setting after a test"
+    limit = memo.get_cache_size_limit()
+    yield
+    memo.set_cache_size_limit(limit)
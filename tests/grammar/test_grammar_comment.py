@@ -0,0 +1,10 @@
+"Test comment"
+
+from pytopas import grammar as g
+from tests.helpers import make_trivial_grammar_test
+
+test_comment = make_trivial_grammar_test(
+    g.comment,
+    (" ' comment", [], {}),
+    ("/* \n comment\n */", [], {}),
+)
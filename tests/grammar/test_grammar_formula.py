@@ -53,24 +53,24 @@ _test_formula1_param_formula_div = ast.FormulaDiv(
                         value=Decimal(1),
                     ),
                 ),
-                ast.FormulaAdd(
+                ast.FormulaSub(
                     operands=[
-                        ast.ParameterNode(
-                            prm_to_be_refined=True,
-                            prm_name=ast.ParameterNameNode(name="param"),
-                        ),
-                        ast.FormulaSub(
+                        ast.FormulaAdd(
                             operands=[
                                 ast.ParameterNode(
-                                    prm_value=ast.ParameterValueNode(value=Decimal(4)),
-                                    prm_min=ast.ParameterValueNode(value=Decimal(2)),
+                                    prm_to_be_refined=True,
+                                    prm_name=ast.ParameterNameNode(name="param"),
                                 ),
                                 ast.ParameterNode(
-                                    prm_name=None,
-                                    prm_value=ast.ParameterValueNode(value=Decimal(5)),
+                                    prm_value=ast.ParameterValueNode(value=Decimal(4)),
+                                    prm_min=ast.ParameterValueNode(value=Decimal(2)),
                                 ),
                             ],
                         ),
+                        ast.ParameterNode(
+                            prm_name=None,
+                            prm_value=ast.ParameterValueNode(value=Decimal(5)),
+                        ),
                     ],
                 ),
             ],
@@ -7,7 +7,7 @@ from pathlib import Path
 
 import pytest
 
-from pytopas import ast
+from pytopas import ast, diagnostics
 from pytopas.exc import ParseWarning, ReconstructException
 
 SIMPLE_DIR = Path(__file__).parent / "root"
@@ -30,7 +30,7 @@ def test_root_node(in_path: Path, json_path: Path, out_path: Path, warns):
     text_in = in_path.read_text()
     serialized = json.loads(json_path.read_text())
     text_out = out_path.read_text()
-    with warns:
+    with diagnostics.warn(), warns:
         node = ast.RootNode.parse(text_in, parse_all=True)
     assert isinstance(node, ast.RootNode)
     assert node.serialize() == serialized
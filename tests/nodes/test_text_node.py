@@ -2,14 +2,14 @@
 
 import pytest
 
-from pytopas import ast
+from pytopas import ast, diagnostics
 from pytopas.exc import ParseWarning, ReconstructException
 
 
 def test_text_node():
     "Test TextNode"
     text = "some random text"
-    with pytest.warns(ParseWarning):
+    with diagnostics.warn(), pytest.warns(ParseWarning):
         node = ast.TextNode.parse(text)
     assert node
     assert node.value == text.split(" ", maxsplit=1)[0]
@@ -18,7 +18,7 @@ def test_text_node():
     assert serialized == [node.type, text.split(" ", maxsplit=1)[0]]
     assert ast.TextNode.unserialize(serialized) == node
 
-    with pytest.warns(ParseWarning):
+    with diagnostics.warn(), pytest.warns(ParseWarning):
         text_node = ast.ParameterValueNode.parse(text)
     assert isinstance(text_node, ast.TextNode)
     assert text_node == node
@@ -27,7 +27,7 @@ def test_text_node():
 def test_text_node_dump(capsys):
     "Test TextNode"
     text = "some random text"
-    with pytest.warns(ParseWarning):
+    with diagnostics.warn(), pytest.warns(ParseWarning):
         ast.TextNode.parse(text, print_dump=True)
     captured = capsys.readouterr()
     assert "TextNode" in captured.out
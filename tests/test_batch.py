@@ -0,0 +1,97 @@
+"Test batch conversion"
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from pytopas import batch
+from pytopas.cli import _topas2json_parse_args, topas2json
+from pytopas.parser import Parser
+
+
+@pytest.fixture(name="tree")
+def fixture_tree(tmp_path: Path) -> Path:
+    "Directory of TOPAS files"
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.inp").write_text("prm a 1")
+    (tmp_path / "sub" / "b.STR").write_text("prm b 2 $%")
+    (tmp_path / "sub" / "c.txt").write_text("prm c 3")
+    return tmp_path
+
+
+def test_expand(tree: Path):
+    "Test directories and globs expansion"
+    assert batch.expand([str(tree)]) == [
+        (tree / "a.inp", Path("a.inp")),
+        (tree / "sub" / "b.STR", Path("sub/b.STR")),
+    ]
+    assert batch.expand([f"{tree}/**/*.txt", str(tree / "a.inp")]) == [
+        (tree / "sub" / "c.txt", Path("sub/c.txt")),
+        (tree / "a.inp", Path("a.inp")),
+    ]
+    assert batch.expand([f"{tree}/nothing*"]) == []
+
+
+def test_run(tree: Path):
+    "Test report lines with trees"
+    out = io.StringIO()
+    batch.run([str(tree)], out, processes=2)
+    reports = [json.loads(x) for x in out.getvalue().splitlines()]
+    expected = [str(tree / "a.inp"), str(tree / "sub/b.STR")]
+    assert [x["file"] for x in reports] == expected
+    assert reports[0]["tree"] == Parser.parse("prm a 1")
+    assert [x["fallbacks"] for x in reports] == [0, 1]
+    assert all(x["seconds"] >= 0 for x in reports)
+
+
+def test_run_output_dir(tree: Path, tmp_path_factory):
+    "Test outputs mirror the input tree"
+    output_dir = tmp_path_factory.mktemp("out")
+    out = io.StringIO()
+    batch.run([str(tree)], out, output_dir=output_dir)
+    reports = [json.loads(x) for x in out.getvalue().splitlines()]
+    output = output_dir / "sub" / "b.STR.json"
+    assert reports[1]["output"] == str(output)
+    assert "tree" not in reports[1]
+    assert json.loads(output.read_text()) == Parser.parse("prm b 2 $%")
+
+
+def test_run_error(tmp_path: Path):
+    "Test unreadable files are reported"
+    (tmp_path / "bad.inp").write_bytes(b"\xff\xfe\xfa")
+    out = io.StringIO()
+    batch.run([str(tmp_path)], out)
+    report = json.loads(out.getvalue())
+    assert report["file"] == str(tmp_path / "bad.inp")
+    assert "error" in report
+
+
+def test_run_parse_error(tmp_path: Path):
+    "Test a file that fails to parse doesn't stop the batch"
+    (tmp_path / "a.inp").write_text("prm a 1")
+    (tmp_path / "b.inp").write_text(f"prm b = {'(' * 3000}1{')' * 3000};")
+    (tmp_path / "c.inp").write_text("prm c 1")
+    output_dir = tmp_path / "out"
+    out = io.StringIO()
+    batch.run([str(tmp_path / "*.inp")], out, output_dir=output_dir)
+    reports = [json.loads(x) for x in out.getvalue().splitlines()]
+    assert ["error" in x for x in reports] == [False, True, False]
+    assert reports[1]["error"].startswith("RecursionError")
+    assert sorted(x.name for x in output_dir.iterdir()) == ["a.inp.json", "c.inp.json"]
+
+
+def test_cli_batch(capsys, monkeypatch, tree: Path, tmp_path_factory):
+    "Test topas2json batch mode"
+    monkeypatch.setenv("PYTOPAS_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+    topas2json(_topas2json_parse_args(["--batch", str(tree / "*.inp")]))
+    report = json.loads(capsys.readouterr().out)
+    assert report["tree"] == Parser.parse("prm a 1")
+
+
+def test_cli_batch_args():
+    "Test either file or batch is required"
+    with pytest.raises(SystemExit):
+        _topas2json_parse_args(["--ignore-warnings"])
+    with pytest.raises(SystemExit):
+        _topas2json_parse_args(["--batch", "a", "--", "-"])
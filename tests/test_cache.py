@@ -0,0 +1,160 @@
+"Test persistent parse cache"
+import io
+import json
+import os
+import pickle
+import time
+import warnings
+from pathlib import Path
+
+import pytest
+
+from pytopas import cache, diagnostics, numeric, stats
+from pytopas.cli import _topas2json_parse_args, topas2json
+from pytopas.exc import ParseWarning
+from pytopas.parser import Parser
+
+
+def test_key():
+    "Test content address"
+    key = cache.ParseCache.key("prm a 1", numeric.DECIMAL)
+    assert len(key) == 64
+    assert key == cache.ParseCache.key("prm a 1", numeric.DECIMAL)
+    assert key != cache.ParseCache.key("prm a 1", numeric.LEXEME)
+    assert key != cache.ParseCache.key("prm a 2", numeric.DECIMAL)
+    assert len(cache.grammar_version()) == 16
+
+
+def test_default_path(monkeypatch, tmp_path: Path):
+    "Test cache directory lookup"
+    monkeypatch.setenv("PYTOPAS_CACHE_DIR", str(tmp_path))
+    assert cache.ParseCache().path == tmp_path
+    monkeypatch.delenv("PYTOPAS_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert cache.default_path() == tmp_path / "pytopas"
+    monkeypatch.delenv("XDG_CACHE_HOME")
+    assert cache.default_path() == Path.home() / ".cache" / "pytopas"
+
+
+def test_parse_cached(monkeypatch, tmp_path: Path):
+    "Test cached results and their warnings are the same as of a parse"
+    parse_cache = cache.ParseCache(tmp_path)
+    src = "prm a 1\n$%"
+    with diagnostics.warn(), pytest.warns(ParseWarning, match="TextNode"):
+        tree, parse_stats = Parser.parse_with_stats(src, cache=parse_cache)
+    assert tree == Parser.parse(src)
+    assert parse_stats.fallbacks == 1
+
+    def fail(*_):
+        raise AssertionError("parsed again")  # pragma: no cover
+
+    monkeypatch.setattr(Parser, "parse_tree", fail)
+    with diagnostics.warn(), pytest.warns(ParseWarning, match="TextNode"):
+        assert Parser.parse_with_stats(src, cache=parse_cache)[0] == tree
+    with stats.collect() as cached_stats:
+        out = io.StringIO()
+        Parser.parse_to(out, src, cache=parse_cache)
+    assert out.getvalue() == json.dumps(tree)
+    assert list(cached_stats.ends) == [10]
+
+
+def test_cached_diagnostics(tmp_path: Path):
+    "Test parse failures are reported on hits"
+    parse_cache = cache.ParseCache(tmp_path)
+    for _ in range(2):
+        with diagnostics.collect() as collected:
+            assert Parser.parse("prm a 1\f", cache=parse_cache) == ["text", "prm"]
+        assert [x.loc for x in collected] == [7]
+        assert collected[0].text == "prm a 1\f"
+
+
+def test_bad_entries(tmp_path: Path):
+    "Test broken entries are misses and write errors are ignored"
+    parse_cache = cache.ParseCache(tmp_path)
+    key = parse_cache.key("1", numeric.DECIMAL)
+    path = parse_cache.entry_path(key)
+    path.parent.mkdir()
+    path.write_text("[")
+    assert parse_cache.get("1", numeric.DECIMAL) is None
+    path.unlink()
+    path.mkdir()
+    assert Parser.parse("1", cache=parse_cache) == Parser.parse("1")
+    assert list(path.parent.iterdir()) == [path]
+    with pytest.raises(TypeError):
+        entry = cache.CacheEntry(object(), stats.ParseStats(), [])
+        parse_cache.put("1", numeric.DECIMAL, entry)
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_evict(tmp_path: Path):
+    "Test least recently used entries are evicted"
+    parse_cache = cache.ParseCache(tmp_path)
+    sources = [f"prm a {x}" for x in range(4)]
+    for idx, src in enumerate(sources):
+        Parser.parse(src, cache=parse_cache)
+        path = parse_cache.entry_path(parse_cache.key(src, numeric.DECIMAL))
+        os.utime(path, (idx, idx))
+    parse_cache.get(sources[0], numeric.DECIMAL)
+    size = parse_cache.size()
+    parse_cache.max_size = size // 2
+    parse_cache.evict()
+    assert parse_cache.size() <= size // 2
+    assert parse_cache.get(sources[0], numeric.DECIMAL) is not None
+    assert parse_cache.get(sources[1], numeric.DECIMAL) is None
+    parse_cache.clear()
+    assert parse_cache.size() == 0
+
+
+def test_evict_marker(monkeypatch, tmp_path: Path):
+    "Test writes evict only when the marker size or age asks for it"
+    parse_cache = cache.ParseCache(tmp_path)
+    evictions = []
+    evict = cache.ParseCache.evict
+    monkeypatch.setattr(
+        cache.ParseCache, "evict", lambda self: evictions.append(evict(self))
+    )
+    Parser.parse("prm a 1", cache=parse_cache)
+    assert len(evictions) == 1
+    assert parse_cache.marker_path.read_text() == str(parse_cache.size())
+    # a pickled cache, like the one of a batch worker, finds the marker
+    restored = pickle.loads(pickle.dumps(parse_cache))
+    Parser.parse("prm a 2", cache=restored)
+    Parser.parse("prm a 3", cache=parse_cache)
+    assert len(evictions) == 1
+    restored.max_size = parse_cache.size() - 1
+    Parser.parse("prm a 4", cache=restored)
+    assert len(evictions) == 2
+    assert parse_cache.size() <= restored.max_size
+    old = time.time() - cache.EVICT_SECONDS - 1
+    os.utime(parse_cache.marker_path, (old, old))
+    Parser.parse("prm a 5", cache=parse_cache)
+    assert len(evictions) == 3
+    parse_cache.marker_path.write_text("?")
+    assert parse_cache.needs_eviction()
+    parse_cache.clear()
+    parse_cache.clear()
+    assert not parse_cache.marker_path.exists()
+    assert parse_cache.needs_eviction()
+
+
+def test_pickle(tmp_path: Path):
+    "Test cache is sent to batch workers"
+    parse_cache = cache.ParseCache(tmp_path, max_size=10)
+    restored = pickle.loads(pickle.dumps(parse_cache))
+    assert repr(restored) == repr(parse_cache)
+    assert repr(restored) == f"ParseCache({str(tmp_path)!r}, max_size=10)"
+
+
+def test_cli_cache(capsys, monkeypatch, tmp_path: Path):
+    "Test topas2json uses the cache unless asked not to"
+    monkeypatch.setenv("PYTOPAS_CACHE_DIR", str(tmp_path / "cache"))
+    src = tmp_path / "a.inp"
+    src.write_text("prm a 1")
+    topas2json(_topas2json_parse_args(["--no-cache", str(src)]))
+    assert not (tmp_path / "cache").exists()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        topas2json(_topas2json_parse_args([str(src)]))
+    assert cache.ParseCache().size() > 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == out[1] == json.dumps(Parser.parse("prm a 1"))
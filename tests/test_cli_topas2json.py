@@ -19,8 +19,11 @@ from pytopas.parser import Parser
         ("!@#$%^&*()", True, does_not_raise()),
     ],
 )
-def test_cli_topas2json(capsys, topas_in, ignore_warnings, warns):
+def test_cli_topas2json(
+    capsys, monkeypatch, tmp_path, topas_in, ignore_warnings, warns
+):
     "Test topas2json cli tool"
+    monkeypatch.setenv("PYTOPAS_CACHE_DIR", str(tmp_path))
 
     with NamedTemporaryFile() as tmp_file:
         tmp_file.write(topas_in.encode("utf-8"))
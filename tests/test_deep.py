@@ -0,0 +1,95 @@
+"Test deep trees don't hit the recursion limit"
+
+import sys
+
+import pytest
+
+from pytopas import ast
+
+DEPTH = max(sys.getrecursionlimit(), 10_000)
+
+
+def param(name: str) -> ast.ParameterNode:
+    "Named parameter"
+    return ast.ParameterNode(prm_name=ast.ParameterNameNode(name))
+
+
+def test_deep_formula():
+    "Test deeply nested formula"
+    value: ast.FormulaValue = param("x")
+    src = "x"
+    for _ in range(DEPTH):
+        value = ast.FormulaMul(
+            operands=[param("a"), ast.FormulaAdd(operands=[param("b"), value])]
+        )
+        src = f"a * ( b + {src} )"
+    tree = ast.RootNode(statements=[ast.FormulaNode(value=value)])
+
+    assert tree.unparse() == src
+    restored = ast.RootNode.unserialize(tree.serialize())
+    assert restored.unparse() == src
+
+
+def test_deep_next_chain():
+    "Test long chain of parameters"
+    node = None
+    for idx in range(DEPTH):
+        node = ast.ParameterNode(prm_name=ast.ParameterNameNode(f"p{idx}"), next=node)
+    tree = ast.RootNode(statements=[ast.BkgNode(params=[node])])
+    src = "bkg " + " ".join(f"p{idx}" for idx in reversed(range(DEPTH)))
+
+    assert tree.unparse() == src
+    restored = ast.RootNode.unserialize(tree.serialize())
+    assert restored.unparse() == src
+
+
+def test_deep_func_call():
+    "Test deeply nested function calls in a macro"
+    value: ast.FormulaValue = param("x")
+    src = "x"
+    for _ in range(DEPTH):
+        args = [ast.FormulaNode(value=value), None]
+        value = ast.FunctionCallNode(name="f", args=args)
+        src = f"f({src}, )"
+    tree = ast.MacroNode(name="m", statements=[ast.FormulaNode(value=value)])
+
+    assert tree.unparse() == f"macro m {{ {src} }}"
+    restored = ast.MacroNode.unserialize(tree.serialize())
+    assert restored.unparse() == f"macro m {{ {src} }}"
+
+
+def test_steps_override():
+    "Test classes overriding methods instead of steps"
+
+    class MyFormula(ast.FormulaNode):
+        "Formula with own methods"
+
+        def unparse(self):
+            return "my"
+
+        def serialize(self):
+            return ["formula", ["text", "my"]]
+
+    class MyRoot(ast.RootNode):
+        "Root with own formula class"
+
+        @classmethod
+        def formula_cls(cls):
+            return MyFormula
+
+    tree = ast.RootNode(statements=[MyFormula(value=param("x"))])
+    assert tree.unparse() == "my"
+    assert tree.serialize() == ["topas", ["formula", ["text", "my"]]]
+    assert MyRoot.unserialize(tree.serialize()).statements == [
+        MyFormula(value=ast.TextNode("my"))
+    ]
+
+    class Bare(ast.StepsNode):
+        "Node without steps"
+
+        @classmethod
+        def get_parser(cls):
+            return None  # pragma: no cover
+
+    with pytest.raises(TypeError, match="abstract"):
+        Bare()
@@ -0,0 +1,134 @@
+"Test equation dependency graph"
+from pathlib import Path
+
+import pytest
+
+from pytopas.ast import (
+    FormulaAdd,
+    FormulaNode,
+    ParameterEquationNode,
+    ParameterNameNode,
+    ParameterNode,
+    PrmNode,
+    RootNode,
+)
+from pytopas.dependencies import DependencyGraph
+from pytopas.exc import DependencyCycleException
+
+SRC = """prm a 1
+prm c = b + 1;
+prm b = a * 2;
+existing_prm b += b * a;
+site Zn x = c; : 0.1
+macro m(x) { prm e = x; }
+prm d = Sqrt(a) + 3;"""
+
+
+def names(equations):
+    "Names of the equations"
+    return [x.name for x in equations]
+
+
+def test_equations():
+    "Test equations and their references"
+    graph = DependencyGraph(RootNode.parse(SRC))
+    assert len(graph) == 5
+    assert [(x.name, x.references) for x in graph.equations] == [
+        ("c", ("b",)),
+        ("b", ("a",)),
+        ("b", ("b", "a")),
+        (None, ("c",)),
+        ("d", ("a",)),
+    ]
+    assert names(graph.dependencies(0)) == ["b"]
+    assert names(graph.dependencies(2)) == ["b"]
+    assert graph.cycle() is None
+
+
+def test_order():
+    "Test equations go after their dependencies, the rest in source order"
+    graph = DependencyGraph(RootNode.parse(SRC))
+    assert names(graph.order()) == ["b", "b", "c", None, "d"]
+
+
+@pytest.mark.parametrize(
+    "changed, expected",
+    [
+        (["a"], ["b", "b", "c", None, "d"]),
+        (["b"], ["b", "c", None]),
+        (["c"], [None]),
+        (["d", "nothing"], []),
+    ],
+)
+def test_affected(changed, expected):
+    "Test only equations affected by changed values are ordered"
+    graph = DependencyGraph(RootNode.parse(SRC))
+    assert names(graph.affected(changed)) == expected
+
+
+@pytest.mark.parametrize("operator", ["+=", "-=", "*-", "/=", "^="])
+def test_affected_compound(operator):
+    "Test compound updates are affected by the value they update"
+    src = f"prm a 1\nexisting_prm a {operator} 2;\nprm b = a * 3;\nprm c = 1;"
+    graph = DependencyGraph(RootNode.parse(src))
+    assert names(graph.affected(["a"])) == ["a", "b"]
+    graph = DependencyGraph(RootNode.parse("prm a 1\nexisting_prm a = 2;"))
+    assert not graph.affected(["a"])
+
+
+@pytest.mark.parametrize(
+    "src, cycle",
+    [
+        ("prm a = c; prm b = a; prm c = b + d; prm d = 1;", ["a", "c", "b"]),
+        ("prm a = a + 1;", ["a"]),
+        ("prm a = 1; existing_prm a += b; prm b = a;", ["a", "b"]),
+    ],
+)
+def test_cycle(src, cycle):
+    "Test dependency cycles are found"
+    graph = DependencyGraph(RootNode.parse(src))
+    assert names(graph.cycle()) == cycle
+    with pytest.raises(DependencyCycleException) as err:
+        graph.order()
+    assert names(err.value.cycle) == cycle
+    assert str(err.value).endswith(f"{cycle[0]}")
+    with pytest.raises(DependencyCycleException):
+        graph.affected(["d"] if "d" in src else [cycle[0]])
+
+
+def test_text_tree():
+    "Test text has no equations"
+    assert not DependencyGraph(RootNode.parse("$%")).order()
+
+
+def test_example():
+    "Test an example has no cycles"
+    file_path = Path(__file__).parent.parent / "examples" / "diffpy_example.INP"
+    graph = DependencyGraph(RootNode.parse(file_path.read_text()))
+    assert len(graph.order()) == len(graph)
+
+
+def test_scale():
+    "Test tens of thousands of equations"
+    count = 20_000
+
+    def ref(idx: int):
+        return ParameterNode(prm_name=ParameterNameNode(name=f"p{idx}"))
+
+    tree = RootNode(
+        statements=[
+            PrmNode(
+                prm_name=ParameterNameNode(name=f"p{x}"),
+                prm_value=ParameterEquationNode(
+                    formula=FormulaNode(
+                        value=FormulaAdd(operands=[ref(x - 1), ref(x // 2)])
+                    )
+                ),
+            )
+            for x in reversed(range(1, count))
+        ]
+    )
+    graph = DependencyGraph(tree)
+    assert names(graph.order()) == [f"p{x}" for x in range(1, count)]
+    # p{x} depends on p{x - 1}, the equations after it
+    assert len(graph.affected([f"p{count // 2}"])) == count // 2 - 1
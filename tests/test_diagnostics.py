@@ -0,0 +1,49 @@
+"Test parse failure diagnostics"
+
+import warnings
+
+import pytest
+
+from pytopas import ast, diagnostics
+from pytopas.exc import ParseWarning
+
+
+def test_diagnostic():
+    "Test diagnostic is rendered on demand"
+    diag = diagnostics.Diagnostic("prm a 1\nprm b (", 14, "Expected ')'")
+    assert (diag.lineno, diag.col, diag.line) == (2, 7, "prm b (")
+    assert repr(diag) == "Diagnostic(loc=14, expected=\"Expected ')'\")"
+    assert str(diag) == diag.render() == (
+        "prm b (\n"
+        "      ^\n"
+        "ParseException: Expected ')', found '('  (at char 14), (line:2, col:7)"
+    )
+
+
+def test_collect():
+    "Test failures are collected instead of warned about"
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ParseWarning)
+        # the text fallback warns on its own
+        warnings.filterwarnings("ignore", message="TextNode", category=ParseWarning)
+        with diagnostics.warn(), diagnostics.collect() as outer:
+            with diagnostics.collect() as collected:
+                node = ast.ParameterValueNode.parse("abc")
+            assert outer == []
+    assert node == ast.TextNode("abc")
+    assert len(collected) == 1
+    assert (collected[0].text, collected[0].loc) == ("abc", 0)
+    assert "Expected" in collected[0].expected
+
+
+def test_report_warns():
+    "Test failures are warned about when warnings are enabled"
+    assert not diagnostics.warnings_enabled()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ParseWarning)
+        ast.ParameterValueNode.parse("abc")
+    with diagnostics.warn():
+        assert diagnostics.warnings_enabled()
+        with pytest.warns(ParseWarning, match=r"\^\nParseException: Expected"):
+            ast.ParameterValueNode.parse("abc")
+    assert not diagnostics.warnings_enabled()
@@ -0,0 +1,102 @@
+"Test unserialize dispatch tables"
+
+import pytest
+
+from pytopas import ast, numeric
+from pytopas.exc import ReconstructException
+
+
+def test_dispatch_table():
+    "Test type tag tables are built once per class"
+    table = ast.RootNode.dispatch_table("root_statement_clses")
+    assert table["prm"] is ast.PrmNode
+    assert table["text"] is ast.TextNode
+    assert list(table) == [x.type for x in ast.RootNode.root_statement_clses()]
+    assert ast.RootNode.dispatch_table("root_statement_clses") is table
+    assert "+" in ast.FormulaNode.dispatch_table("formula_operand_clses")
+    assert "==" not in ast.FormulaNode.dispatch_table("formula_unary_operand_clses")
+
+
+def test_dispatch_override():
+    "Test subclasses with own hooks get own tables"
+    table = ast.RootNode.dispatch_table("root_statement_clses")
+
+    class MyText(ast.TextNode):
+        "Custom text node"
+
+    assert ast.RootNode.dispatch_table("root_statement_clses") is not table
+
+    class MyRoot(ast.RootNode):
+        "Root node with custom text node"
+
+        @classmethod
+        def text_cls(cls):
+            return MyText
+
+    tree = MyRoot.unserialize(["topas", ["text", "a"]])
+    assert isinstance(tree.statements[0], MyText)
+    tree = ast.RootNode.unserialize(["topas", ["text", "a"]])
+    assert type(tree.statements[0]) is ast.TextNode
+
+
+def test_dispatch_patched():
+    "Test tables are rebuilt after hooks are patched in place"
+
+    class MyText(ast.TextNode):
+        "Custom text node"
+
+    class MyRoot(ast.RootNode):
+        "Root node with patched hooks"
+
+    assert MyRoot.dispatch_table("root_statement_clses")["text"] is ast.TextNode
+    MyRoot.text_cls = classmethod(lambda cls: MyText)  # type: ignore
+    MyRoot.clear_dispatch_tables()
+    assert MyRoot.dispatch_table("root_statement_clses")["text"] is MyText
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        ["topas", ["unknown"]],
+        ["topas", [["text"], "a"]],
+        ["topas", []],
+        ["topas", 1],
+    ],
+)
+def test_unserialize_kind_errors(data):
+    "Test unknown type tags"
+    with pytest.raises(ReconstructException):
+        ast.RootNode.unserialize(data)
+
+
+@pytest.mark.parametrize("mode", numeric.MODES)
+@pytest.mark.parametrize(
+    "src",
+    [
+        "1",
+        "+1",
+        "-0",
+        "1.",
+        ".5",
+        "1.50`_0.010",
+        "1_2_LIMIT_MIN_+0.0_LIMIT_MAX_10.",
+        "1_LIMIT_MAX_3",
+        "1_LIMIT_MAX_3_LIMIT_MIN_0",
+        " 1",
+    ],
+)
+def test_parameter_value_unserialize(mode: str, src: str):
+    "Test parameter values are unserialized same as parsed"
+    with numeric.mode(mode):
+        node = ast.ParameterValueNode.unserialize(["parameter_value", src])
+        assert repr(node) == repr(ast.ParameterValueNode.parse(src))
+
+
+def test_match_unserialize():
+    "Test linear scan helper"
+    kinds = (ast.FormulaNode, ast.TextNode)
+    assert ast.BaseNode.match_unserialize(kinds, ["text", "a"]) == ast.TextNode("a")
+    with pytest.raises(ReconstructException):
+        ast.BaseNode.match_unserialize(kinds, ["prm"])
+    with pytest.raises(ReconstructException):
+        ast.BaseNode.match_unserialize(kinds, [])
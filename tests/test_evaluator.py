@@ -0,0 +1,134 @@
+"Test formula evaluation"
+import math
+
+import pytest
+
+from pytopas import ast, evaluator, numeric
+from pytopas.exc import EvaluateException
+
+VALUES = {"a": 2.0, "b": 3.0, "c": 5.0}
+
+
+def param(name: str) -> ast.ParameterNode:
+    "Named parameter"
+    return ast.ParameterNode(prm_name=ast.ParameterNameNode(name))
+
+
+@pytest.mark.parametrize(
+    "src, expected",
+    [
+        ("1/4", 0.25),
+        ("a * 2 - b - c", -4.0),
+        ("-a + +b", 1.0),
+        ("a ^ 2 ^ 3", 64.0),
+        ("a / b / c", 2 / 3 / 5),
+        ("8 / 2 * 4", 16.0),
+        ("8 / (2 * 4)", 1.0),
+        ("a / b * c", 2 / 3 * 5),
+        ("a - b + c", 4.0),
+        ("a + b - c", 0.0),
+        ("c - a - b + c", 5.0),
+        ("If(a < 1, Sqrt(-1), 3)", 3.0),
+        ("If(a == 2, c, Ln(-1))", 5.0),
+        ("Sqrt(Pi) * Deg * Rad", math.sqrt(math.pi)),
+        ("a != b", True),
+        ("a < b < c", True),
+        ("c > b > a", False),
+        ("a <= b >= c", False),
+        ("Max(a, b, c) + Min(a, c) + Mod(c, a)", 8.0),
+        ("Cos(a) + Sin(b) + Tan(c) + Exp(a) + Abs(-c)", None),
+        ("ArcSin(1 / a) + ArcCos(1 / b) + ArcTan(c)", None),
+    ],
+)
+def test_evaluate(src, expected):
+    "Test compiled and tree-walking evaluation"
+    formula = ast.FormulaNode.parse(src, parse_all=True)
+    compiled = evaluator.compile_formula(formula)
+    assert compiled.source is not None
+    result = evaluator.evaluate(formula, VALUES)
+    assert compiled(VALUES) == result
+    if expected is not None:
+        assert result == pytest.approx(expected)
+
+
+def test_names():
+    "Test arguments are referenced names, constants aren't"
+    formula = ast.FormulaNode.parse("b * Pi + a * b", parse_all=True)
+    compiled = evaluator.compile_formula(formula)
+    assert compiled.names == ("b", "a")
+    assert compiled.source == "((_0 * 3.141592653589793) + (_1 * _0))"
+    assert repr(compiled) == f"CompiledFormula(('b', 'a'), {compiled.source!r})"
+    with pytest.raises(KeyError):
+        compiled({"a": 1})
+
+
+def test_shared():
+    "Test equal formulas share the compiled function"
+    first = evaluator.compile_formula(ast.FormulaNode.parse("x_1 * 2 + y_1"))
+    second = evaluator.compile_formula(ast.FormulaNode.parse("x_2 * 2 + y_2"))
+    assert first.function is second.function
+    assert second({"x_2": 1, "y_2": 1}) == 3
+
+
+def test_lexeme_numbers():
+    "Test numbers of the lexeme mode"
+    with numeric.mode(numeric.LEXEME):
+        formula = ast.FormulaNode.parse("a * 1.5`")
+    assert evaluator.compile_formula(formula)(VALUES) == 3.0
+
+
+def test_infinite_number():
+    "Test numbers which aren't finite"
+    value = ast.ParameterNode(prm_value=ast.ParameterValueNode(value=float("inf")))
+    formula = ast.FormulaNode(value=ast.FormulaMul(operands=[param("a"), value]))
+    assert evaluator.compile_formula(formula)(VALUES) == math.inf
+
+
+@pytest.mark.parametrize(
+    "src, message",
+    [
+        ("Foo(a)", "Unknown function 'Foo'"),
+        ("If(a, b)", "If takes 3 arguments"),
+        ('Max(a, "b")', "Can't evaluate arguments of 'Max'"),
+        ("a b", "Can't evaluate ParameterNode"),
+    ],
+)
+def test_errors(src, message):
+    "Test formulas which can't be evaluated"
+    formula = ast.FormulaNode.parse(src)
+    with pytest.raises(EvaluateException, match=message):
+        evaluator.compile_formula(formula)
+    with pytest.raises(EvaluateException, match=message):
+        evaluator.evaluate(formula, VALUES)
+    with pytest.raises(EvaluateException, match="TextNode"):
+        evaluator.evaluate(ast.TextNode("$"), VALUES)
+    with pytest.raises(EvaluateException, match="'a'"):
+        evaluator.evaluate("a", VALUES)
+
+
+def test_deep():
+    "Test formulas too deep for the Python parser"
+    value: ast.FormulaValue = param("x")
+    for idx in range(10_000):
+        operand = param("a" if idx % 2 else "b")
+        value = ast.FormulaSub(operands=[operand, value])
+    formula = ast.FormulaNode(value=value)
+    compiled = evaluator.compile_formula(formula)
+    assert compiled.source is None
+    assert compiled.names == ("a", "b", "x")
+    assert compiled({"a": 1, "b": 2, "x": 3}) == evaluator.evaluate(
+        formula, {"a": 1, "b": 2, "x": 3}
+    )
+
+
+def test_zero_args():
+    "Test function calls without arguments"
+    formula = ast.FormulaNode(
+        value=ast.FormulaAdd(
+            operands=[param("a"), ast.FunctionCallNode(name="Max", args=[])]
+        )
+    )
+    with pytest.raises(TypeError):
+        evaluator.evaluate(formula, VALUES)
+    with pytest.raises(TypeError):
+        evaluator.compile_formula(formula)(VALUES)
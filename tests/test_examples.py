@@ -1,12 +1,10 @@
 "Examples tests"
-import warnings
 from pathlib import Path
 from typing import Optional
 
 import pytest
 
-from pytopas import TOPASParser, ast
-from pytopas.exc import ParseWarning
+from pytopas import TOPASParser
 
 
 @pytest.mark.parametrize(
@@ -28,31 +26,10 @@ from pytopas.exc import ParseWarning
 )
 def test_examples(file_name: str, fallbacks: Optional[int]):
     "Test examples"
-    text_cls = ast.DepsMixin.text_cls()
-    fallback_parser = text_cls.get_parser()
     file_path = Path(__file__).parent.parent / "examples" / file_name
 
     assert file_path.exists()
-    fallback_counter = 0
-    orig_debug_actions = fallback_parser.debugActions
-
-    def action(*args):
-        nonlocal fallback_counter
-        fallback_counter += 1
-        sup = orig_debug_actions.debug_match
-        if sup:
-            sup(*args)
-
-    fallback_parser.set_debug_actions(
-        start_action=orig_debug_actions.debug_try,  # type: ignore
-        success_action=action,
-        exception_action=orig_debug_actions.debug_fail,  # type: ignore
-    )
-
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=ParseWarning)
-        TOPASParser.parse(file_path.read_text())
+    _, parse_stats = TOPASParser.parse_with_stats(file_path.read_text())
 
     if fallbacks is not None:
-        assert fallbacks == fallback_counter
-    fallback_parser.debugActions = orig_debug_actions
+        assert fallbacks == parse_stats.fallbacks
@@ -0,0 +1,114 @@
+"Test precedence climbing formula parser"
+import pyparsing as pp
+import pytest
+
+from pytopas import ast
+from pytopas import grammar as g
+from pytopas.formula import FormulaEngine
+
+FORMULAS = [
+    "a",
+    "a + b",
+    "a + b - c + d",
+    "a / b * c",
+    "a * b / c",
+    "8 / 2 * 4",
+    "a - b + c",
+    "a * b / c / d * e - f + g + h",
+    "a ^ b ^ c",
+    "-a",
+    "-+a",
+    "--a",
+    "+a",
+    "a - -1",
+    "a -1",
+    "(a)",
+    "((a + b)) * c",
+    "(a < b) + 1",
+    "(a < b) == (c > d)",
+    "a < b <= c",
+    "a == b != c",
+    "f(a, b) * Sqrt(c ^ 2)",
+    "a +",
+    "a + (b",
+    "a <",
+    "!a * @ b 1",
+]
+
+
+@pytest.mark.parametrize("src", FORMULAS)
+def test_formula_engine_same_as_infix(src: str):
+    "Engine makes the same trees as infix notation"
+    expected = g.formula_comp_expr.parse_string(src)
+    result = g.formula_engine.parse_string(src)
+    assert result.as_list() == expected.as_list()
+
+
+@pytest.mark.parametrize(
+    "src, expected",
+    [
+        ("a ' comment\n + b", "a + b"),
+        ("a /* comment */ * /* c */ (b ' c\n)", "a * (b)"),
+    ],
+)
+def test_formula_engine_comments(src: str, expected: str):
+    "Comments are skipped between operators and operands"
+    result = g.formula_engine.parse_string(src, parse_all=True)
+    assert result.as_list() == g.formula_engine.parse_string(expected).as_list()
+
+
+@pytest.mark.parametrize("src", ["", "*", ")", "(a", "-+-a"])
+def test_formula_engine_fail(src: str):
+    "Invalid formulas raise parse exception"
+    with pytest.raises(pp.ParseException):
+        g.formula_engine.parse_string(src)
+
+
+def test_formula_engine_no_actions():
+    "Operators are grouped without parse actions"
+    assert g.formula_engine.matches("a * (b + c) < 1")
+    end, toks = g.formula_engine._parse(  # pylint: disable=protected-access
+        "-a * b", 0, do_actions=False
+    )
+    assert end == 6
+    assert isinstance(toks[0], list)
+
+
+def test_formula_engine_bad_operator():
+    "Only unary right and binary left operators are supported"
+    op = ast.FormulaNode.formula_arith_op_clses()[-1]
+
+    class TernaryOp(op):  # type: ignore[misc,valid-type]
+        "Bad operator"
+        num_operands = 3
+
+    with pytest.raises(ValueError):
+        FormulaEngine(g.formula_element, [TernaryOp], [])
+
+
+def test_formula_engine_unary_level():
+    "A unary operator does not share its level"
+    unary_minus = ast.FormulaNode.formula_unary_minus_cls()
+    with pytest.raises(ValueError):
+        FormulaEngine(g.formula_element, [(unary_minus, ast.FormulaSub)], [])
+
+
+def test_formula_engine_linear(monkeypatch):
+    "Operands of long formulas are parsed a number of times linear in length"
+    calls = []
+    operand = FormulaEngine._operand  # pylint: disable=protected-access
+
+    def counted(self, state, layer, loc):
+        calls.append(loc)
+        return operand(self, state, layer, loc)
+
+    monkeypatch.setattr(FormulaEngine, "_operand", counted)
+
+    def parse_calls(size: int) -> int:
+        terms = (f"(a{idx} * -(b{idx} - c) ^ d)" for idx in range(size))
+        calls.clear()
+        ast.FormulaNode.parse(" + ".join(terms) + " < e", parse_all=True)
+        return len(calls)
+
+    small, medium, large = parse_calls(100), parse_calls(200), parse_calls(400)
+    assert large - medium == 2 * (medium - small)
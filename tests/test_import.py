@@ -0,0 +1,70 @@
+"Test import cost of the package"
+import json
+import subprocess
+import sys
+
+import pyparsing as pp
+import pytest
+
+from pytopas import exc
+from pytopas import grammar as g
+from pytopas.parser import Parser
+
+# serialized tree in, reconstructed source and loaded modules out
+SCRIPT = """
+import json, sys
+import pytopas
+from pytopas.ast import RootNode
+data = json.loads(sys.argv[1])
+print(json.dumps({
+    "source": pytopas.TOPASParser.reconstruct(data),
+    "tree": RootNode.unserialize(data).serialize(),
+    "modules": sorted(sys.modules),
+}))
+"""
+SOURCE = "prm a 1\nprm b = a * 2 + 3 < 1;\nmacro m(x) { x }\nxdd { 1 2 }"
+
+
+def run_script(data) -> dict:
+    "Run the script in a fresh interpreter"
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT, json.dumps(data)],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(out)
+
+
+def test_reconstruct_without_pyparsing():
+    "Test reconstruct and unserialize don't import pyparsing or build the grammar"
+    data = Parser.parse(SOURCE)
+    result = run_script(data)
+    assert result["source"] == SOURCE
+    assert result["tree"] == data
+    modules = result["modules"]
+    assert not [x for x in modules if x.split(".")[0] == "pyparsing"]
+    assert "pytopas.grammar" not in modules
+    assert "concurrent.futures.process" not in modules
+    assert "numpy" not in modules
+
+
+def test_lazy_rules():
+    "Test rules the root parser doesn't use are built on first access"
+    rule = g.formula_comp_expr
+    assert isinstance(rule, pp.ParserElement)
+    assert g.formula_comp_expr is rule
+    assert g.__getattr__("formula_comp_expr") is rule
+    for name in g.LAZY_RULES:
+        assert getattr(g, name) is vars(g)[name]
+    with pytest.raises(AttributeError):
+        g.formula_nothing  # pylint: disable=pointless-statement
+
+
+def test_lazy_parse_exception():
+    "Test pyparsing exception subclass is defined on first access"
+    cls = exc.ParseException
+    assert issubclass(cls, pp.ParseException)
+    assert exc.ParseException is cls
+    with pytest.raises(AttributeError):
+        exc.Nothing  # pylint: disable=pointless-statement
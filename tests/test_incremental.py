@@ -0,0 +1,113 @@
+"Test incremental re-parse"
+import warnings
+from pathlib import Path
+
+import pytest
+
+from pytopas import diagnostics, incremental
+from pytopas.ast import RootNode, TextNode
+from pytopas.exc import ParseWarning
+
+EXAMPLES = sorted((Path(__file__).parent.parent / "examples").iterdir())
+
+
+@pytest.mark.parametrize(
+    "src, offset, deleted, inserted",
+    [
+        ("prm a 1\nprm b 2\nprm c 3", 8, 7, "prm b 5"),
+        ("prm a 1\nprm b 2\nprm c 3", 0, 0, "prm z 0\n"),
+        ("prm a 1\nprm b 2\nprm c 3", 23, 0, "\nprm d 4"),
+        ("prm a 1\nprm b 2\nprm c 3", 7, 8, ""),
+        # statement continues on the next line
+        ("bkg @ 1 2\nscale 2\nprm a 1", 10, 5, "3"),
+        ("bkg @ 1 2 3\nprm a 1", 9, 2, "\n"),
+        # comments and brackets opened before the edit
+        ("/* prm a 1\nprm b 2\nprm c 3", 19, 0, "*/"),
+        ("prm a 1 ' c\nprm b 2", 9, 0, "\n"),
+        ("macro m {\nprm a 1\nprm b 2\nprm c 3", 25, 0, "}"),
+        ("macro m {\nprm a 1\n}\nprm b 2", 18, 1, ""),
+        ("a = (b\n+ c\nprm d 1", 9, 0, ")"),
+        # text nodes around the edit are concatenated
+        ("$ %\nprm a 1\n$ %", 4, 8, ""),
+        # tabs are expanded
+        ("prm a 1\n\tprm b 2\t\nprm c 3", 9, 0, "\t"),
+        ("", 0, 0, "prm a 1"),
+    ],
+)
+def test_reparse(src: str, offset: int, deleted: int, inserted: str):
+    "Re-parse is the same as a full parse"
+    new_src = src[:offset] + inserted + src[offset + deleted :]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tree = incremental.parse(src)
+        assert tree == RootNode.parse(src)
+        result = incremental.reparse(tree, src, offset, deleted, inserted)
+        assert result == RootNode.parse(new_src)
+        assert result.spans == incremental.parse(new_src).spans
+
+
+@pytest.mark.parametrize("file_path", EXAMPLES, ids=[x.name for x in EXAMPLES])
+def test_reparse_examples(file_path: Path):
+    "Edit in the middle of examples"
+    text = file_path.read_text()
+    offset = text.find("\n", len(text) // 2) + 1
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tree = incremental.parse(text)
+        result = incremental.reparse(tree, text, offset, 0, "prm zz 1\n")
+        assert result == RootNode.parse(f"{text[:offset]}prm zz 1\n{text[offset:]}")
+
+
+def test_reparse_reuse():
+    "Untouched statements are reused"
+    src = "\n".join(f"prm p{x} {x}" for x in range(10))
+    tree = incremental.parse(src)
+    offset = src.index("prm p5")
+    result = incremental.reparse(tree, src, offset, 6, "prm q5")
+    assert isinstance(result, RootNode)
+    reused = [x is y for x, y in zip(tree.statements, result.statements)]
+    assert reused == [True] * 4 + [False] * 2 + [True] * 4
+
+
+def test_reparse_warnings():
+    "Only statements around the edit are parsed again"
+    src = "$ 1\nprm a 1\nprm b 2\nprm c 3"
+    with diagnostics.warn(), pytest.warns(ParseWarning):
+        tree = incremental.parse(src)
+    with diagnostics.warn(), warnings.catch_warnings(record=True) as warns:
+        warnings.simplefilter("always")
+        result = incremental.reparse(tree, src, 18, 1, "(")
+    assert len(warns) == 1
+    with diagnostics.warn(), pytest.warns(ParseWarning):
+        assert result == RootNode.parse("$ 1\nprm a 1\nprm b (\nprm c 3")
+
+
+def test_reparse_syntax_error():
+    "Falls back to the full parse"
+    src = "prm a 1\nprm b 2"
+    tree = incremental.parse(src)
+    with diagnostics.warn(), pytest.warns(ParseWarning):
+        result = incremental.reparse(tree, src, 7, 0, "\f")
+    assert isinstance(result, TextNode)
+    with diagnostics.warn(), pytest.warns(ParseWarning):
+        assert incremental.parse("prm a 1\f") == RootNode.parse("prm a 1\f")
+    assert incremental.reparse(result, "prm a 1\f", 7, 1, "") == RootNode.parse(
+        "prm a 1"
+    )
+
+
+def test_reparse_without_spans():
+    "Trees of the usual parse are parsed in full"
+    tree = RootNode.parse("prm a 1")
+    assert tree.spans is None
+    result = incremental.reparse(tree, "prm a 1", 6, 1, "2")
+    assert result == RootNode.parse("prm a 2")
+    assert result.spans
+
+
+@pytest.mark.parametrize("offset, deleted", [(-1, 0), (0, -1), (5, 3)])
+def test_reparse_bad_edit(offset: int, deleted: int):
+    "Edit should be inside of the text"
+    tree = incremental.parse("prm a 1")
+    with pytest.raises(ValueError):
+        incremental.reparse(tree, "prm a 1", offset, deleted, "")
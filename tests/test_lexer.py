@@ -0,0 +1,118 @@
+"Test lexer"
+from pathlib import Path
+
+import pytest
+
+from pytopas import lexer, memo
+from pytopas.ast import RootNode
+from pytopas.lexer import Token, TokenKind, comment_spans, tokenize
+
+K = TokenKind
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", []),
+        ("a_1 prm", [(K.NAME, "a_1"), (K.KEYWORD, "prm")]),
+        (
+            "1.5`_0.1_LIMIT_MIN_-2_LIMIT_MAX_3 .5 7",
+            [
+                (K.NUMBER, "1.5`_0.1_LIMIT_MIN_-2_LIMIT_MAX_3"),
+                (K.NUMBER, ".5"),
+                (K.NUMBER, "7"),
+            ],
+        ),
+        (
+            "= a * -b ^ 2 >= c;",
+            [
+                (K.OPERATOR, "="),
+                (K.NAME, "a"),
+                (K.OPERATOR, "*"),
+                (K.OPERATOR, "-"),
+                (K.NAME, "b"),
+                (K.OPERATOR, "^"),
+                (K.NUMBER, "2"),
+                (K.OPERATOR, ">="),
+                (K.NAME, "c"),
+                (K.PUNCT, ";"),
+            ],
+        ),
+        (
+            "a' comment\n/* block\n */ \"str ' ing\" $",
+            [
+                (K.NAME, "a"),
+                (K.COMMENT, "' comment"),
+                (K.LINE_BREAK, "\n"),
+                (K.COMMENT, "/* block\n */"),
+                (K.STRING, '"str \' ing"'),
+                (K.TEXT, "$"),
+            ],
+        ),
+        (
+            "f(@, !x){}",
+            [
+                (K.NAME, "f"),
+                (K.PUNCT, "("),
+                (K.PUNCT, "@"),
+                (K.PUNCT, ","),
+                (K.PUNCT, "!"),
+                (K.NAME, "x"),
+                (K.PUNCT, ")"),
+                (K.PUNCT, "{"),
+                (K.PUNCT, "}"),
+            ],
+        ),
+    ],
+)
+def test_tokenize(text, expected):
+    "Test tokenize"
+    tokens = tokenize(text)
+    assert len(tokens) == len(expected)
+    assert [(x.kind, x.value) for x in tokens] == expected
+    for idx, tok in enumerate(tokens):
+        assert tokens.value(idx) == tok.value == text[tok.start : tok.end]
+
+
+def test_tokenize_examples():
+    "Tokens of examples are ordered and only whitespace is dropped"
+    for path in sorted((Path(__file__).parent.parent / "examples").iterdir()):
+        text = path.read_text()
+        pos = 0
+        for tok in tokenize(text):
+            assert tok.start >= pos
+            assert text[pos : tok.start].strip(" \t\r\f\v") == ""
+            pos = tok.end
+        assert text[pos:].strip(" \t\r\f\v") == ""
+
+
+def test_token():
+    "Test token tuple"
+    assert tokenize("a")[0] == Token(K.NAME, 0, 1, "a")
+
+
+def test_comment_spans():
+    "Test comment_spans"
+    text = "a 'b\n/* c 'd */ /* e"
+    assert comment_spans(text) == {2: 4, 5: 15, 10: 20}
+    assert comment_spans("'") == {0: 1}
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_comment_cache(enabled: bool):
+    "Test comment spans are scanned once per source and released after the parse"
+    text = "prm a 1 ' b\n"
+    if enabled:
+        memo.enable_memoization()
+    spans = lexer.cached_comment_spans(text)
+    assert lexer.cached_comment_spans(text) is spans
+    assert spans == {8: 11}
+    with memo.parsing():
+        assert lexer.cached_comment_spans(text) is spans
+        with memo.parsing():
+            RootNode.parse(text)
+        assert lexer.cached_comment_spans(text) is spans
+    # pylint: disable-next=protected-access
+    assert lexer._comments[0] is None
+    RootNode.parse(text)
+    assert lexer._comments[0] is None  # pylint: disable=protected-access
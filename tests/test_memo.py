@@ -0,0 +1,144 @@
+"Test memoized parsing"
+import subprocess
+import sys
+import threading
+
+import pyparsing as pp
+import pytest
+
+from pytopas import ast, memo
+from pytopas.parser import Parser
+
+SCRIPT = """
+import pyparsing as pp
+from pytopas import memo
+from pytopas.parser import Parser
+Parser.parse("prm a 1")
+print(memo.get_cache_size_limit(), pp.ParserElement._parse is memo._parse_memo)
+"""
+
+
+@pytest.fixture
+def memo_on():
+    "Temporary enable memoization, `memo_restored` disables it again"
+    memo.enable_memoization()
+
+
+@pytest.fixture
+def small_memo():
+    "Temporary enable memoization with a tiny cache"
+    memo.enable_memoization(cache_size_limit=2)
+
+
+def test_memo_off_by_default():
+    "Importing the grammar and parsing doesn't turn memoization on"
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT], capture_output=True, check=True, text=True
+    ).stdout
+    assert out.split() == ["None", "False"]
+
+
+def test_memo_same_result(memo_on):
+    "Results are the same with and without memoization"
+    src = "prm a 1 min 0\nlocal b = a * (2 + c) ^ 3;\nexisting_prm a += Sqrt(b);\n"
+    expected = Parser.parse(src)
+    memo.disable_memoization()
+    assert Parser.parse(src) == expected
+
+
+def test_memo_switch(memo_on):
+    "Test enable/disable"
+    assert memo.is_memoization_enabled()
+    assert memo.get_cache_size_limit() == memo.DEFAULT_CACHE_SIZE
+    memo.enable_memoization(10)
+    assert memo.get_cache_size_limit() == 10
+    memo.set_cache_size_limit(None)
+    assert not memo.is_memoization_enabled()
+    memo.set_cache_size_limit(20)
+    assert memo.get_cache_size_limit() == 20
+
+
+def test_memo_bad_args(monkeypatch):
+    "Test invalid configurations"
+    with pytest.raises(ValueError):
+        memo.enable_memoization(0)
+    monkeypatch.setattr(pp.ParserElement, "_packratEnabled", True)
+    with pytest.raises(RuntimeError):
+        memo.enable_memoization()
+    assert not memo.is_memoization_enabled()
+
+
+def test_memo_cache_bounded(small_memo):
+    "Cache never grows over the limit"
+    with memo.parsing():
+        cache = memo.get_cache()
+        assert isinstance(cache, memo.MemoCache)
+        cache.set(("a",), 1)
+        cache.set(("b",), 2)
+        cache.set(("c",), 3)
+        assert len(cache) == 2
+        assert cache.get(("a",)) is cache.not_in_cache
+        assert cache.get(("c",)) == 3
+        cache.clear()
+        assert not len(cache)
+    assert isinstance(ast.RootNode.parse("a + b * c"), ast.RootNode)
+
+
+def test_memo_left_recursion(memo_on):
+    "Left recursive rules are still parsed to the longest match"
+    expr = pp.Forward()
+    num = pp.Word(pp.nums)
+    expr <<= pp.Group(expr + "+" + num) | num
+    with memo.parsing():
+        result = expr.parse_string("1+2+3", parse_all=True)
+        cache = memo.get_cache()
+        assert cache is not None and cache.recursions > 0
+        # failures are cached too
+        with pytest.raises(pp.ParseException):
+            expr.parse_string("+", parse_all=True)
+        with pytest.raises(pp.ParseException):
+            expr.parse_string("+", parse_all=True)
+    assert result.as_list() == [[["1", "+", "2"], "+", "3"]]
+
+
+def test_memo_parsing_context(memo_on):
+    "`_parse` is replaced during parsing only and the cache is freed afterwards"
+    # pylint: disable=protected-access
+    orig = pp.ParserElement._parse
+    assert memo.get_cache() is None
+    with memo.parsing():
+        cache = memo.get_cache()
+        assert pp.ParserElement._parse is memo._parse_memo
+        with memo.parsing():
+            assert memo.get_cache() is cache
+        assert pp.ParserElement._parse is memo._parse_memo
+    assert memo.get_cache() is None
+    assert pp.ParserElement._parse is orig
+
+
+def test_memo_parsing_context_disabled():
+    "Parsing context does nothing without memoization"
+    with memo.parsing():
+        assert memo.get_cache() is None
+
+
+def test_memo_threads(memo_on):
+    "Threads without a parsing context don't use the cache of another one"
+    src = "prm a = b * (c + 1);"
+    expected = Parser.parse(src)
+    entered, done = threading.Event(), threading.Event()
+    results = []
+
+    def other():
+        entered.wait()
+        assert memo.get_cache() is None
+        results.append(ast.RootNode.get_parser().parse_string(src)[0].serialize())
+        done.set()
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    with memo.parsing():
+        entered.set()
+        done.wait()
+    thread.join()
+    assert results == [expected]
@@ -0,0 +1,217 @@
+"Test numbers modes"
+
+import json
+import sys
+import threading
+from decimal import Decimal
+
+import pytest
+
+from pytopas import ast, numeric, parallel
+from pytopas.cli import _topas2json_parse_args, topas2json
+from pytopas.exc import ReconstructException
+from pytopas.parser import Parser
+
+
+def test_number():
+    "Test lexeme number"
+    num = numeric.Number("+1.50")
+    assert str(num) == "+1.50"
+    assert repr(num) == "Number('+1.50')"
+    assert num._float is None  # pylint: disable=protected-access
+    assert float(num) == 1.5
+    assert num._float == 1.5  # pylint: disable=protected-access
+    assert num.to_decimal() == Decimal("1.50")
+    assert num == numeric.Number("+1.50")
+    assert num != numeric.Number("1.5")
+    assert num != Decimal("1.5")
+    assert hash(num) == hash(numeric.Number("+1.50"))
+    assert bool(num)
+    assert not numeric.Number("-0.0")
+
+
+def test_mode():
+    "Test numbers mode switch"
+    assert numeric.get_mode() == numeric.DECIMAL
+    with numeric.mode(numeric.LEXEME):
+        assert numeric.get_mode() == numeric.LEXEME
+        assert numeric.make("1.0") == numeric.Number("1.0")
+        assert numeric.make(2) == numeric.Number("2")
+        assert numeric.make_integer("-0") == numeric.Number("-0")
+    assert numeric.get_mode() == numeric.DECIMAL
+    assert numeric.make("1.0") == Decimal("1.0")
+    assert str(numeric.make_integer("-0")) == "0"
+    with pytest.raises(ValueError):
+        numeric.set_mode("float")
+    with pytest.raises(ValueError):
+        with numeric.mode("float"):
+            pass  # pragma: no cover
+    assert numeric.get_mode() == numeric.DECIMAL
+
+
+def test_mode_threads():
+    "Test every thread has its own mode"
+    modes = []
+
+    def other():
+        modes.append(numeric.get_mode())
+        numeric.set_mode(numeric.LEXEME)
+        modes.append(numeric.get_mode())
+
+    with numeric.mode(numeric.LEXEME):
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+    thread = threading.Thread(target=other)
+    thread.start()
+    thread.join()
+    assert modes == [numeric.DECIMAL, numeric.LEXEME] * 2
+    assert numeric.get_mode() == numeric.DECIMAL
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "+1",
+        "-0",
+        "007",
+        ".5",
+        "1.50`_0.010",
+        "1_2_LIMIT_MIN_+0.0_LIMIT_MAX_10.",
+    ],
+)
+def test_parameter_value_lexemes(src: str):
+    "Test parameter value keeps lexemes"
+    with numeric.mode(numeric.LEXEME):
+        node = ast.ParameterValueNode.parse(src)
+        assert isinstance(node.value, numeric.Number)
+        assert node.unparse() == src
+        assert ast.ParameterValueNode.unserialize(node.serialize()) == node
+
+
+def test_xdd_lexemes():
+    "Test xdd inline data and range keep lexemes"
+    src = "xdd { _xy 1.0 +2 .30 } range 0.50"
+    with numeric.mode(numeric.LEXEME):
+        node = ast.XddNode.parse(src)
+        assert node.inline_data == numeric.NumberArray(["1.0", "+2", ".30"])
+        assert node.unparse() == src
+        assert node.serialize()[1] == {
+            "inline_data": ["1.0", "+2", ".30"],
+            "range": "0.50",
+        }
+        assert ast.XddNode.unserialize(node.serialize()) == node
+    assert ast.XddNode.parse(src).range == Decimal("0.5")
+
+
+def test_number_array():
+    "Test packed numbers"
+    arr = numeric.NumberArray(["1.0", "+2", ".30"])
+    assert len(arr) == 3
+    assert arr[1] == 2.0
+    assert list(arr[1:]) == [2.0, 0.3]
+    assert list(arr) == [1.0, 2.0, 0.3]
+    assert str(arr) == "1.0 +2 .30"
+    assert repr(arr) == "NumberArray('1.0 +2 .30')"
+    assert arr.lexemes() == ["1.0", "+2", ".30"]
+    assert arr.to_decimals() == [Decimal("1.0"), Decimal(2), Decimal("0.30")]
+    assert arr == numeric.NumberArray.from_text(" 1.0\n+2  .30 ")
+    assert arr != numeric.NumberArray(["1", "+2", ".30"])
+    assert arr != [1.0, 2.0, 0.3]
+    assert memoryview(arr.values).format == "d"
+    assert not numeric.NumberArray([])
+
+
+def test_xdd_decimal():
+    "Test xdd inline data text is the one of decimals in the decimal mode"
+    node = ast.XddNode.parse("xdd { 1.0 +2 007 -0 .30 -0.0 0.0000001 }")
+    assert node.serialize() == [
+        "xdd",
+        {"inline_data": ["1.0", "2", "7", "0", "0.30", "-0.0", "1E-7"]},
+    ]
+    assert node.unparse() == "xdd { 1.0 2 7 0 0.30 -0.0 1E-7 }"
+    assert list(node.inline_data) == [1.0, 2.0, 7.0, 0.0, 0.3, -0.0, 1e-7]
+    assert ast.XddNode.unserialize(node.serialize()) == node
+    assert ast.XddNode.unserialize(["xdd", {"inline_data": [1, "+2.0"]}]) == (
+        ast.XddNode.parse("xdd { 1 2.0 }")
+    )
+
+
+def test_xdd_long():
+    "Test long xdd inline data is serialized as a list"
+    data = [f"{x / 10}" for x in range(2000)]
+    node = ast.XddNode.parse(f"xdd {{ {' '.join(data)} }}")
+    assert len(node.inline_data) == len(data)
+    assert node.serialize() == ["xdd", {"inline_data": data}]
+    assert ast.XddNode.unserialize(node.serialize()) == node
+
+
+def test_xdd_packed(monkeypatch):
+    "Test xdd inline data is serialized as base64 of its values on request"
+    node = ast.XddNode.parse("xdd { _xy 1.0 007 .30 -0.0 }")
+    with numeric.packed_arrays():
+        assert numeric.get_packed_arrays()
+        serialized = node.serialize()
+    assert not numeric.get_packed_arrays()
+    assert serialized == [
+        "xdd",
+        {"inline_data_packed": "AAAAAAAA8D8AAAAAAAAcQDMzMzMzM9M/AAAAAAAAAIA="},
+        ["_xy"],
+    ]
+    assert node.serialize()[1] == {"inline_data": ["1.0", "7", "0.30", "-0.0"]}
+    # values are kept, the text isn't
+    unpacked = ast.XddNode.unserialize(serialized)
+    assert list(unpacked.inline_data) == list(node.inline_data)
+    assert unpacked.unparse() == "xdd { _xy 1.0 7.0 0.3 -0.0 }"
+    with numeric.mode(numeric.LEXEME):
+        assert str(ast.XddNode.unserialize(serialized).inline_data) == (
+            "1.0 7.0 0.3 -0.0"
+        )
+    monkeypatch.setattr(sys, "byteorder", "big")
+    swapped = numeric.NumberArray(["1.0"]).pack()
+    assert swapped == "P/AAAAAAAAA="
+    assert numeric.NumberArray.unpack(swapped) == numeric.NumberArray(["1.0"])
+    for data in ["abc", "AAAA", "!!!!"]:
+        with pytest.raises(ReconstructException):
+            ast.XddNode.unserialize(["xdd", {"inline_data_packed": data}])
+
+
+def test_parser_number_mode():
+    "Test parser numbers option"
+    src = "prm a +1.50 xdd { 1 2 }"
+    assert Parser.parse(src, number_mode=numeric.LEXEME) == [
+        "topas",
+        ["prm", {"n": ["parameter_name", "a"], "v": ["parameter_value", "+1.50"]}],
+        ["xdd", {"inline_data": ["1", "2"]}],
+    ]
+    assert Parser.parse(src)[1][1]["v"] == ["parameter_value", "1.50"]
+    assert numeric.get_mode() == numeric.DECIMAL
+
+
+def test_parallel_number_mode():
+    "Test chunks are parsed in the numbers mode of the caller"
+    src = "prm a +1.50\n" * 30
+    with numeric.mode(numeric.LEXEME):
+        tree = parallel.parse(src, processes=1, chunk_size=64)
+    assert tree.unparse() == ast.RootNode.parse(src).unparse().replace("1.50", "+1.50")
+    assert isinstance(tree.statements[0].prm_value.value, numeric.Number)
+
+
+def test_cli_numbers():
+    "Test topas2json numbers option"
+    args = _topas2json_parse_args(["--numbers", "lexeme", "-"])
+    assert args.numbers == numeric.LEXEME
+    assert _topas2json_parse_args(["-"]).numbers == numeric.DECIMAL
+
+
+def test_cli_packed_xdd(capsys, monkeypatch, tmp_path):
+    "Test topas2json packed xdd option, the cache keeps both forms"
+    monkeypatch.setenv("PYTOPAS_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "a.inp"
+    path.write_text("xdd { 1 2 }")
+    assert not _topas2json_parse_args([str(path)]).packed_xdd
+    for args in [["--packed-xdd"], [], ["--packed-xdd", "--batch"]]:
+        topas2json(_topas2json_parse_args([*args, str(path)]))
+        out = json.loads(capsys.readouterr().out)
+        xdd = out["tree"][1] if "--batch" in args else out[1]
+        assert list(xdd[1]) == ["inline_data_packed" if args else "inline_data"]
@@ -0,0 +1,94 @@
+"Test source offsets of nodes"
+import warnings
+from pathlib import Path
+
+import pytest
+
+from pytopas import ast
+from pytopas import grammar as g
+from pytopas import offsets
+
+EXAMPLES = sorted((Path(__file__).parent.parent / "examples").iterdir())
+
+
+@pytest.mark.parametrize(
+    "src, node_cls, expected",
+    [
+        ("prm a 1", ast.PrmNode, "prm a 1"),
+        ("  prm /* c */ a 1 min 0 ' c\n", ast.PrmNode, "prm /* c */ a 1 min 0"),
+        ("a = b + c * 2; ' c", ast.ParameterEquationNode, "= b + c * 2;"),
+        ("a = b + c * 2;", ast.FormulaMul, "c * 2"),
+        ("a = (b + c) * 2;", ast.FormulaAdd, "b + c"),
+        ("a = -(b + c);", ast.FormulaUnaryMinus, "-(b + c)"),
+        ("f(x, y) + 1", ast.FunctionCallNode, "f(x, y)"),
+        ("macro m(x) { prm a 1 }\nb", ast.MacroNode, "macro m(x) { prm a 1 }"),
+        ("prm a 1\n$ % &\nb", ast.TextNode, "$ % &"),
+        ("prm a 1\n$ /* c */ % &", ast.TextNode, "$ /* c */ % &"),
+        ("a /*y*/ b c", ast.FormulaNode, "a /*y*/ b c"),
+        ("prm a 1\n", ast.LineBreakNode, "\n"),
+        ("prm a 1\n", ast.RootNode, "prm a 1\n"),
+    ],
+)
+def test_offsets(src: str, node_cls: type, expected: str):
+    "Offsets of the first node of the class"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tree, table = offsets.parse(src)
+    node = next(x for x in offsets._walk(tree) if type(x) is node_cls)
+    start, end = table[node]
+    assert src[start:end] == expected
+
+
+@pytest.mark.parametrize("file_path", EXAMPLES, ids=[x.name for x in EXAMPLES])
+def test_offsets_examples(file_path: Path):
+    "Every node has offsets inside of its parent offsets"
+    text = file_path.read_text().expandtabs()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tree, table = offsets.parse(text)
+        assert tree == ast.RootNode.parse(text)
+    nodes = list(offsets._walk(tree))
+    assert len(table) == len(nodes)
+    for node in nodes:
+        start, end = table[node]
+        assert 0 <= start <= end <= len(text)
+        for child in offsets._children(node):
+            child_start, child_end = table[child]
+            assert start <= child_start <= child_end <= end
+
+
+def test_offsets_node_cls():
+    "Any node parser can record offsets"
+    tree, table = offsets.parse(" a + f(b)", ast.FormulaNode)
+    assert table[tree] == (1, 9)
+    assert table[tree.value.operands[1]] == (5, 9)
+
+
+def test_offsets_table():
+    "Table is looked up by node identity"
+    tree, table = offsets.parse("prm a 1\nprm a 1")
+    first, second = tree.statements
+    assert first == second
+    assert first in table and second in table
+    assert table[first] == (0, 7)
+    assert table.get(second) == (8, 15)
+    assert table.get(ast.PrmNode.parse("prm a 1")) is None
+    assert list(table.starts) == [4, 6, 0, 12, 14, 8, 0]
+    with pytest.raises(KeyError):
+        table[tree.statements]  # pylint: disable=pointless-statement
+    assert not table.compact(None)
+
+
+def test_recording():
+    "Recording is switched off after the parse"
+    actions = list(g.prm.parseAction)
+    with offsets.recording() as table:
+        with pytest.raises(RuntimeError):
+            with offsets.recording():
+                pass  # pragma: no cover
+        ast.RootNode.parse("prm a 1")
+    assert len(table) == 5
+    assert g.prm.parseAction == actions
+    assert not g.formula_engine.node_actions
+    ast.RootNode.parse("prm b 2")
+    assert len(table) == 5
@@ -0,0 +1,160 @@
+"Test formula optimization"
+from pathlib import Path
+
+import pytest
+
+from pytopas import evaluator, optimize, symbols
+from pytopas.ast import (
+    BaseNode,
+    FormulaConstant,
+    FormulaNode,
+    FormulaSub,
+    ParameterNameNode,
+    ParameterNode,
+    RootNode,
+)
+from pytopas.dependencies import DependencyGraph
+from pytopas.exc import ReconstructException
+
+SRC = """prm a = 1/4;
+prm b = 0;
+prm c = (1 + 2.0) * a + Sqrt(2) * Pi;
+prm d = a * 2 + (1 + 2.0) * b;
+prm e = If(1 < 2, 3, a) / 0 + (a * 2 + (1 + 2.0) * b);
+prm f = Max(1, 2, "x") + Foo(1) + Max() + 1.0 + 1 + -1 ^ 0.5;
+existing_prm f += a * 2;"""
+VALUES = {"a": 0.25, "b": 0.0, "c": 1.0, "d": 2.0, "e": 3.0, "f": 4.0}
+
+
+def formula(tree: RootNode, idx: int):
+    "Formula value of the statement"
+    statement = tree.statements[idx]
+    if statement.type == "existing_prm":
+        return statement.modificator.value
+    return statement.prm_value.formula.value
+
+
+def test_source():
+    "Test source and JSON stay the same"
+    tree = RootNode.parse(SRC)
+    src, serialized = tree.unparse(), tree.serialize()
+    assert optimize.optimize(tree) is tree
+    assert tree.unparse() == src
+    assert tree.serialize() == serialized
+    optimize.optimize(tree)
+    assert tree.unparse() == src
+
+
+def test_fold():
+    "Test constant subexpressions are folded"
+    tree = optimize.optimize(RootNode.parse(SRC))
+    assert formula(tree, 0) == FormulaConstant(0.25, formula(tree, 0).source)
+    assert formula(tree, 1).value == 0
+    product, root = formula(tree, 2).operands
+    assert product.operands[0].value == 3
+    assert root.value == pytest.approx(2**0.5 * 3.141592653589793)
+    # `1 < 2` and `If(1 < 2, 3, a)`, division by zero is kept
+    call = formula(tree, 4).operands[0].operands[0]
+    assert call.args[0].value.value == 1
+    assert call.args[2].value.type == "p"
+    # string arguments, unknown functions, no arguments, complex numbers
+    assert [x.type for x in formula(tree, 5).operands] == [
+        "func_call",
+        "func_call",
+        "func_call",
+        "constant",
+        "constant",
+        "^",
+    ]
+    assert formula(tree, 5).operands[-1].operands[0].value == -1
+
+
+def test_fold_mixed():
+    "Test `*` and `/`, `-` and `+` are folded left to right"
+    tree = optimize.optimize(RootNode.parse("prm a = 1/4*2;\nprm b = 1 - 2 + 3;"))
+    assert formula(tree, 0).value == 0.5
+    assert formula(tree, 1).value == 2
+
+
+def test_share():
+    "Test equal subexpressions are the same objects, `1` and `1.0` aren't"
+    optimizer = optimize.Optimizer()
+    tree = optimizer.optimize(RootNode.parse(SRC))
+    assert formula(tree, 3) is formula(tree, 4).operands[1]
+    assert formula(tree, 3).operands[0] is formula(tree, 6)
+    one, one_float = formula(tree, 5).operands[4], formula(tree, 5).operands[3]
+    assert one.value == one_float.value and one is not one_float
+    size = len(optimizer)
+    optimizer.optimize(RootNode.parse(SRC))
+    assert len(optimizer) == size
+
+
+def test_evaluate():
+    "Test optimized formulas have the same values"
+    tree, optimized = RootNode.parse(SRC), optimize.optimize(RootNode.parse(SRC))
+    for idx in (0, 1, 2, 3, 6):
+        expected = evaluator.evaluate(formula(tree, idx), VALUES)
+        assert evaluator.evaluate(formula(optimized, idx), VALUES) == expected
+        compiled = evaluator.compile_formula(formula(optimized, idx))
+        assert compiled(VALUES) == pytest.approx(expected)
+    compiled = evaluator.compile_formula(formula(optimized, 2))
+    assert compiled.source == "((3.0 * _0) + 4.442882938158366)"
+
+
+def test_symbols():
+    "Test shared nodes are indexed at every place"
+    tree = RootNode.parse(SRC)
+    index = symbols.SymbolIndex(tree)
+    references = [x.statement for x in index.references("a")]
+    optimize.optimize(tree)
+    optimized = symbols.SymbolIndex(tree)
+    assert [x.statement for x in optimized.references("a")] == references
+    assert len(optimized) == len(index)
+    for statement in tree.statements:
+        optimized.remove(statement)
+    assert not len(optimized)
+    graph = DependencyGraph(tree)
+    assert [x.name for x in graph.order()] == ["a", "b", "c", "d", "e", "f", "f"]
+
+
+def test_deep():
+    "Test formulas deeper than the recursion limit"
+    value = ParameterNode(prm_name=ParameterNameNode("x"))
+    for idx in range(10_000):
+        operand = ParameterNode(prm_name=ParameterNameNode("ab"[idx % 2]))
+        value = FormulaSub(operands=[operand, value])
+    node = FormulaNode(value=value)
+    optimizer = optimize.Optimizer()
+    optimized = optimizer.formula(node)
+    assert optimized is not node
+    assert len(optimizer) < 10_010
+    values = {"a": 1, "b": 2, "x": 3}
+    assert evaluator.evaluate(optimized, values) == evaluator.evaluate(node, values)
+
+
+def test_example():
+    "Test an example round trips"
+    file_path = Path(__file__).parent.parent / "examples" / "diffpy_example.INP"
+    tree = RootNode.parse(file_path.read_text())
+    src, serialized = tree.unparse(), tree.serialize()
+    optimize.optimize(tree)
+    assert tree.unparse() == src
+    assert tree.serialize() == serialized
+
+
+def test_not_parsed():
+    "Test constants aren't parsed nodes and aren't unserialized"
+    assert not isinstance(FormulaConstant(1.0, FormulaNode.parse("1")), BaseNode)
+    assert not hasattr(FormulaConstant, "parse")
+    with pytest.raises(ReconstructException):
+        FormulaNode.unserialize(["formula", ["constant", 1.0]])
+
+
+def test_refined_kept():
+    "Test refined, fixed and limited values aren't folded"
+    src = "prm a = @ 0.25 + !b 2 + 0.5_0.1 + 2 min 1 + 0.25`;\nsite Zr x @ 0.25"
+    tree = RootNode.parse(src)
+    expected = repr(tree)
+    assert repr(optimize.optimize(tree)) == expected
+    tree = optimize.optimize(RootNode.parse("prm a = @ 0.25 + 1/4;"))
+    assert [x.type for x in formula(tree, 0).operands] == ["p", "constant"]
@@ -0,0 +1,103 @@
+"Test multi-process parsing"
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from pytopas import diagnostics, parallel, stats
+from pytopas.ast import RootNode
+from pytopas.exc import ParseWarning
+from pytopas.parser import Parser
+
+EXAMPLES = sorted((Path(__file__).parent.parent / "examples").iterdir())
+
+
+@pytest.mark.parametrize(
+    "src, chunk_size, expected",
+    [
+        ("prm a 1\nprm b 2\nprm c 3", 1, [7, 15]),
+        ("prm a 1\nprm b 2\nprm c 3", 10, [15]),
+        ("prm a 1 prm b 2", 1, []),
+        # an equation takes the whitespace after its `;`
+        ("a = 1; ' comment\n\n  local b 2", 1, [20]),
+        ("a /* \n */ prm b 1", 1, []),
+        ("macro m {\nprm a 1\n}\nprm b 2", 1, [19]),
+        ("xdd { 1\n2 }\nprm b 2", 1, [11]),
+        ("a }\nprm b 2", 1, [3]),
+        ("a\nb\nfoo", 1, []),
+        # bare name chains go on over line breaks
+        ("iters 1\nxdd a\nprm b 2", 1, []),
+        ("xdd a r_exp 1 range 1\nbkg 1", 1, []),
+        ("space_group Ia-3\nscale 1", 1, []),
+        ("prm !a 1 min -1\nprm b 2", 1, [15]),
+    ],
+)
+def test_split_points(src: str, chunk_size: int, expected: list):
+    "Cuts are at line breaks before top level statements"
+    assert parallel.split_points(src, chunk_size) == expected
+
+
+@pytest.mark.parametrize("file_path", EXAMPLES, ids=[x.name for x in EXAMPLES])
+def test_parallel_examples(file_path: Path):
+    "Chunked parse is the same as a single parse"
+    text = file_path.read_text()
+    with diagnostics.warn(), warnings.catch_warnings(record=True) as expected_warns:
+        warnings.simplefilter("always")
+        with stats.collect() as expected_stats:
+            expected = RootNode.parse(text)
+    with diagnostics.warn(), warnings.catch_warnings(record=True) as warns:
+        warnings.simplefilter("always")
+        with stats.collect() as parse_stats:
+            result = parallel.parse(text, processes=1, chunk_size=1)
+    assert result == expected
+    assert [str(x.message) for x in warns] == [str(x.message) for x in expected_warns]
+    assert parse_stats.starts == expected_stats.starts
+    assert parse_stats.ends == expected_stats.ends
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        # statement continues on the next line
+        "bkg @ 1 2\nscale 2\nprm a 1",
+        "bkg @ 1 2\nscale 2\nprm a = 1;\nprm b 1 c\nprm c 2",
+        "a\nprm b 1\nprm c 2",
+        "a = 1; ' comment\n\n  local b 2",
+        # text nodes around cuts are concatenated
+        "$ %\nprm a 1\n$ %\nscale 1 $\nprm b 2",
+        # trailing line breaks
+        "prm a 1\nprm b 2\n\n",
+        "prm a 1\n\tprm b 2",
+    ],
+)
+def test_parallel_cuts(src: str):
+    "Rejected cuts are moved or merged"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        assert parallel.parse(src, processes=1, chunk_size=1) == RootNode.parse(src)
+
+
+def test_parallel_syntax_error():
+    "Falls back to the single parse"
+    src = "prm a 1\nprm b (\nprm c 3"
+    with diagnostics.warn(), pytest.warns(ParseWarning):
+        result = parallel.parse(src, processes=1, chunk_size=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        assert result == RootNode.parse(src)
+
+
+def test_parallel_pool():
+    "Chunks are parsed by a process pool"
+    text = EXAMPLES[0].read_text() + "\n" + "\n".join(f"prm p{x} 1" for x in range(9))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        result = parallel.parse(text, chunk_size=100, executor=executor)
+    assert result == RootNode.parse(text)
+    assert parallel.parse(text, processes=2, chunk_size=100) == result
+
+
+def test_parser_processes():
+    "Parser delegates to chunked parse"
+    src = "prm a 1\nprm b 2"
+    assert Parser.parse(src, processes=2) == Parser.parse(src)
@@ -1,7 +1,14 @@
 "Test TOPAS parser"
+import io
+import json
+import warnings
+from pathlib import Path
 
+from pytopas.ast import RootNode, TextNode
 from pytopas.parser import Parser
 
+EXAMPLES = sorted((Path(__file__).parent.parent / "examples").iterdir())[:3]
+
 
 def test_parser():
     "Test Parser"
@@ -9,3 +16,46 @@ def test_parser():
     assert serialized == ["topas", ["formula", ["p", {"v": ["parameter_value", "1"]}]]]
     src = Parser.reconstruct(serialized)
     assert src == "1"
+
+
+def test_parser_parse_to():
+    "Test streaming JSON output is the same as dumps of the serialized tree"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sources = ["", "1", "prm a 1 xdd { 1 2 }\n!@#$"]
+        for src in [*sources, *(x.read_text() for x in EXAMPLES)]:
+            out = io.StringIO()
+            Parser.parse_to(out, src)
+            assert out.getvalue() == json.dumps(Parser.parse(src))
+
+
+def test_parser_parse_to_text(monkeypatch):
+    "Test streaming JSON of the fallback text node"
+    monkeypatch.setattr(RootNode, "parse", lambda text: TextNode(text))
+    out = io.StringIO()
+    Parser.parse_to(out, "a")
+    assert out.getvalue() == '["text", "a"]'
+
+
+def test_parser_reconstruct_to():
+    "Test streaming source output is the same as the reconstructed source"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for src in ["", "1", "a\n\nb !@#", *(x.read_text() for x in EXAMPLES)]:
+            data = Parser.parse(src)
+            out = io.StringIO()
+            Parser.reconstruct_to(out, data)
+            assert out.getvalue() == Parser.reconstruct(data)
+
+
+def test_text_runs():
+    "Test runs of unparsed text are merged into single text nodes"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tree = RootNode.parse("!@# $%^ &*(\n1\n!@# $%^")
+    assert [x.unparse() for x in tree.statements] == [
+        "!@# $%^ &*(",
+        "1",
+        "\n",
+        "!@# $%^",
+    ]
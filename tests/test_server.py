@@ -0,0 +1,180 @@
+"Test parse daemon and its client"
+import errno
+import io
+import json
+import os
+import socketserver
+import threading
+from pathlib import Path
+
+import pytest
+
+from pytopas import client, server
+from pytopas.cli import _pytopas_parse_args, pytopas
+from pytopas.exc import ReconstructException
+from pytopas.parser import Parser
+
+
+def request(method: str, **params) -> dict:
+    "JSON-RPC request"
+    return {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+
+
+def test_handle():
+    "Test requests"
+    assert server.handle(request("parse", text="prm a 1"))["result"] == Parser.parse(
+        "prm a 1"
+    )
+    tree = server.handle(request("parse", text="1.0", number_mode="lexeme"))["result"]
+    assert Parser.reconstruct(tree) == "1.0"
+    response = server.handle(request("reconstruct", data=Parser.parse("prm a 1")))
+    assert response == {"jsonrpc": "2.0", "id": 1, "result": "prm a 1"}
+    assert server.handle({"method": "ping"})["result"]
+
+
+@pytest.mark.parametrize(
+    "req, code",
+    [
+        ([], server.INVALID_REQUEST),
+        ({"id": 1}, server.INVALID_REQUEST),
+        (request("unparse"), server.METHOD_NOT_FOUND),
+        ({"method": "parse", "params": ["a"]}, server.INVALID_PARAMS),
+        (request("parse"), server.INVALID_PARAMS),
+        (request("parse", text="1", number_mode="float"), server.INVALID_PARAMS),
+        (request("parse", text="1", number_mode=1), server.INVALID_PARAMS),
+        (request("parse", text=5), server.INVALID_PARAMS),
+        (request("parse", text="1", mode="lexeme"), server.INVALID_PARAMS),
+        (request("reconstruct", data={"a": 1}), server.INVALID_PARAMS),
+        (request("ping", x=1), server.INVALID_PARAMS),
+        (request("reconstruct", data=["topas", ["?"]]), server.RECONSTRUCT_ERROR),
+    ],
+)
+def test_handle_errors(req, code: int):
+    "Test error responses"
+    assert server.handle(req)["error"]["code"] == code
+
+
+def test_handle_internal_error(monkeypatch):
+    "Test unexpected errors of a method are internal errors"
+
+    def fail(**_):
+        raise KeyError("x")
+
+    monkeypatch.setitem(server.METHODS, "ping", fail)
+    error = server.handle(request("ping"))["error"]
+    assert error["code"] == server.INTERNAL_ERROR
+    assert error["message"] == "Internal error: KeyError('x')"
+
+
+def test_serve_stdio(monkeypatch):
+    "Test JSON-RPC over streams"
+    lines = [json.dumps(request("parse", text="prm a 1")), "", "{"]
+    rfile = io.StringIO("\n".join(lines) + "\n")
+    wfile = io.StringIO()
+    monkeypatch.setattr("sys.stdin", rfile)
+    monkeypatch.setattr("sys.stdout", wfile)
+    pytopas(_pytopas_parse_args(["serve"]))
+    responses = [json.loads(x) for x in wfile.getvalue().splitlines()]
+    assert responses[0]["result"] == Parser.parse("prm a 1")
+    assert responses[1]["error"]["code"] == server.PARSE_ERROR
+
+
+def test_serve_socket(tmp_path: Path):
+    "Test daemon on a Unix socket"
+    socket_path = str(tmp_path / "pytopas.sock")
+    (tmp_path / "pytopas.sock").write_text("stale")
+    with server.make_server(socket_path) as daemon:
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            with client.Client(socket_path) as conn:
+                conn.connect()
+                conn._sock.sendall(b"\n")  # pylint: disable=protected-access
+                assert conn.call("parse", text="prm a 1") == Parser.parse("prm a 1")
+                assert conn.call("reconstruct", data=["topas", ["text", "a"]]) == "a"
+                with pytest.raises(ReconstructException):
+                    conn.call("reconstruct", data=["topas", ["?"]])
+                with pytest.raises(client.DaemonError) as err:
+                    conn.call("unparse")
+                assert err.value.code == server.METHOD_NOT_FOUND
+            assert client.parse("prm a 1", socket_path=socket_path) == Parser.parse(
+                "prm a 1"
+            )
+            assert client.reconstruct(["topas", ["text", "a"]], socket_path) == "a"
+        finally:
+            daemon.shutdown()
+            thread.join()
+
+
+def test_serve_closed(monkeypatch, tmp_path: Path):
+    "Test socket server stops on interrupt and removes the socket"
+    socket_path = tmp_path / "pytopas.sock"
+
+    def interrupt(self, *_):
+        assert socket_path.exists()
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(server.UnixServer, "serve_forever", interrupt)
+    server.serve(str(socket_path))
+    assert not socket_path.exists()
+
+
+def test_serve_live_socket(tmp_path: Path):
+    "Test a second daemon doesn't take over or remove a live socket"
+    socket_path = str(tmp_path / "pytopas.sock")
+    with server.make_server(socket_path) as daemon:
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            with pytest.raises(OSError) as err:
+                server.serve(socket_path)
+            assert err.value.errno == errno.EADDRINUSE
+            assert client.Client(socket_path).call("ping")
+        finally:
+            daemon.shutdown()
+            thread.join()
+        # another daemon replaced the socket file after this one stopped serving
+        os.unlink(socket_path)
+        with server.make_server(socket_path):
+            daemon.remove_socket()
+            assert os.path.exists(socket_path)
+    os.unlink(socket_path)
+    daemon.remove_socket()
+
+
+def test_client_fallback(monkeypatch, tmp_path: Path):
+    "Test sources are parsed in process without daemon"
+    socket_path = str(tmp_path / "missing.sock")
+    assert client.parse("prm a 1", socket_path=socket_path) == Parser.parse("prm a 1")
+    assert client.reconstruct(["topas", ["text", "a"]], socket_path) == "a"
+    monkeypatch.setenv("PYTOPAS_SOCKET", socket_path)
+    assert client.default_socket_path() == socket_path
+    monkeypatch.delenv("PYTOPAS_SOCKET")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert client.default_socket_path() == str(tmp_path / "pytopas.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert client.default_socket_path().endswith(".sock")
+
+
+class Silent(socketserver.StreamRequestHandler):
+    "Handler reading a request without an answer"
+
+    def handle(self):
+        self.rfile.readline()
+
+
+def test_client_closed(tmp_path: Path):
+    "Test daemon closing the connection"
+    socket_path = str(tmp_path / "pytopas.sock")
+    with server.make_server(socket_path) as daemon:
+        conn = client.Client(socket_path)
+        conn.connect()
+        conn.connect()
+        # the connection is closed without an answer
+        daemon.RequestHandlerClass = Silent
+        thread = threading.Thread(target=daemon.handle_request)
+        thread.start()
+        with pytest.raises(ConnectionError):
+            conn.call("ping")
+        thread.join()
+    conn.close()
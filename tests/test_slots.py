@@ -0,0 +1,56 @@
+"Test slotted node classes"
+import pickle
+
+import pytest
+
+from pytopas import ast
+
+NODE_CLASSES = [
+    x
+    for x in vars(ast).values()
+    if isinstance(x, type) and issubclass(x, ast.BaseNode)
+]
+
+
+@pytest.mark.parametrize("cls", NODE_CLASSES, ids=[x.__name__ for x in NODE_CLASSES])
+def test_no_instance_dict(cls: type):
+    "Nodes have no instance dictionary"
+    assert cls.__dictoffset__ == 0
+
+
+def test_slotted_dataclass():
+    "Subclasses keep `super()` and dependencies override"
+
+    @ast.slotted_dataclass
+    class MyText(ast.TextNode):
+        "Custom text"
+        comment: str = ""
+
+        @classmethod
+        def unserialize(cls, data):
+            return super().unserialize(data)
+
+        def unparse(self):
+            return f"{super().unparse()} ' {self.comment}"
+
+    @ast.slotted_dataclass
+    class MyRoot(ast.RootNode):
+        "Root with custom text"
+
+        @classmethod
+        def text_cls(cls):
+            return MyText
+
+    node = MyText(value="a", comment="b")
+    assert MyText.__slots__ == ("comment",)
+    assert node.unparse() == "a ' b"
+    assert MyText.unserialize(["text", "a"]) == MyText(value="a")
+    assert MyRoot.unserialize(["topas", ["text", "c"]]).statements == [MyText("c")]
+    with pytest.raises(AttributeError):
+        node.other = 1  # type: ignore[attr-defined]
+
+
+def test_pickle():
+    "Slotted nodes are pickled by value"
+    tree = ast.RootNode.parse("prm a 1\nb = a + 1;")
+    assert pickle.loads(pickle.dumps(tree)) == tree
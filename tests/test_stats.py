@@ -0,0 +1,66 @@
+"Test parse statistics"
+
+import warnings
+
+import pytest
+
+from pytopas import ast, diagnostics, memo, stats
+from pytopas.exc import ParseWarning
+from pytopas.parser import Parser
+
+
+def test_parse_stats():
+    "Test fallbacks accounting"
+    parse_stats = stats.ParseStats()
+    assert parse_stats.coverage(0) == 1.0
+    parse_stats.record(2, 5)
+    parse_stats.record(10, 11)
+    assert repr(parse_stats) == "ParseStats(fallbacks=2)"
+    assert parse_stats.fallbacks == 2
+    assert parse_stats.fallback_chars == 4
+    assert parse_stats.coverage(20) == 0.8
+    assert memoryview(parse_stats.starts).tolist() == [2, 10]
+
+
+def test_collect():
+    "Test fallback offsets are collected without warnings"
+    src = "prm a 1\n$% prm b 2 !@ #"
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ParseWarning)
+        with stats.collect() as outer:
+            with stats.collect() as parse_stats:
+                ast.RootNode.parse(src)
+    assert outer.fallbacks == 0
+    assert list(parse_stats.starts) == [8, 19, 22]
+    assert list(parse_stats.ends) == [10, 21, 23]
+
+
+def test_fallback_warnings():
+    "Test fallbacks are warned about when asked"
+    with diagnostics.warn(), pytest.warns(ParseWarning, match="TextNode: Can't parse"):
+        ast.RootNode.parse("$%")
+
+
+def test_parser_parse_with_stats():
+    "Test parser returns stats with the tree"
+    src = "prm a 1\n$%"
+    serialized, parse_stats = Parser.parse_with_stats(src, processes=2)
+    assert serialized == Parser.parse(src)
+    assert parse_stats.fallbacks == 1
+    assert parse_stats.coverage(len(src)) == pytest.approx(0.8)
+
+
+@pytest.mark.parametrize("memoized", [False, True])
+def test_backtracking(memoized: bool):
+    "Test text nodes of backtracked alternatives aren't accounted"
+    if memoized:
+        memo.enable_memoization()
+    src = "macro m { $a $b"
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ParseWarning)
+        with diagnostics.warn():
+            serialized, parse_stats = Parser.parse_with_stats(src)
+    assert serialized[-1] == ["text", "{ $a $b"]
+    assert list(parse_stats.starts) == [8, 10, 13]
+    assert list(parse_stats.ends) == [9, 12, 15]
+    assert len([x for x in caught if x.category is ParseWarning]) == 3
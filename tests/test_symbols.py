@@ -0,0 +1,134 @@
+"Test parameter symbol index"
+from pathlib import Path
+
+import pytest
+
+from pytopas import incremental, symbols
+from pytopas.ast import ExistingPrmNode, ParameterNameNode, PrmNode, RootNode
+
+SRC = """prm a 1
+prm !b = a * 2 + Sqrt(c);
+local d 3
+num_runs n
+existing_prm a += b;
+scale @ sc_1 0.001
+bkg @ 1 q 3
+site Zn x !x_w 0.25 y = d; : 0.1"""
+
+
+def kinds(index: symbols.SymbolIndex, name: str):
+    "Kinds of the sites of the name"
+    return [x.kind for kind in symbols.KINDS for x in index.sites(name, kind)]
+
+
+def snapshot(index: symbols.SymbolIndex):
+    "Names to sorted site kinds and node ids"
+    return {
+        name: sorted(
+            (x.kind, id(x.node))
+            for kind in symbols.KINDS
+            for x in index.sites(name, kind)
+        )
+        for name in index.names()
+    }
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("a", ["definition", "reference", "update"]),
+        ("b", ["definition", "reference"]),
+        ("c", ["reference"]),
+        ("d", ["definition", "reference"]),
+        ("sc_1", ["definition"]),
+        ("q", ["definition"]),
+        ("n", ["reference"]),
+        ("x_w", ["definition"]),
+        ("nothing", []),
+    ],
+)
+def test_sites(name, expected):
+    "Test site kinds"
+    index = symbols.SymbolIndex(RootNode.parse(SRC))
+    assert kinds(index, name) == expected
+    assert (name in index) is bool(expected)
+
+
+def test_site_nodes():
+    "Test sites point to nodes and their statements"
+    tree = RootNode.parse(SRC)
+    index = symbols.SymbolIndex(tree)
+    (definition,) = index.definitions("a")
+    assert definition.node is tree.statements[0]
+    assert isinstance(definition.node, PrmNode)
+    (update,) = index.updates("a")
+    assert isinstance(update.node, ExistingPrmNode)
+    assert update.statement in tree.statements
+    (reference,) = index.references("b")
+    assert reference.statement is update.statement
+    (num_runs,) = index.references("n")
+    assert isinstance(num_runs.node, ParameterNameNode)
+    assert len(index) == sum(len(kinds(index, x)) for x in index.names())
+
+
+def test_keywords():
+    "Test bare names outside formulas, like keywords, aren't sites"
+    index = symbols.SymbolIndex(RootNode.parse("site Zr x !x1 0.25 y =a; z 0"))
+    assert index.names() == ["x1", "y", "z", "a"]
+    assert kinds(index, "a") == ["reference"]
+    for name in ("site", "Zr", "x"):
+        assert name not in index
+    assert not symbols.SymbolIndex(RootNode.parse("a")).names()
+    index = symbols.SymbolIndex(RootNode.parse("b + Max(c)"))
+    assert index.names() == ["b", "c"]
+
+
+def test_text_tree():
+    "Test a tree of text only has no sites"
+    index = symbols.SymbolIndex(RootNode.parse("$%"))
+    assert index.names() == []
+    assert len(index) == 0
+    assert not symbols.SymbolIndex().names()
+
+
+def test_replace():
+    "Test replaced statements are re-indexed"
+    tree = RootNode.parse(SRC)
+    index = symbols.SymbolIndex(tree)
+    old = next(x for x in tree.statements if isinstance(x, ExistingPrmNode))
+    new = RootNode.parse("existing_prm b = c;").statements
+    index.replace([old], new)
+    index.remove(old)
+    index.add(new[0])
+    assert kinds(index, "a") == ["definition", "reference"]
+    assert kinds(index, "b") == ["definition", "update"]
+    assert kinds(index, "c") == ["reference", "reference"]
+
+
+@pytest.mark.parametrize(
+    "offset, deleted, inserted",
+    [
+        (0, 7, "prm z 1"),
+        (len(SRC), 0, "\nprm e = a + z;"),
+        (8, 26, ""),
+    ],
+)
+def test_update(offset, deleted, inserted):
+    "Test index of a re-parsed tree is the same as a new one"
+    tree = incremental.parse(SRC)
+    index = symbols.SymbolIndex(tree)
+    new_src = SRC[:offset] + inserted + SRC[offset + deleted :]
+    new_tree = incremental.reparse(tree, SRC, offset, deleted, inserted)
+    index.update(new_tree)
+    assert snapshot(index) == snapshot(symbols.SymbolIndex(new_tree))
+    assert snapshot(index).keys() == snapshot(
+        symbols.SymbolIndex(RootNode.parse(new_src))
+    ).keys()
+
+
+def test_example():
+    "Test refined parameters of an example"
+    file_path = Path(__file__).parent.parent / "examples" / "2002698.str"
+    index = symbols.SymbolIndex(RootNode.parse(file_path.read_text()))
+    assert kinds(index, "sc_2002698") == ["definition"]
+    assert kinds(index, "x_w_1_2002698") == ["definition"]
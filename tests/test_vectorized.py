@@ -0,0 +1,150 @@
+"Test vectorized formula evaluation"
+import math
+
+import pytest
+
+from pytopas import ast, evaluator
+from pytopas.dependencies import DependencyGraph
+from pytopas.exc import EvaluateException
+
+np = pytest.importorskip("numpy")
+vectorized = pytest.importorskip("pytopas.vectorized")
+
+SAMPLES = {
+    "a": np.array([2.0, 4.0, 0.5, 3.0]),
+    "b": np.array([3.0, 3.0, 0.5, 1.0]),
+    "c": np.array([5.0, 1.0, 2.0, 3.0]),
+}
+SRC = """prm a 1
+prm c = b + 1;
+prm b = a * 2;
+existing_prm b += b * a;
+existing_prm a ^= 2;
+existing_prm c = c / 2;
+site Zn x = c; : 0.1"""
+
+
+def samples(idx: int):
+    "Scalar values of a sample"
+    return {name: float(value[idx]) for name, value in SAMPLES.items()}
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "a * 2 - b - c",
+        "-a + +b / c ^ 2",
+        "If(a < b, Sqrt(b - a), Ln(c)) * 3",
+        "a == b",
+        "a < b <= c",
+        "a / b * c - a + b",
+        "Max(a, b, c) + Min(a, c) + Mod(c, a)",
+        "Cos(a * Deg) + Sin(b) + Tan(c) + Exp(a) + Abs(-c) + Rad + Pi",
+        "ArcSin(1 / (a + 1)) + ArcCos(1 / (b + 1)) + ArcTan(c)",
+    ],
+)
+def test_formula(src):
+    "Test every sample has the value of the scalar evaluator"
+    formula = ast.FormulaNode.parse(src, parse_all=True)
+    compiled = vectorized.compile_formula(formula)
+    result = compiled(SAMPLES)
+    assert result.shape == (4,)
+    for idx in range(4):
+        assert result[idx] == pytest.approx(evaluator.evaluate(formula, samples(idx)))
+
+
+def test_mixed_operators():
+    "Test `*` and `/`, `-` and `+` are applied left to right"
+    formula = ast.FormulaNode.parse("a / b * c - a + b", parse_all=True)
+    result = vectorized.compile_formula(formula)(SAMPLES)
+    expected = SAMPLES["a"] / SAMPLES["b"] * SAMPLES["c"] - SAMPLES["a"] + SAMPLES["b"]
+    assert result.tolist() == pytest.approx(expected.tolist())
+
+
+def test_masks():
+    "Test comparisons give masks and `If` takes either branch"
+    formula = ast.FormulaNode.parse("If(a > b, Sqrt(-1), a / 0)", parse_all=True)
+    compiled = vectorized.compile_formula(formula)
+    assert compiled.names == ("a", "b")
+    mask = vectorized.compile_formula(ast.FormulaNode.parse("a > b"))(SAMPLES)
+    assert mask.dtype == bool
+    assert mask.tolist() == [False, True, False, True]
+    result = compiled({"a": [1, -1, 2], "b": 0})
+    assert np.isnan(result[0]) and np.isnan(result[2])
+    assert result[1] == -math.inf
+
+
+def test_shared():
+    "Test equal formulas share the function"
+    first = vectorized.compile_formula(ast.FormulaNode.parse("x_1 * 2 + y_1"))
+    second = vectorized.compile_formula(ast.FormulaNode.parse("x_2 * 2 + y_2"))
+    assert first.function is second.function
+    assert second({"x_2": [1, 2], "y_2": 1}).tolist() == [3, 5]
+
+
+def test_deep():
+    "Test deep formulas are split to temporaries"
+    value: ast.FormulaValue = ast.ParameterNode(prm_name=ast.ParameterNameNode("x"))
+    for idx in range(1_000):
+        operand = ast.ParameterNode(prm_name=ast.ParameterNameNode("ab"[idx % 2]))
+        value = ast.FormulaSub(operands=[operand, value])
+    formula = ast.FormulaNode(value=value)
+    compiled = vectorized.compile_formula(formula)
+    assert "_t0 = " in compiled.source
+    for idx in range(4):
+        expected = evaluator.evaluate(formula, {"x": 1, **samples(idx)})
+        assert compiled({"x": 1, **SAMPLES})[idx] == expected
+
+
+def test_equations():
+    "Test a group of equations against the scalar evaluation"
+    graph = DependencyGraph(ast.RootNode.parse(SRC))
+    equations = graph.order()
+    compiled = vectorized.compile_equations(equations)
+    assert compiled.names == ("a",)
+    assert repr(compiled) == "VectorizedEquations(6, ('a',))"
+    results = compiled(SAMPLES)
+    assert len(results) == len(equations)
+    for idx in range(4):
+        values = samples(idx)
+        for equation, result in zip(equations, results):
+            value = evaluator.evaluate(equation.formula, values)
+            if equation.node.type == "existing_prm" and equation.node.op != "=":
+                value = evaluator.evaluate(
+                    ast.FormulaNode.parse(f"x {equation.node.op[0]} y"),
+                    {"x": values[equation.name], "y": value},
+                )
+            assert result[idx] == pytest.approx(value)
+            if equation.name is not None:
+                values[equation.name] = value
+    # a, b, b, c, c and the site equation
+    values = compiled.values(SAMPLES)
+    assert values["a"].tolist() == (SAMPLES["a"] ** 2).tolist()
+    assert values["b"].tolist() == results[2].tolist()
+    assert values["c"].tolist() == results[4].tolist()
+
+
+def test_affected():
+    "Test equations of changed values only, updated names are arguments"
+    graph = DependencyGraph(ast.RootNode.parse(SRC))
+    compiled = vectorized.compile_equations(graph.affected(["b"]))
+    assert compiled.names == ("b", "a")
+    results = compiled({"a": 2, "b": np.arange(3)})
+    assert [x.tolist() for x in results] == [
+        [0, 3, 6],
+        [1, 4, 7],
+        [0.5, 2, 3.5],
+        [0.5, 2, 3.5],
+    ]
+
+
+def test_errors():
+    "Test formulas which can't be evaluated"
+    formula = ast.FormulaNode.parse("Foo(a)")
+    with pytest.raises(EvaluateException, match="Unknown function 'Foo'"):
+        vectorized.compile_formula(formula)
+    graph = DependencyGraph(ast.RootNode.parse("prm a = Foo(b);"))
+    with pytest.raises(EvaluateException, match="Unknown function 'Foo'"):
+        vectorized.compile_equations(graph.order())
+    with pytest.raises(KeyError):
+        vectorized.compile_formula(ast.FormulaNode.parse("a + b"))({"a": 1})